@@ -0,0 +1,97 @@
+"""列表响应序列化基准（无需数据库）
+
+比较两种列表响应的生成方式：
+- 逐行校验：每行 ORM 对象 InvoiceResponse.model_validate，FastAPI 再按
+  response_model=List[InvoiceResponse] 校验并转为 JSON 兼容对象，最后由
+  JSONResponse 序列化（改造前的路径）；
+- 直接序列化：查询得到的 RowMapping 由 rows_response 经 orjson 一次序列化。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_responses [行数 ...]
+默认测 1000 和 10000 行，每种方式重复 5 次取中位数。
+"""
+import json
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy.engine.result import SimpleResultMetaData
+from sqlalchemy.engine.row import Row
+import database  # noqa: F401  注册全部模型
+from models.finance import Invoice
+from routers.finance import InvoiceResponse
+from utils.responses import response_columns, rows_response
+
+REPEAT = 5
+
+def _values(i: int) -> dict:
+    total = Decimal(1000 + i % 997) + Decimal("0.35")
+    paid = (total / 3).quantize(Decimal("0.01"))
+    return dict(
+        id=i,
+        number=f"INV{i:08d}",
+        invoice_type="销售发票",
+        customer_id=1 + i % 500,
+        supplier_id=None,
+        sales_order_id=1 + i // 3,
+        purchase_order_id=None,
+        invoice_date=date(2026, 1, 1) + timedelta(days=i % 365),
+        due_date=date(2026, 2, 1) + timedelta(days=i % 365),
+        currency="CNY",
+        subtotal=(total / Decimal("1.13")).quantize(Decimal("0.01")),
+        tax_amount=(total - total / Decimal("1.13")).quantize(Decimal("0.01")),
+        total_amount=total,
+        paid_amount=paid,
+        outstanding_amount=total - paid,
+        status="部分付款",
+        created_at=datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=i),
+    )
+
+def _mappings(values: List[dict]) -> list:
+    """构造与 select(*response_columns(...)) 查询结果相同的 RowMapping"""
+    keys = [column.key for column in response_columns(Invoice, InvoiceResponse)]
+    metadata = SimpleResultMetaData(keys)
+    return [
+        Row(metadata, None, metadata._key_to_index, tuple(v[k] for k in keys))._mapping
+        for v in values
+    ]
+
+def per_row_validation(objects: list) -> bytes:
+    items = [InvoiceResponse.model_validate(obj) for obj in objects]
+    adapter = TypeAdapter(List[InvoiceResponse])
+    validated = adapter.validate_python(items, from_attributes=True)
+    content = jsonable_encoder(adapter.dump_python(validated, mode="json"))
+    return JSONResponse(content).body
+
+def direct(rows: list) -> bytes:
+    return rows_response(rows).body
+
+def _measure(func, arg) -> float:
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func(arg)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def main(sizes: List[int]) -> None:
+    # 确认两种方式输出相同的数据
+    sample = [_values(i) for i in range(1, 4)]
+    assert json.loads(per_row_validation([Invoice(**v) for v in sample])) == json.loads(direct(_mappings(sample)))
+
+    print(f"{'行数':>8} {'逐行校验(ms)':>14} {'直接序列化(ms)':>16} {'加速比':>8}")
+    for size in sizes:
+        values = [_values(i) for i in range(1, size + 1)]
+        objects = [Invoice(**v) for v in values]
+        rows = _mappings(values)
+        slow = _measure(per_row_validation, objects)
+        fast = _measure(direct, rows)
+        print(f"{size:>8} {slow * 1000:>14.1f} {fast * 1000:>16.1f} {slow / fast:>7.1f}x")
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000])
@@ -0,0 +1,132 @@
+"""库存移动写入基准（需要 PostgreSQL 数据库）
+
+按不同批量大小比较每秒写入的记录数：
+- 单条接口：逐条 POST /api/warehouse/stock-movements（每条一次 INSERT 和提交）；
+- 批量接口：一次 POST /api/warehouse/stock-movements/bulk 提交全部记录；
+- 多行INSERT：直接调用 _insert_movements；
+- COPY：直接调用 _copy_movements。
+各方式都会过账库存余额（post_movements），与接口的实际开销一致。
+
+需要 settings.DATABASE_URL 指向已建表的数据库，且至少有一个产品和一个仓库。
+每次测量都在一个外层事务中进行，结束后整体回滚，不会留下数据；接口中的
+提交在外层事务内变为释放保存点，因此单条接口的结果偏乐观（实际每次提交
+还有一次刷盘）。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_stock_movements [批量大小 ...]
+默认测 100、1000、10000 条。
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime
+from typing import List
+import httpx
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db, get_engine
+from main import app
+from models.product import Product
+from models.user import User
+from models.warehouse import Warehouse
+from routers.warehouse import StockMovementCreate, _copy_movements, _insert_movements
+from services.inventory import INBOUND, post_movements
+from utils.auth import get_current_user
+
+BASE_URL = "http://benchmark"
+
+def _payload(size: int, product_id: int, warehouse_id: int) -> List[dict]:
+    return [
+        {
+            "product_id": product_id,
+            "warehouse_id": warehouse_id,
+            "movement_type": INBOUND,
+            "quantity": "1",
+            "unit_cost": "10.00",
+            "batch_number": f"BENCH{i % 50:04d}",
+            "reference_type": "基准测试",
+            "reference_id": i,
+        }
+        for i in range(size)
+    ]
+
+def _rows(payload: List[dict]) -> List[dict]:
+    now = datetime.now()
+    return [{**StockMovementCreate.model_validate(item).model_dump(), "movement_date": now} for item in payload]
+
+def _client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url=BASE_URL)
+
+async def single_endpoint(db: AsyncSession, payload: List[dict]) -> None:
+    async with _client() as client:
+        for item in payload:
+            response = await client.post("/api/warehouse/stock-movements", json=item)
+            assert response.status_code == 200, response.text
+
+async def bulk_endpoint(db: AsyncSession, payload: List[dict]) -> None:
+    async with _client() as client:
+        response = await client.post("/api/warehouse/stock-movements/bulk", json=payload)
+        assert response.status_code == 200 and response.json()["failed"] == 0, response.text
+
+async def multi_row_insert(db: AsyncSession, payload: List[dict]) -> None:
+    rows = _rows(payload)
+    await _insert_movements(db, rows)
+    await post_movements(db, rows)
+    await db.commit()
+
+async def copy(db: AsyncSession, payload: List[dict]) -> None:
+    rows = _rows(payload)
+    await _copy_movements(db, rows)
+    await post_movements(db, rows)
+    await db.commit()
+
+MODES = (
+    ("单条接口", single_endpoint),
+    ("批量接口", bulk_endpoint),
+    ("多行INSERT", multi_row_insert),
+    ("COPY", copy),
+)
+
+async def _measure(connection, func, payload: List[dict]) -> float:
+    """在外层事务中执行一次写入并回滚，返回耗时（秒）"""
+    transaction = await connection.begin()
+    session = AsyncSession(bind=connection, join_transaction_mode="create_savepoint", expire_on_commit=False)
+
+    async def override_db():
+        yield session
+
+    app.dependency_overrides[get_db] = override_db
+    try:
+        start = time.perf_counter()
+        await func(session, payload)
+        return time.perf_counter() - start
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        await session.close()
+        await transaction.rollback()
+
+async def main(sizes: List[int]) -> None:
+    app.dependency_overrides[get_current_user] = lambda: User(
+        id=0, username="benchmark", email="benchmark@localhost", is_active=True, is_superuser=True
+    )
+    engine = get_engine()
+    async with engine.connect() as connection:
+        product_id = await connection.scalar(select(Product.id).order_by(Product.id).limit(1))
+        warehouse_id = await connection.scalar(select(Warehouse.id).order_by(Warehouse.id).limit(1))
+        await connection.rollback()
+        if product_id is None or warehouse_id is None:
+            print("数据库中至少需要一个产品和一个仓库")
+            sys.exit(1)
+
+        print(f"{'条数':>8} " + " ".join(f"{name + '(条/秒)':>16}" for name, _ in MODES))
+        for size in sizes:
+            payload = _payload(size, product_id, warehouse_id)
+            rates = []
+            for _, func in MODES:
+                elapsed = await _measure(connection, func, payload)
+                rates.append(size / elapsed)
+            print(f"{size:>8} " + " ".join(f"{rate:>16,.0f}" for rate in rates))
+    await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main([int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000]))
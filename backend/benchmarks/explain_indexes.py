@@ -0,0 +1,131 @@
+"""查询索引执行计划对比（需要 PostgreSQL 数据库）
+
+对迁移 0002 所针对的典型查询（列表筛选、单据明细、应收账款、库存查询等）
+分别在有索引和删除索引后执行 EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)，
+输出执行时间和扫描方式，用于核对索引的选择。
+
+索引的删除在一个事务中进行，结束后回滚恢复；DROP INDEX 期间相关表被
+排他锁定，请在测试库而不是生产库上运行。库中需要有一定数据量，计划才有
+参考意义（小表上 PostgreSQL 总会选择顺序扫描）。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.explain_indexes [--plans]
+--plans 同时打印完整的执行计划。
+"""
+import asyncio
+import importlib.util
+import json
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, List, Tuple
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql
+from database import get_engine
+from models.finance import AccountReceivable, Invoice, Payment
+from models.production import WorkOrder
+from models.sales import SalesOrder, SalesOrderLine
+from models.warehouse import Inventory, StockMovement
+from services.aging import aging_query
+
+MIGRATION = Path(__file__).resolve().parent.parent / "migrations" / "versions" / "0002_add_query_indexes.py"
+
+def _migration_indexes() -> List[str]:
+    spec = importlib.util.spec_from_file_location("migration_0002", MIGRATION)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return [name for name, _, _ in module.INDEXES]
+
+async def _sample(connection, column, default: Any) -> Any:
+    """取表中的一个实际值作为查询参数，空表时使用默认值"""
+    value = await connection.scalar(select(column).where(column.is_not(None)).limit(1))
+    return default if value is None else value
+
+async def _queries(connection) -> List[Tuple[str, Any]]:
+    today = date.today()
+    month_ago = today - timedelta(days=30)
+    customer_id = await _sample(connection, SalesOrder.customer_id, 1)
+    order_id = await _sample(connection, SalesOrderLine.order_id, 1)
+    invoice_id = await _sample(connection, Payment.invoice_id, 1)
+    product_id = await _sample(connection, StockMovement.product_id, 1)
+    warehouse_id = await _sample(connection, Inventory.warehouse_id, 1)
+    return [
+        ("销售订单 按状态+日期筛选", select(SalesOrder).where(
+            SalesOrder.status == "已确认", SalesOrder.order_date.between(month_ago, today)
+        ).order_by(SalesOrder.id).limit(100)),
+        ("销售订单 按客户+日期筛选", select(SalesOrder).where(
+            SalesOrder.customer_id == customer_id, SalesOrder.order_date >= month_ago
+        ).order_by(SalesOrder.id).limit(100)),
+        ("销售订单明细 按订单", select(SalesOrderLine).where(SalesOrderLine.order_id == order_id)),
+        ("发票 按状态+到期日筛选", select(Invoice).where(
+            Invoice.status == "未付", Invoice.due_date < today
+        ).order_by(Invoice.id).limit(100)),
+        ("发票 按客户+日期筛选", select(Invoice).where(
+            Invoice.customer_id == customer_id, Invoice.invoice_date.between(month_ago, today)
+        ).order_by(Invoice.id).limit(100)),
+        ("收付款 按发票", select(Payment).where(Payment.invoice_id == invoice_id)),
+        ("应收账款 按客户未结", select(AccountReceivable).where(
+            AccountReceivable.customer_id == customer_id, AccountReceivable.status.not_in(("已收", "已核销"))
+        )),
+        ("应收账龄 汇总", aging_query("receivable", today)),
+        ("库存余额 按产品+仓库", select(Inventory).where(
+            Inventory.product_id == product_id, Inventory.warehouse_id == warehouse_id
+        )),
+        ("库存余额 按仓库", select(Inventory).where(
+            Inventory.warehouse_id == warehouse_id
+        ).order_by(Inventory.id).limit(100)),
+        ("库存移动 按产品+日期", select(StockMovement).where(
+            StockMovement.product_id == product_id, StockMovement.movement_date >= month_ago
+        ).order_by(StockMovement.movement_date)),
+        ("工单 按产品+状态", select(WorkOrder).where(
+            WorkOrder.product_id == product_id, WorkOrder.status.in_(("计划中", "已下达", "生产中"))
+        )),
+    ]
+
+def _scans(plan: dict) -> List[str]:
+    """计划树中访问表的节点，如 "Index Scan(ix_sales_orders_status_date)" """
+    found = []
+    node_type = plan.get("Node Type", "")
+    if "Scan" in node_type and ("Relation Name" in plan or "Index Name" in plan):
+        target = plan.get("Index Name") or plan.get("Relation Name")
+        found.append(f"{node_type}({target})")
+    for child in plan.get("Plans", []):
+        found.extend(_scans(child))
+    return found
+
+async def _explain(connection, stmt) -> Tuple[float, List[str], dict]:
+    sql = str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    result = await connection.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"))
+    document = result.scalar()
+    if isinstance(document, str):
+        document = json.loads(document)
+    plan = document[0]
+    return plan["Execution Time"], _scans(plan["Plan"]), plan["Plan"]
+
+async def main(show_plans: bool) -> None:
+    engine = get_engine()
+    async with engine.connect() as connection:
+        queries = await _queries(connection)
+        await connection.rollback()
+        transaction = await connection.begin()
+        try:
+            indexed = [await _explain(connection, stmt) for _, stmt in queries]
+            for name in _migration_indexes():
+                await connection.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+            unindexed = [await _explain(connection, stmt) for _, stmt in queries]
+        finally:
+            await transaction.rollback()
+
+    for (title, _), before, after in zip(queries, unindexed, indexed):
+        print(f"{title}")
+        print(f"  无索引: {before[0]:>9.2f} ms  {', '.join(before[1])}")
+        print(f"  有索引: {after[0]:>9.2f} ms  {', '.join(after[1])}")
+        if show_plans:
+            print(json.dumps({"无索引": before[2], "有索引": after[2]}, ensure_ascii=False, indent=2))
+    await engine.dispose()
+
+if __name__ == "__main__":
+    if sys.argv[1:] not in ([], ["--plans"]):
+        print("用法: python -m benchmarks.explain_indexes [--plans]")
+        sys.exit(1)
+    asyncio.run(main(sys.argv[1:] == ["--plans"]))
@@ -1,23 +1,69 @@
-from sqlalchemy import create_engine, MetaData
+import logging
+from typing import Optional
+from sqlalchemy import MetaData, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
 from config import settings
+from utils.metrics import TimedQueuePool, instrument_engine
 import asyncpg
 
-print("正在配置数据库连接...")
+logger = logging.getLogger(__name__)
 
-# 同步数据库引擎（用于初始化）
-SYNC_DATABASE_URL = settings.DATABASE_URL.replace("postgresql://", "postgresql://")
-engine = create_engine(SYNC_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# 异步数据库引擎（用于API操作）
+# 异步数据库引擎（用于API操作），首次使用时才创建
 ASYNC_DATABASE_URL = settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
-async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=settings.DEBUG)
-AsyncSessionLocal = sessionmaker(
-    async_engine, class_=AsyncSession, expire_on_commit=False
-)
+_async_engine: Optional[AsyncEngine] = None
+_session_factory = async_sessionmaker(class_=AsyncSession, expire_on_commit=False)
+
+def get_engine() -> AsyncEngine:
+    """获取异步数据库引擎（进程内单例，按配置创建连接池）"""
+    global _async_engine
+    if _async_engine is None:
+        server_settings = {"application_name": settings.APP_NAME}
+        if settings.DB_STATEMENT_TIMEOUT_MS:
+            server_settings["statement_timeout"] = str(settings.DB_STATEMENT_TIMEOUT_MS)
+        _async_engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            echo=settings.DB_ECHO,
+            poolclass=TimedQueuePool,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+            connect_args={"server_settings": server_settings},
+        )
+        instrument_engine(_async_engine)
+    return _async_engine
+
+def AsyncSessionLocal(**kwargs) -> AsyncSession:
+    """创建数据库会话（绑定到共享引擎）"""
+    return _session_factory(bind=get_engine(), **kwargs)
+
+def get_pool_status() -> dict:
+    """连接池使用情况，引擎尚未创建时各项为0"""
+    if _async_engine is None:
+        return {
+            "size": settings.DB_POOL_SIZE, "max_overflow": settings.DB_MAX_OVERFLOW,
+            "checked_in": 0, "checked_out": 0, "overflow": 0, "saturation": 0.0,
+        }
+    pool = _async_engine.pool
+    checked_out = pool.checkedout()
+    capacity = settings.DB_POOL_SIZE + max(settings.DB_MAX_OVERFLOW, 0)
+    return {
+        "size": pool.size(),
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "checked_in": pool.checkedin(),
+        "checked_out": checked_out,
+        "overflow": max(pool.overflow(), 0),
+        "saturation": round(checked_out / capacity, 4) if capacity else 0.0,
+    }
+
+async def dispose_engine():
+    """关闭连接池"""
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
 
 # 数据库基类
 Base = declarative_base()
@@ -29,7 +75,7 @@ async def get_db():
         try:
             yield session
         except Exception as e:
-            print(f"数据库会话错误: {e}")
+            logger.error("数据库会话错误: %s", e)
             await session.rollback()
             raise
         finally:
@@ -52,7 +98,7 @@ async def create_database_if_not_exists():
         # 连接到postgres默认数据库来创建目标数据库
         admin_url = f"postgresql://{username}:{password}@{host}:{port}/postgres"
         
-        print(f"正在检查数据库 '{database_name}' 是否存在...")
+        logger.info("正在检查数据库 '%s' 是否存在...", database_name)
         
         # 使用asyncpg直接连接
         conn = await asyncpg.connect(admin_url)
@@ -63,18 +109,18 @@ async def create_database_if_not_exists():
             )
             
             if not result:
-                print(f"数据库 '{database_name}' 不存在，正在创建...")
+                logger.info("数据库 '%s' 不存在，正在创建...", database_name)
                 # 创建数据库
                 await conn.execute(f'CREATE DATABASE "{database_name}"')
-                print(f"数据库 '{database_name}' 创建成功")
+                logger.info("数据库 '%s' 创建成功", database_name)
             else:
-                print(f"数据库 '{database_name}' 已存在")
+                logger.info("数据库 '%s' 已存在", database_name)
                 
         finally:
             await conn.close()
             
     except Exception as e:
-        print(f"创建数据库失败: {e}")
+        logger.error("创建数据库失败: %s", e)
         raise
 
 # 初始化数据库
@@ -83,24 +129,25 @@ async def init_db():
         # 首先确保数据库存在
         await create_database_if_not_exists()
         
-        print("正在创建数据库表...")
+        logger.info("正在创建数据库表...")
         # 导入所有模型以确保它们被注册
         from models import (
             user, customer, product, sales, 
             production, procurement, warehouse, finance
         )
         
-        # 创建所有表
-        async with async_engine.begin() as conn:
+        # 创建所有表（搜索索引依赖 pg_trgm 扩展）
+        async with get_engine().begin() as conn:
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
             await conn.run_sync(Base.metadata.create_all)
         
-        print("数据库表创建完成")
+        logger.info("数据库表创建完成")
         
         # 创建默认管理员用户
         await create_default_admin()
         
     except Exception as e:
-        print(f"数据库初始化失败: {e}")
+        logger.error("数据库初始化失败: %s", e)
         raise
 
 # 创建默认管理员用户
@@ -118,7 +165,7 @@ async def create_default_admin():
             admin_user = result.scalar_one_or_none()
             
             if not admin_user:
-                print("正在创建默认管理员用户...")
+                logger.info("正在创建默认管理员用户...")
                 admin_user = User(
                     username="admin",
                     email="admin@prepy-erp.com",
@@ -129,10 +176,10 @@ async def create_default_admin():
                 )
                 session.add(admin_user)
                 await session.commit()
-                print("默认管理员用户创建成功 (用户名: admin, 密码: admin123)")
+                logger.info("默认管理员用户创建成功 (用户名: admin, 密码: admin123)")
             else:
-                print("管理员用户已存在")
+                logger.info("管理员用户已存在")
                 
         except Exception as e:
-            print(f"创建默认管理员失败: {e}")
+            logger.error("创建默认管理员失败: %s", e)
             await session.rollback()
\ No newline at end of file
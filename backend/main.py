@@ -1,28 +1,45 @@
+import logging
+import time
 from fastapi import FastAPI, Depends, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
 import uvicorn
 from contextlib import asynccontextmanager
 
+from config import settings
+from utils.logger import setup_logging, shutdown_logging
+
+# 先配置日志，再导入其余模块
+setup_logging()
+logger = logging.getLogger(__name__)
+
 # 导入路由模块
 from routers import (
     auth, users, customers, products, sales, 
     production, procurement, warehouse, finance
 )
-from database import init_db
-from config import settings
+from database import init_db, dispose_engine, get_engine, get_pool_status
+from utils.pagination import PAGINATION_HEADERS
+from utils.metrics import MetricsMiddleware, render_metrics, route_summary, requests_in_flight
+from utils.idempotency import IdempotencyMiddleware, REPLAYED_HEADER
 
-print("正在初始化PrePy ERP系统...")
+logger.info("正在初始化PrePy ERP系统...")
+logger.info("数据库: %s", make_url(settings.DATABASE_URL).render_as_string(hide_password=True))
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 启动时初始化数据库
-    print("正在连接数据库...")
+    logger.info("正在连接数据库...")
     await init_db()
-    print("数据库连接成功")
+    logger.info("数据库连接成功")
     yield
     # 关闭时清理资源
-    print("正在关闭系统...")
+    logger.info("正在关闭系统...")
+    await dispose_engine()
+    shutdown_logging()
 
 app = FastAPI(
     title="PrePy ERP API",
@@ -31,6 +48,11 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+_started_at = time.time()
+
+# 接口幂等（位于CORS之内，幂等键冲突的响应同样带跨域头）
+app.add_middleware(IdempotencyMiddleware)
+
 # 配置CORS
 app.add_middleware(
     CORSMiddleware,
@@ -38,8 +60,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=PAGINATION_HEADERS + [REPLAYED_HEADER],  # 允许前端读取分页游标和幂等重放标记
 )
 
+# 请求指标采集（最后添加即位于最外层，包含其他中间件的耗时）
+app.add_middleware(MetricsMiddleware)
+
 security = HTTPBearer()
 
 # 注册路由
@@ -59,10 +85,46 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "message": "系统运行正常"}
+    """健康检查：数据库连通性、连接池及请求统计"""
+    database = {"status": "ok"}
+    try:
+        start = time.perf_counter()
+        async with get_engine().connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        database["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    except Exception as e:
+        logger.error("健康检查数据库连接失败: %s", e)
+        database = {"status": "error", "error": str(e)}
+
+    healthy = database["status"] == "ok"
+    return JSONResponse(
+        status_code=200 if healthy else 503,
+        content={
+            "status": "healthy" if healthy else "unhealthy",
+            "message": "系统运行正常" if healthy else "数据库不可用",
+            "uptime_seconds": round(time.time() - _started_at),
+            "database": database,
+            "pool": get_pool_status(),
+            "requests_in_flight": requests_in_flight(),
+            "slowest_routes": route_summary(),
+        },
+    )
+
+@app.get("/health/db-pool")
+async def db_pool_status():
+    """数据库连接池使用情况"""
+    return get_pool_status()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus格式的运行指标"""
+    return PlainTextResponse(
+        render_metrics(get_pool_status()),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
 
 if __name__ == "__main__":
-    print(f"启动服务器，端口: {settings.PORT}")
+    logger.info("启动服务器，端口: %s", settings.PORT)
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
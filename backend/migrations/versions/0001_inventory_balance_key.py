@@ -0,0 +1,56 @@
+"""库存余额唯一键
+
+为 inventory 添加唯一索引 uq_inventory_balance（产品、仓库、库位、批次，
+库位和批次为空时视为同一行），作为库存余额增量过账的最后一道保证。
+存在重复的余额行时拒绝执行，需先合并重复行。
+索引使用 CREATE INDEX CONCURRENTLY 创建，不阻塞业务写入；
+对已经由 create_all 建好索引的新库可重复执行。
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# 库存余额唯一键：库位、批次为空时视为同一行
+BALANCE_INDEX = "uq_inventory_balance"
+BALANCE_COLUMNS = [
+    "product_id",
+    "warehouse_id",
+    sa.text("COALESCE(location_id, 0)"),
+    sa.text("COALESCE(batch_number, '')"),
+]
+
+def _check_duplicate_balances() -> None:
+    """唯一键创建前检查是否存在重复的库存余额行"""
+    duplicates = op.get_bind().execute(sa.text(
+        "SELECT COUNT(*) FROM ("
+        " SELECT 1 FROM inventory"
+        " GROUP BY product_id, warehouse_id, COALESCE(location_id, 0), COALESCE(batch_number, '')"
+        " HAVING COUNT(*) > 1"
+        ") AS d"
+    )).scalar()
+    if duplicates:
+        raise RuntimeError(
+            f"inventory 表存在 {duplicates} 组重复的库存余额行，请先合并重复行后再执行迁移"
+        )
+
+def upgrade() -> None:
+    if not op.get_context().as_sql:
+        _check_duplicate_balances()
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            BALANCE_INDEX, "inventory", BALANCE_COLUMNS,
+            unique=True, if_not_exists=True, postgresql_concurrently=True
+        )
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(BALANCE_INDEX, table_name="inventory", if_exists=True, postgresql_concurrently=True)
@@ -0,0 +1,95 @@
+"""为外键和常用查询添加索引
+
+为外键列、按客户/供应商/状态+日期的列表查询、库存移动按产品+日期的
+查询添加索引。
+索引使用 CREATE INDEX CONCURRENTLY 创建，不阻塞业务写入；
+对已经由 create_all 建好索引的新库可重复执行。
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+# (索引名, 表名, 列)
+INDEXES = [
+    ("ix_product_categories_parent_id", "product_categories", ["parent_id"]),
+    ("ix_user_roles_role_id", "user_roles", ["role_id"]),
+    ("ix_user_roles_user_id", "user_roles", ["user_id"]),
+    ("ix_customer_contacts_customer_id", "customer_contacts", ["customer_id"]),
+    ("ix_expenses_employee_id", "expenses", ["employee_id"]),
+    ("ix_expenses_status_date", "expenses", ["status", "expense_date"]),
+    ("ix_operations_work_center_id", "operations", ["work_center_id"]),
+    ("ix_products_category_id", "products", ["category_id"]),
+    ("ix_purchase_orders_status_date", "purchase_orders", ["status", "order_date"]),
+    ("ix_purchase_orders_supplier_date", "purchase_orders", ["supplier_id", "order_date"]),
+    ("ix_quotations_customer_date", "quotations", ["customer_id", "quote_date"]),
+    ("ix_quotations_status_date", "quotations", ["status", "quote_date"]),
+    ("ix_boms_product_id", "boms", ["product_id"]),
+    ("ix_locations_warehouse_id", "locations", ["warehouse_id"]),
+    ("ix_purchase_order_lines_order_id", "purchase_order_lines", ["order_id"]),
+    ("ix_purchase_order_lines_product_status", "purchase_order_lines", ["product_id", "status"]),
+    ("ix_purchase_receipts_order_id", "purchase_receipts", ["order_id"]),
+    ("ix_purchase_receipts_supplier_id", "purchase_receipts", ["supplier_id"]),
+    ("ix_quotation_lines_product_id", "quotation_lines", ["product_id"]),
+    ("ix_quotation_lines_quotation_id", "quotation_lines", ["quotation_id"]),
+    ("ix_sales_orders_customer_date", "sales_orders", ["customer_id", "order_date"]),
+    ("ix_sales_orders_quotation_id", "sales_orders", ["quotation_id"]),
+    ("ix_sales_orders_status_date", "sales_orders", ["status", "order_date"]),
+    ("ix_stock_takings_warehouse_date", "stock_takings", ["warehouse_id", "taking_date"]),
+    ("ix_bom_lines_bom_id", "bom_lines", ["bom_id"]),
+    ("ix_bom_lines_material_id", "bom_lines", ["material_id"]),
+    ("ix_deliveries_customer_id", "deliveries", ["customer_id"]),
+    ("ix_deliveries_order_id", "deliveries", ["order_id"]),
+    ("ix_inventory_warehouse_product", "inventory", ["warehouse_id", "product_id"]),
+    ("ix_invoices_customer_date", "invoices", ["customer_id", "invoice_date"]),
+    ("ix_invoices_purchase_order_id", "invoices", ["purchase_order_id"]),
+    ("ix_invoices_sales_order_id", "invoices", ["sales_order_id"]),
+    ("ix_invoices_status_due_date", "invoices", ["status", "due_date"]),
+    ("ix_invoices_supplier_date", "invoices", ["supplier_id", "invoice_date"]),
+    ("ix_purchase_receipt_lines_order_line_id", "purchase_receipt_lines", ["order_line_id"]),
+    ("ix_purchase_receipt_lines_product_id", "purchase_receipt_lines", ["product_id"]),
+    ("ix_purchase_receipt_lines_receipt_id", "purchase_receipt_lines", ["receipt_id"]),
+    ("ix_sales_order_lines_order_id", "sales_order_lines", ["order_id"]),
+    ("ix_sales_order_lines_product_status", "sales_order_lines", ["product_id", "status"]),
+    ("ix_stock_movements_product_date", "stock_movements", ["product_id", "movement_date"]),
+    ("ix_stock_movements_reference", "stock_movements", ["reference_type", "reference_id"]),
+    ("ix_stock_movements_warehouse_date", "stock_movements", ["warehouse_id", "movement_date"]),
+    ("ix_stock_taking_lines_product_id", "stock_taking_lines", ["product_id"]),
+    ("ix_stock_taking_lines_taking_id", "stock_taking_lines", ["taking_id"]),
+    ("ix_account_payables_due_date", "account_payables", ["due_date"]),
+    ("ix_account_payables_invoice_id", "account_payables", ["invoice_id"]),
+    ("ix_account_payables_supplier_status", "account_payables", ["supplier_id", "status"]),
+    ("ix_account_receivables_customer_status", "account_receivables", ["customer_id", "status"]),
+    ("ix_account_receivables_due_date", "account_receivables", ["due_date"]),
+    ("ix_account_receivables_invoice_id", "account_receivables", ["invoice_id"]),
+    ("ix_invoice_lines_invoice_id", "invoice_lines", ["invoice_id"]),
+    ("ix_invoice_lines_product_id", "invoice_lines", ["product_id"]),
+    ("ix_payments_customer_date", "payments", ["customer_id", "payment_date"]),
+    ("ix_payments_invoice_id", "payments", ["invoice_id"]),
+    ("ix_payments_reference_number", "payments", ["reference_number"]),
+    ("ix_payments_supplier_date", "payments", ["supplier_id", "payment_date"]),
+    ("ix_work_orders_bom_id", "work_orders", ["bom_id"]),
+    ("ix_work_orders_product_status", "work_orders", ["product_id", "status"]),
+    ("ix_work_orders_sales_order_line_id", "work_orders", ["sales_order_line_id"]),
+    ("ix_work_orders_status_start", "work_orders", ["status", "planned_start_date"]),
+    ("ix_work_order_operations_operation_id", "work_order_operations", ["operation_id"]),
+    ("ix_work_order_operations_order_sequence", "work_order_operations", ["work_order_id", "sequence"]),
+    ("ix_production_records_operator_id", "production_records", ["operator_id"]),
+    ("ix_production_records_work_order_operation_id", "production_records", ["work_order_operation_id"]),
+]
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, if_not_exists=True, postgresql_concurrently=True)
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
@@ -0,0 +1,46 @@
+"""产品分类路径
+
+为 product_categories 添加 path 列（从根分类到本分类的ID数组），
+用递归查询回填已有数据，并建立 GIN 索引以支持按祖先查询整棵子树。
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # create_all 新建的库已有该列
+    op.execute("ALTER TABLE product_categories ADD COLUMN IF NOT EXISTS path INTEGER[]")
+    op.execute("COMMENT ON COLUMN product_categories.path IS '分类路径(从根分类到本分类的ID)'")
+    op.execute(
+        """
+        WITH RECURSIVE tree AS (
+            SELECT id, ARRAY[id] AS path
+            FROM product_categories
+            WHERE parent_id IS NULL
+            UNION ALL
+            SELECT c.id, tree.path || c.id
+            FROM product_categories c
+            JOIN tree ON c.parent_id = tree.id
+        )
+        UPDATE product_categories
+        SET path = tree.path
+        FROM tree
+        WHERE product_categories.id = tree.id
+        """
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_product_categories_path", "product_categories", ["path"],
+            postgresql_using="gin", if_not_exists=True, postgresql_concurrently=True
+        )
+
+def downgrade() -> None:
+    op.drop_index("ix_product_categories_path", table_name="product_categories", if_exists=True)
+    op.drop_column("product_categories", "path")
@@ -0,0 +1,31 @@
+"""客户信用占用汇总表
+
+新建 customer_credit_exposures，每个客户一行保存在途订单金额和应收金额。
+升级后执行 python -m services.credit rebuild 从已有单据回填。
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # create_all 新建的库已有该表
+    if not op.get_context().as_sql and sa.inspect(op.get_bind()).has_table("customer_credit_exposures"):
+        return
+    op.create_table(
+        "customer_credit_exposures",
+        sa.Column("customer_id", sa.Integer(), sa.ForeignKey("customers.id"), primary_key=True, comment="客户ID"),
+        sa.Column("open_order_amount", sa.Numeric(15, 2), nullable=False, server_default="0", comment="未开票的在途订单金额"),
+        sa.Column("receivable_amount", sa.Numeric(15, 2), nullable=False, server_default="0", comment="已开票未收款金额"),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), comment="更新时间"),
+    )
+
+def downgrade() -> None:
+    op.drop_table("customer_credit_exposures")
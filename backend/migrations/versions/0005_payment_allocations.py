@@ -0,0 +1,66 @@
+"""付款核销
+
+为 payments 添加已核销金额，新建 payment_allocations 核销明细表，
+并为尚无应收/应付账款的发票补建账款记录。
+升级后执行 python -m services.settlement allocate 核销已有付款。
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # create_all 新建的库已有该列和表
+    op.execute("ALTER TABLE payments ADD COLUMN IF NOT EXISTS allocated_amount NUMERIC(15, 2) DEFAULT 0")
+    op.execute("COMMENT ON COLUMN payments.allocated_amount IS '已核销金额'")
+    if op.get_context().as_sql or not sa.inspect(op.get_bind()).has_table("payment_allocations"):
+        op.create_table(
+            "payment_allocations",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("payment_id", sa.Integer(), sa.ForeignKey("payments.id"), nullable=False, comment="付款ID"),
+            sa.Column("invoice_id", sa.Integer(), sa.ForeignKey("invoices.id"), nullable=False, comment="发票ID"),
+            sa.Column("amount", sa.Numeric(15, 2), nullable=False, comment="核销金额"),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), comment="创建时间"),
+        )
+        op.create_index("ix_payment_allocations_id", "payment_allocations", ["id"])
+        op.create_index("ix_payment_allocations_payment_id", "payment_allocations", ["payment_id"])
+        op.create_index("ix_payment_allocations_invoice_id", "payment_allocations", ["invoice_id"])
+
+    # 补建账款记录，未结金额取发票上的未付金额
+    op.execute(
+        """
+        INSERT INTO account_receivables
+            (customer_id, invoice_id, original_amount, outstanding_amount, invoice_date, due_date, status)
+        SELECT i.customer_id, i.id, COALESCE(i.total_amount, 0), COALESCE(i.outstanding_amount, 0),
+               i.invoice_date, i.due_date,
+               CASE WHEN COALESCE(i.outstanding_amount, 0) <= 0 THEN '已收'
+                    WHEN COALESCE(i.paid_amount, 0) > 0 THEN '部分收款' ELSE '未收' END
+        FROM invoices i
+        WHERE i.invoice_type = '销售发票' AND i.customer_id IS NOT NULL AND i.status != '已取消'
+          AND NOT EXISTS (SELECT 1 FROM account_receivables r WHERE r.invoice_id = i.id)
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO account_payables
+            (supplier_id, invoice_id, original_amount, outstanding_amount, invoice_date, due_date, status)
+        SELECT i.supplier_id, i.id, COALESCE(i.total_amount, 0), COALESCE(i.outstanding_amount, 0),
+               i.invoice_date, i.due_date,
+               CASE WHEN COALESCE(i.outstanding_amount, 0) <= 0 THEN '已付'
+                    WHEN COALESCE(i.paid_amount, 0) > 0 THEN '部分付款' ELSE '未付' END
+        FROM invoices i
+        WHERE i.invoice_type = '采购发票' AND i.supplier_id IS NOT NULL AND i.status != '已取消'
+          AND NOT EXISTS (SELECT 1 FROM account_payables p WHERE p.invoice_id = i.id)
+        """
+    )
+
+def downgrade() -> None:
+    op.drop_table("payment_allocations")
+    op.drop_column("payments", "allocated_amount")
@@ -0,0 +1,44 @@
+"""账龄快照
+
+新建 aging_snapshots，保存每日按往来单位汇总的应收/应付账龄。
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+def _amount(name: str, comment: str) -> sa.Column:
+    return sa.Column(name, sa.Numeric(15, 2), nullable=False, server_default="0", comment=comment)
+
+def upgrade() -> None:
+    # create_all 新建的库已有该表
+    if not op.get_context().as_sql and sa.inspect(op.get_bind()).has_table("aging_snapshots"):
+        return
+    op.create_table(
+        "aging_snapshots",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("snapshot_date", sa.Date(), nullable=False, comment="快照日期"),
+        sa.Column("ledger", sa.String(20), nullable=False, comment="账簿(receivable应收/payable应付)"),
+        sa.Column("partner_id", sa.Integer(), nullable=False, comment="客户或供应商ID"),
+        _amount("total_amount", "未结总额"),
+        _amount("current_amount", "未到期"),
+        _amount("days_1_30", "逾期1-30天"),
+        _amount("days_31_60", "逾期31-60天"),
+        _amount("days_61_90", "逾期61-90天"),
+        _amount("days_over_90", "逾期90天以上"),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), comment="创建时间"),
+    )
+    op.create_index("ix_aging_snapshots_id", "aging_snapshots", ["id"])
+    op.create_index(
+        "uq_aging_snapshot", "aging_snapshots", ["snapshot_date", "ledger", "partner_id"], unique=True
+    )
+
+def downgrade() -> None:
+    op.drop_table("aging_snapshots")
@@ -0,0 +1,37 @@
+"""接口幂等键
+
+新建 idempotency_keys，保存带 Idempotency-Key 请求头的 POST 请求及其首次响应。
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # create_all 新建的库已有该表
+    if not op.get_context().as_sql and sa.inspect(op.get_bind()).has_table("idempotency_keys"):
+        return
+    op.create_table(
+        "idempotency_keys",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String(50), nullable=False, comment="用户名"),
+        sa.Column("key", sa.String(100), nullable=False, comment="幂等键"),
+        sa.Column("request_hash", sa.String(64), nullable=False, comment="请求摘要(方法、路径、参数和请求体的SHA-256)"),
+        sa.Column("status_code", sa.Integer(), comment="响应状态码"),
+        sa.Column("content_type", sa.String(100), comment="响应类型"),
+        sa.Column("response_body", sa.LargeBinary(), comment="响应体"),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), comment="创建时间"),
+    )
+    op.create_index("ix_idempotency_keys_id", "idempotency_keys", ["id"])
+    op.create_index("ix_idempotency_keys_created_at", "idempotency_keys", ["created_at"])
+    op.create_index("uq_idempotency_key", "idempotency_keys", ["username", "key"], unique=True)
+
+def downgrade() -> None:
+    op.drop_table("idempotency_keys")
@@ -0,0 +1,45 @@
+"""客户、供应商、产品模糊搜索
+
+启用 pg_trgm 扩展，为 customers、suppliers、products 添加 search_text 生成列
+（编码、名称等字段拼接后转小写），并建立 gin_trgm_ops 的 GIN 索引。
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+# 表 -> 参与搜索的列
+SEARCH_COLUMNS = {
+    "customers": ("code", "name", "short_name", "contact_person"),
+    "suppliers": ("code", "name", "short_name", "contact_person"),
+    "products": ("code", "name", "specification"),
+}
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table, columns in SEARCH_COLUMNS.items():
+        document = " || ' ' || ".join(f"coalesce({column}, '')" for column in columns)
+        # create_all 新建的库已有该列
+        op.execute(
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_text TEXT "
+            f"GENERATED ALWAYS AS (lower({document})) STORED"
+        )
+        op.execute(f"COMMENT ON COLUMN {table}.search_text IS '搜索文本'")
+    with op.get_context().autocommit_block():
+        for table in SEARCH_COLUMNS:
+            op.create_index(
+                f"ix_{table}_search_text", table, ["search_text"],
+                postgresql_using="gin", postgresql_ops={"search_text": "gin_trgm_ops"},
+                if_not_exists=True, postgresql_concurrently=True
+            )
+
+def downgrade() -> None:
+    for table in SEARCH_COLUMNS:
+        op.drop_index(f"ix_{table}_search_text", table_name=table, if_exists=True)
+        op.drop_column(table, "search_text")
@@ -1,13 +1,14 @@
 # 导入所有模型，确保它们被SQLAlchemy识别
 
 from .user import User, Role, UserRole
-from .customer import Customer, CustomerContact
+from .customer import Customer, CustomerContact, CustomerCreditExposure
 from .product import ProductCategory, Product, BOM, BOMLine
 from .sales import Quotation, QuotationLine, SalesOrder, SalesOrderLine, Delivery
 from .production import WorkOrder, WorkOrderOperation, Operation, WorkCenter, ProductionRecord
 from .procurement import Supplier, PurchaseOrder, PurchaseOrderLine, PurchaseReceipt, PurchaseReceiptLine
 from .warehouse import Warehouse, Location, Inventory, StockMovement, StockTaking, StockTakingLine
-from .finance import Invoice, InvoiceLine, Payment, AccountReceivable, AccountPayable, Expense
+from .finance import Invoice, InvoiceLine, Payment, PaymentAllocation, AccountReceivable, AccountPayable, Expense, AgingSnapshot
+from .idempotency import IdempotencyKey
 
 # 导出所有模型
 __all__ = [
@@ -15,7 +16,7 @@ __all__ = [
     "User", "Role", "UserRole",
     
     # 客户管理
-    "Customer", "CustomerContact",
+    "Customer", "CustomerContact", "CustomerCreditExposure",
     
     # 产品管理
     "ProductCategory", "Product", "BOM", "BOMLine",
@@ -33,7 +34,8 @@ __all__ = [
     "Warehouse", "Location", "Inventory", "StockMovement", "StockTaking", "StockTakingLine",
     
     # 财务管理
-    "Invoice", "InvoiceLine", "Payment", "AccountReceivable", "AccountPayable", "Expense"
-]
-
-print("模型加载完成 - 共加载 {} 个模型".format(len(__all__)))
\ No newline at end of file
+    "Invoice", "InvoiceLine", "Payment", "PaymentAllocation", "AccountReceivable", "AccountPayable", "Expense", "AgingSnapshot",
+    
+    # 系统
+    "IdempotencyKey"
+]
\ No newline at end of file
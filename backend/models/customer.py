@@ -1,11 +1,14 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Numeric, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Numeric, ForeignKey, Computed, Index
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import backref, relationship
 from database import Base
 
 class Customer(Base):
     """客户模型"""
     __tablename__ = "customers"
+    __table_args__ = (
+        Index("ix_customers_search_text", "search_text", postgresql_using="gin", postgresql_ops={"search_text": "gin_trgm_ops"}),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     code = Column(String(50), unique=True, index=True, nullable=False, comment="客户编码")
@@ -49,6 +52,9 @@ class Customer(Base):
     # 备注
     notes = Column(Text, comment="备注")
     
+    # 搜索文本（小写，供 pg_trgm 模糊搜索）
+    search_text = Column(Text, Computed("lower(coalesce(code, '') || ' ' || coalesce(name, '') || ' ' || coalesce(short_name, '') || ' ' || coalesce(contact_person, ''))", persisted=True), comment="搜索文本")
+    
     def __repr__(self):
         return f"<Customer(id={self.id}, code='{self.code}', name='{self.name}')>"
 
@@ -57,7 +63,7 @@ class CustomerContact(Base):
     __tablename__ = "customer_contacts"
     
     id = Column(Integer, primary_key=True, index=True)
-    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False, comment="客户ID")
+    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False, index=True, comment="客户ID")
     name = Column(String(50), nullable=False, comment="联系人姓名")
     position = Column(String(50), comment="职位")
     department = Column(String(50), comment="部门")
@@ -80,4 +86,27 @@ class CustomerContact(Base):
     customer = relationship("Customer", backref="contacts")
     
     def __repr__(self):
-        return f"<CustomerContact(id={self.id}, name='{self.name}', customer_id={self.customer_id})>"
\ No newline at end of file
+        return f"<CustomerContact(id={self.id}, name='{self.name}', customer_id={self.customer_id})>"
+
+class CustomerCreditExposure(Base):
+    """客户信用占用模型（随订单、发票、收款过账增量维护）"""
+    __tablename__ = "customer_credit_exposures"
+    
+    customer_id = Column(Integer, ForeignKey("customers.id"), primary_key=True, comment="客户ID")
+    
+    # 占用金额
+    open_order_amount = Column(Numeric(15, 2), nullable=False, default=0, comment="未开票的在途订单金额")
+    receivable_amount = Column(Numeric(15, 2), nullable=False, default=0, comment="已开票未收款金额")
+    
+    # 时间字段
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), comment="更新时间")
+    
+    # 关系
+    customer = relationship("Customer", backref=backref("credit_exposure", uselist=False))
+    
+    @property
+    def total_exposure(self):
+        return (self.open_order_amount or 0) + (self.receivable_amount or 0)
+    
+    def __repr__(self):
+        return f"<CustomerCreditExposure(customer_id={self.customer_id}, open_order_amount={self.open_order_amount}, receivable_amount={self.receivable_amount})>"
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Numeric, ForeignKey, Date
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Numeric, ForeignKey, Date, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
@@ -6,6 +6,11 @@ from database import Base
 class Invoice(Base):
     """发票模型"""
     __tablename__ = "invoices"
+    __table_args__ = (
+        Index("ix_invoices_customer_date", "customer_id", "invoice_date"),
+        Index("ix_invoices_supplier_date", "supplier_id", "invoice_date"),
+        Index("ix_invoices_status_due_date", "status", "due_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     number = Column(String(50), unique=True, index=True, nullable=False, comment="发票号")
@@ -14,8 +19,8 @@ class Invoice(Base):
     # 关联信息
     customer_id = Column(Integer, ForeignKey("customers.id"), comment="客户ID")
     supplier_id = Column(Integer, ForeignKey("suppliers.id"), comment="供应商ID")
-    sales_order_id = Column(Integer, ForeignKey("sales_orders.id"), comment="销售订单ID")
-    purchase_order_id = Column(Integer, ForeignKey("purchase_orders.id"), comment="采购订单ID")
+    sales_order_id = Column(Integer, ForeignKey("sales_orders.id"), index=True, comment="销售订单ID")
+    purchase_order_id = Column(Integer, ForeignKey("purchase_orders.id"), index=True, comment="采购订单ID")
     
     # 基本信息
     invoice_date = Column(Date, nullable=False, comment="发票日期")
@@ -44,8 +49,8 @@ class Invoice(Base):
     # 关系
     customer = relationship("Customer")
     supplier = relationship("Supplier")
-    sales_order = relationship("SalesOrder")
-    purchase_order = relationship("PurchaseOrder")
+    sales_order = relationship("SalesOrder", backref="invoices")
+    purchase_order = relationship("PurchaseOrder", backref="invoices")
     
     def __repr__(self):
         return f"<Invoice(id={self.id}, number='{self.number}', invoice_type='{self.invoice_type}')>"
@@ -55,8 +60,8 @@ class InvoiceLine(Base):
     __tablename__ = "invoice_lines"
     
     id = Column(Integer, primary_key=True, index=True)
-    invoice_id = Column(Integer, ForeignKey("invoices.id"), nullable=False, comment="发票ID")
-    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, comment="产品ID")
+    invoice_id = Column(Integer, ForeignKey("invoices.id"), nullable=False, index=True, comment="发票ID")
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, index=True, comment="产品ID")
     
     # 数量和价格
     quantity = Column(Numeric(10, 2), nullable=False, comment="数量")
@@ -81,6 +86,10 @@ class InvoiceLine(Base):
 class Payment(Base):
     """付款记录模型"""
     __tablename__ = "payments"
+    __table_args__ = (
+        Index("ix_payments_customer_date", "customer_id", "payment_date"),
+        Index("ix_payments_supplier_date", "supplier_id", "payment_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     number = Column(String(50), unique=True, index=True, nullable=False, comment="付款单号")
@@ -89,18 +98,19 @@ class Payment(Base):
     # 关联信息
     customer_id = Column(Integer, ForeignKey("customers.id"), comment="客户ID")
     supplier_id = Column(Integer, ForeignKey("suppliers.id"), comment="供应商ID")
-    invoice_id = Column(Integer, ForeignKey("invoices.id"), comment="发票ID")
+    invoice_id = Column(Integer, ForeignKey("invoices.id"), index=True, comment="发票ID")
     
     # 基本信息
     payment_date = Column(Date, nullable=False, comment="付款日期")
     amount = Column(Numeric(15, 2), nullable=False, comment="付款金额")
+    allocated_amount = Column(Numeric(15, 2), default=0, comment="已核销金额")
     currency = Column(String(10), default="CNY", comment="币种")
     exchange_rate = Column(Numeric(10, 4), default=1, comment="汇率")
     
     # 付款方式
     payment_method = Column(String(20), default="银行转账", comment="付款方式(现金/银行转账/支票/其他)")
     bank_account = Column(String(100), comment="银行账户")
-    reference_number = Column(String(100), comment="参考号")
+    reference_number = Column(String(100), index=True, comment="参考号")
     
     # 状态
     status = Column(String(20), default="已付", comment="状态(已付/已取消)")
@@ -120,13 +130,36 @@ class Payment(Base):
     def __repr__(self):
         return f"<Payment(id={self.id}, number='{self.number}', payment_type='{self.payment_type}', amount={self.amount})>"
 
+class PaymentAllocation(Base):
+    """付款核销明细模型"""
+    __tablename__ = "payment_allocations"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    payment_id = Column(Integer, ForeignKey("payments.id"), nullable=False, index=True, comment="付款ID")
+    invoice_id = Column(Integer, ForeignKey("invoices.id"), nullable=False, index=True, comment="发票ID")
+    amount = Column(Numeric(15, 2), nullable=False, comment="核销金额")
+    
+    # 时间字段
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+    
+    # 关系
+    payment = relationship("Payment", backref="allocations")
+    invoice = relationship("Invoice", backref="allocations")
+    
+    def __repr__(self):
+        return f"<PaymentAllocation(id={self.id}, payment_id={self.payment_id}, invoice_id={self.invoice_id}, amount={self.amount})>"
+
 class AccountReceivable(Base):
     """应收账款模型"""
     __tablename__ = "account_receivables"
+    __table_args__ = (
+        Index("ix_account_receivables_customer_status", "customer_id", "status"),
+        Index("ix_account_receivables_due_date", "due_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False, comment="客户ID")
-    invoice_id = Column(Integer, ForeignKey("invoices.id"), nullable=False, comment="发票ID")
+    invoice_id = Column(Integer, ForeignKey("invoices.id"), nullable=False, index=True, comment="发票ID")
     
     # 金额信息
     original_amount = Column(Numeric(15, 2), nullable=False, comment="原始金额")
@@ -136,7 +169,7 @@ class AccountReceivable(Base):
     invoice_date = Column(Date, nullable=False, comment="发票日期")
     due_date = Column(Date, comment="到期日期")
     
-    # 账龄分析
+    # 账龄分析（已不再维护，账龄按到期日实时计算或读取 aging_snapshots）
     aging_days = Column(Integer, default=0, comment="账龄天数")
     aging_category = Column(String(20), comment="账龄分类(未到期/1-30天/31-60天/61-90天/90天以上)")
     
@@ -157,10 +190,14 @@ class AccountReceivable(Base):
 class AccountPayable(Base):
     """应付账款模型"""
     __tablename__ = "account_payables"
+    __table_args__ = (
+        Index("ix_account_payables_supplier_status", "supplier_id", "status"),
+        Index("ix_account_payables_due_date", "due_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     supplier_id = Column(Integer, ForeignKey("suppliers.id"), nullable=False, comment="供应商ID")
-    invoice_id = Column(Integer, ForeignKey("invoices.id"), nullable=False, comment="发票ID")
+    invoice_id = Column(Integer, ForeignKey("invoices.id"), nullable=False, index=True, comment="发票ID")
     
     # 金额信息
     original_amount = Column(Numeric(15, 2), nullable=False, comment="原始金额")
@@ -170,7 +207,7 @@ class AccountPayable(Base):
     invoice_date = Column(Date, nullable=False, comment="发票日期")
     due_date = Column(Date, comment="到期日期")
     
-    # 账龄分析
+    # 账龄分析（已不再维护，账龄按到期日实时计算或读取 aging_snapshots）
     aging_days = Column(Integer, default=0, comment="账龄天数")
     aging_category = Column(String(20), comment="账龄分类(未到期/1-30天/31-60天/61-90天/90天以上)")
     
@@ -191,6 +228,9 @@ class AccountPayable(Base):
 class Expense(Base):
     """费用模型"""
     __tablename__ = "expenses"
+    __table_args__ = (
+        Index("ix_expenses_status_date", "status", "expense_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     number = Column(String(50), unique=True, index=True, nullable=False, comment="费用单号")
@@ -199,7 +239,7 @@ class Expense(Base):
     expense_date = Column(Date, nullable=False, comment="费用日期")
     expense_type = Column(String(50), nullable=False, comment="费用类型")
     department = Column(String(50), comment="部门")
-    employee_id = Column(Integer, ForeignKey("users.id"), comment="申请人ID")
+    employee_id = Column(Integer, ForeignKey("users.id"), index=True, comment="申请人ID")
     
     # 金额信息
     amount = Column(Numeric(15, 2), nullable=False, comment="费用金额")
@@ -220,4 +260,30 @@ class Expense(Base):
     employee = relationship("User")
     
     def __repr__(self):
-        return f"<Expense(id={self.id}, number='{self.number}', expense_type='{self.expense_type}', amount={self.amount})>"
\ No newline at end of file
+        return f"<Expense(id={self.id}, number='{self.number}', expense_type='{self.expense_type}', amount={self.amount})>"
+
+class AgingSnapshot(Base):
+    """账龄快照模型（每日按往来单位汇总的应收/应付账龄）"""
+    __tablename__ = "aging_snapshots"
+    __table_args__ = (
+        Index("uq_aging_snapshot", "snapshot_date", "ledger", "partner_id", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    snapshot_date = Column(Date, nullable=False, comment="快照日期")
+    ledger = Column(String(20), nullable=False, comment="账簿(receivable应收/payable应付)")
+    partner_id = Column(Integer, nullable=False, comment="客户或供应商ID")
+    
+    # 账龄分段金额
+    total_amount = Column(Numeric(15, 2), nullable=False, default=0, comment="未结总额")
+    current_amount = Column(Numeric(15, 2), nullable=False, default=0, comment="未到期")
+    days_1_30 = Column(Numeric(15, 2), nullable=False, default=0, comment="逾期1-30天")
+    days_31_60 = Column(Numeric(15, 2), nullable=False, default=0, comment="逾期31-60天")
+    days_61_90 = Column(Numeric(15, 2), nullable=False, default=0, comment="逾期61-90天")
+    days_over_90 = Column(Numeric(15, 2), nullable=False, default=0, comment="逾期90天以上")
+    
+    # 时间字段
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+    
+    def __repr__(self):
+        return f"<AgingSnapshot(snapshot_date={self.snapshot_date}, ledger='{self.ledger}', partner_id={self.partner_id}, total_amount={self.total_amount})>"
\ No newline at end of file
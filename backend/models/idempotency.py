@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary, Index
+from sqlalchemy.sql import func
+from database import Base
+
+class IdempotencyKey(Base):
+    """幂等键模型（带 Idempotency-Key 请求头的 POST 请求及其首次响应）"""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        Index("uq_idempotency_key", "username", "key", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String(50), nullable=False, comment="用户名")
+    key = Column(String(100), nullable=False, comment="幂等键")
+    request_hash = Column(String(64), nullable=False, comment="请求摘要(方法、路径、参数和请求体的SHA-256)")
+    
+    # 首次响应，处理完成前为空
+    status_code = Column(Integer, comment="响应状态码")
+    content_type = Column(String(100), comment="响应类型")
+    response_body = Column(LargeBinary, comment="响应体")
+    
+    # 时间字段
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True, comment="创建时间")
+    
+    def __repr__(self):
+        return f"<IdempotencyKey(username='{self.username}', key='{self.key}', status_code={self.status_code})>"
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Numeric, ForeignKey, Date
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Numeric, ForeignKey, Date, Index, Computed
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
@@ -6,6 +6,9 @@ from database import Base
 class Supplier(Base):
     """供应商模型"""
     __tablename__ = "suppliers"
+    __table_args__ = (
+        Index("ix_suppliers_search_text", "search_text", postgresql_using="gin", postgresql_ops={"search_text": "gin_trgm_ops"}),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     code = Column(String(50), unique=True, index=True, nullable=False, comment="供应商编码")
@@ -47,12 +50,19 @@ class Supplier(Base):
     # 备注
     notes = Column(Text, comment="备注")
     
+    # 搜索文本（小写，供 pg_trgm 模糊搜索）
+    search_text = Column(Text, Computed("lower(coalesce(code, '') || ' ' || coalesce(name, '') || ' ' || coalesce(short_name, '') || ' ' || coalesce(contact_person, ''))", persisted=True), comment="搜索文本")
+    
     def __repr__(self):
         return f"<Supplier(id={self.id}, code='{self.code}', name='{self.name}')>"
 
 class PurchaseOrder(Base):
     """采购订单模型"""
     __tablename__ = "purchase_orders"
+    __table_args__ = (
+        Index("ix_purchase_orders_supplier_date", "supplier_id", "order_date"),
+        Index("ix_purchase_orders_status_date", "status", "order_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     number = Column(String(50), unique=True, index=True, nullable=False, comment="采购订单号")
@@ -92,9 +102,12 @@ class PurchaseOrder(Base):
 class PurchaseOrderLine(Base):
     """采购订单明细模型"""
     __tablename__ = "purchase_order_lines"
+    __table_args__ = (
+        Index("ix_purchase_order_lines_product_status", "product_id", "status"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("purchase_orders.id"), nullable=False, comment="采购订单ID")
+    order_id = Column(Integer, ForeignKey("purchase_orders.id"), nullable=False, index=True, comment="采购订单ID")
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False, comment="产品ID")
     
     # 数量和价格
@@ -130,8 +143,8 @@ class PurchaseReceipt(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     number = Column(String(50), unique=True, index=True, nullable=False, comment="收货单号")
-    order_id = Column(Integer, ForeignKey("purchase_orders.id"), nullable=False, comment="采购订单ID")
-    supplier_id = Column(Integer, ForeignKey("suppliers.id"), nullable=False, comment="供应商ID")
+    order_id = Column(Integer, ForeignKey("purchase_orders.id"), nullable=False, index=True, comment="采购订单ID")
+    supplier_id = Column(Integer, ForeignKey("suppliers.id"), nullable=False, index=True, comment="供应商ID")
     
     # 基本信息
     receipt_date = Column(Date, nullable=False, comment="收货日期")
@@ -159,9 +172,9 @@ class PurchaseReceiptLine(Base):
     __tablename__ = "purchase_receipt_lines"
     
     id = Column(Integer, primary_key=True, index=True)
-    receipt_id = Column(Integer, ForeignKey("purchase_receipts.id"), nullable=False, comment="收货单ID")
-    order_line_id = Column(Integer, ForeignKey("purchase_order_lines.id"), nullable=False, comment="采购订单明细ID")
-    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, comment="产品ID")
+    receipt_id = Column(Integer, ForeignKey("purchase_receipts.id"), nullable=False, index=True, comment="收货单ID")
+    order_line_id = Column(Integer, ForeignKey("purchase_order_lines.id"), nullable=False, index=True, comment="采购订单明细ID")
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, index=True, comment="产品ID")
     
     # 数量信息
     received_quantity = Column(Numeric(10, 2), nullable=False, comment="收货数量")
@@ -1,16 +1,23 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Numeric, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Numeric, ForeignKey, Index, Computed, event, text
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
+from sqlalchemy.orm.attributes import get_history, set_committed_value
 from database import Base
 
 class ProductCategory(Base):
     """产品分类模型"""
     __tablename__ = "product_categories"
+    __table_args__ = (
+        # 按祖先查询子树: path @> ARRAY[分类ID]
+        Index("ix_product_categories_path", "path", postgresql_using="gin"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     code = Column(String(50), unique=True, index=True, nullable=False, comment="分类编码")
     name = Column(String(100), nullable=False, comment="分类名称")
-    parent_id = Column(Integer, ForeignKey("product_categories.id"), comment="父分类ID")
+    parent_id = Column(Integer, ForeignKey("product_categories.id"), index=True, comment="父分类ID")
+    path = Column(ARRAY(Integer), comment="分类路径(从根分类到本分类的ID)")
     
     # 状态字段
     is_active = Column(Boolean, default=True, comment="是否激活")
@@ -28,15 +35,54 @@ class ProductCategory(Base):
     def __repr__(self):
         return f"<ProductCategory(id={self.id}, code='{self.code}', name='{self.name}')>"
 
+# 分类路径维护：插入或修改父分类时在同一事务中更新本分类及全部子分类的 path
+@event.listens_for(ProductCategory, "after_insert")
+def _set_category_path(mapper, connection, target):
+    path = connection.execute(
+        text(
+            "UPDATE product_categories SET path = COALESCE("
+            "(SELECT p.path FROM product_categories p WHERE p.id = :parent_id), '{}'::integer[]"
+            ") || id WHERE id = :id RETURNING path"
+        ),
+        {"id": target.id, "parent_id": target.parent_id},
+    ).scalar_one()
+    set_committed_value(target, "path", path)
+
+@event.listens_for(ProductCategory, "after_update")
+def _move_category_subtree(mapper, connection, target):
+    if not get_history(target, "parent_id").has_changes():
+        return
+    parent_path = []
+    if target.parent_id is not None:
+        parent_path = connection.execute(
+            text("SELECT path FROM product_categories WHERE id = :id"),
+            {"id": target.parent_id},
+        ).scalar_one()
+        if target.id in parent_path:
+            raise ValueError("不能将分类移动到其自身或子分类下")
+    old_depth = len(target.path or [target.id])
+    connection.execute(
+        text(
+            "UPDATE product_categories "
+            "SET path = CAST(:prefix AS integer[]) || path[:depth \\: array_length(path, 1)] "
+            "WHERE path @> ARRAY[CAST(:id AS integer)]"
+        ),
+        {"prefix": parent_path, "depth": old_depth, "id": target.id},
+    )
+    set_committed_value(target, "path", list(parent_path) + [target.id])
+
 class Product(Base):
     """产品模型"""
     __tablename__ = "products"
+    __table_args__ = (
+        Index("ix_products_search_text", "search_text", postgresql_using="gin", postgresql_ops={"search_text": "gin_trgm_ops"}),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     code = Column(String(50), unique=True, index=True, nullable=False, comment="产品编码")
     name = Column(String(100), nullable=False, comment="产品名称")
     specification = Column(String(200), comment="规格型号")
-    category_id = Column(Integer, ForeignKey("product_categories.id"), comment="分类ID")
+    category_id = Column(Integer, ForeignKey("product_categories.id"), index=True, comment="分类ID")
     
     # 基本信息
     unit = Column(String(20), default="个", comment="计量单位")
@@ -75,6 +121,9 @@ class Product(Base):
     description = Column(Text, comment="产品描述")
     notes = Column(Text, comment="备注")
     
+    # 搜索文本（小写，供 pg_trgm 模糊搜索）
+    search_text = Column(Text, Computed("lower(coalesce(code, '') || ' ' || coalesce(name, '') || ' ' || coalesce(specification, ''))", persisted=True), comment="搜索文本")
+    
     # 关系
     category = relationship("ProductCategory", backref="products")
     
@@ -86,7 +135,7 @@ class BOM(Base):
     __tablename__ = "boms"
     
     id = Column(Integer, primary_key=True, index=True)
-    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, comment="产品ID")
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, index=True, comment="产品ID")
     version = Column(String(20), default="1.0", comment="版本号")
     
     # 状态字段
@@ -111,8 +160,8 @@ class BOMLine(Base):
     __tablename__ = "bom_lines"
     
     id = Column(Integer, primary_key=True, index=True)
-    bom_id = Column(Integer, ForeignKey("boms.id"), nullable=False, comment="BOM ID")
-    material_id = Column(Integer, ForeignKey("products.id"), nullable=False, comment="物料ID")
+    bom_id = Column(Integer, ForeignKey("boms.id"), nullable=False, index=True, comment="BOM ID")
+    material_id = Column(Integer, ForeignKey("products.id"), nullable=False, index=True, comment="物料ID")
     quantity = Column(Numeric(10, 4), nullable=False, comment="用量")
     unit = Column(String(20), comment="单位")
     
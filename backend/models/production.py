@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Numeric, ForeignKey, Date
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Numeric, ForeignKey, Date, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
@@ -6,12 +6,16 @@ from database import Base
 class WorkOrder(Base):
     """工单模型"""
     __tablename__ = "work_orders"
+    __table_args__ = (
+        Index("ix_work_orders_product_status", "product_id", "status"),
+        Index("ix_work_orders_status_start", "status", "planned_start_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     number = Column(String(50), unique=True, index=True, nullable=False, comment="工单号")
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False, comment="产品ID")
-    sales_order_line_id = Column(Integer, ForeignKey("sales_order_lines.id"), comment="销售订单明细ID")
-    bom_id = Column(Integer, ForeignKey("boms.id"), comment="BOM ID")
+    sales_order_line_id = Column(Integer, ForeignKey("sales_order_lines.id"), index=True, comment="销售订单明细ID")
+    bom_id = Column(Integer, ForeignKey("boms.id"), index=True, comment="BOM ID")
     
     # 数量信息
     planned_quantity = Column(Numeric(10, 2), nullable=False, comment="计划数量")
@@ -48,10 +52,13 @@ class WorkOrder(Base):
 class WorkOrderOperation(Base):
     """工单工序模型"""
     __tablename__ = "work_order_operations"
+    __table_args__ = (
+        Index("ix_work_order_operations_order_sequence", "work_order_id", "sequence"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     work_order_id = Column(Integer, ForeignKey("work_orders.id"), nullable=False, comment="工单ID")
-    operation_id = Column(Integer, ForeignKey("operations.id"), nullable=False, comment="工序ID")
+    operation_id = Column(Integer, ForeignKey("operations.id"), nullable=False, index=True, comment="工序ID")
     sequence = Column(Integer, nullable=False, comment="工序序号")
     
     # 时间信息
@@ -91,7 +98,7 @@ class Operation(Base):
     name = Column(String(100), nullable=False, comment="工序名称")
     
     # 工序信息
-    work_center_id = Column(Integer, ForeignKey("work_centers.id"), comment="工作中心ID")
+    work_center_id = Column(Integer, ForeignKey("work_centers.id"), index=True, comment="工作中心ID")
     setup_time = Column(Numeric(8, 2), default=0, comment="准备时间(分钟)")
     cycle_time = Column(Numeric(8, 2), default=0, comment="单件时间(分钟)")
     
@@ -145,8 +152,8 @@ class ProductionRecord(Base):
     __tablename__ = "production_records"
     
     id = Column(Integer, primary_key=True, index=True)
-    work_order_operation_id = Column(Integer, ForeignKey("work_order_operations.id"), nullable=False, comment="工单工序ID")
-    operator_id = Column(Integer, ForeignKey("users.id"), comment="操作员ID")
+    work_order_operation_id = Column(Integer, ForeignKey("work_order_operations.id"), nullable=False, index=True, comment="工单工序ID")
+    operator_id = Column(Integer, ForeignKey("users.id"), index=True, comment="操作员ID")
     
     # 时间信息
     start_time = Column(DateTime, nullable=False, comment="开始时间")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Numeric, ForeignKey, Date
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Numeric, ForeignKey, Date, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
@@ -6,6 +6,10 @@ from database import Base
 class Quotation(Base):
     """报价单模型"""
     __tablename__ = "quotations"
+    __table_args__ = (
+        Index("ix_quotations_customer_date", "customer_id", "quote_date"),
+        Index("ix_quotations_status_date", "status", "quote_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     number = Column(String(50), unique=True, index=True, nullable=False, comment="报价单号")
@@ -44,8 +48,8 @@ class QuotationLine(Base):
     __tablename__ = "quotation_lines"
     
     id = Column(Integer, primary_key=True, index=True)
-    quotation_id = Column(Integer, ForeignKey("quotations.id"), nullable=False, comment="报价单ID")
-    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, comment="产品ID")
+    quotation_id = Column(Integer, ForeignKey("quotations.id"), nullable=False, index=True, comment="报价单ID")
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, index=True, comment="产品ID")
     
     # 数量和价格
     quantity = Column(Numeric(10, 2), nullable=False, comment="数量")
@@ -73,11 +77,15 @@ class QuotationLine(Base):
 class SalesOrder(Base):
     """销售订单模型"""
     __tablename__ = "sales_orders"
+    __table_args__ = (
+        Index("ix_sales_orders_customer_date", "customer_id", "order_date"),
+        Index("ix_sales_orders_status_date", "status", "order_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     number = Column(String(50), unique=True, index=True, nullable=False, comment="订单号")
     customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False, comment="客户ID")
-    quotation_id = Column(Integer, ForeignKey("quotations.id"), comment="关联报价单ID")
+    quotation_id = Column(Integer, ForeignKey("quotations.id"), index=True, comment="关联报价单ID")
     
     # 基本信息
     order_date = Column(Date, nullable=False, comment="订单日期")
@@ -114,9 +122,12 @@ class SalesOrder(Base):
 class SalesOrderLine(Base):
     """销售订单明细模型"""
     __tablename__ = "sales_order_lines"
+    __table_args__ = (
+        Index("ix_sales_order_lines_product_status", "product_id", "status"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("sales_orders.id"), nullable=False, comment="订单ID")
+    order_id = Column(Integer, ForeignKey("sales_orders.id"), nullable=False, index=True, comment="订单ID")
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False, comment="产品ID")
     
     # 数量和价格
@@ -152,8 +163,8 @@ class Delivery(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     number = Column(String(50), unique=True, index=True, nullable=False, comment="发货单号")
-    order_id = Column(Integer, ForeignKey("sales_orders.id"), nullable=False, comment="销售订单ID")
-    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False, comment="客户ID")
+    order_id = Column(Integer, ForeignKey("sales_orders.id"), nullable=False, index=True, comment="销售订单ID")
+    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False, index=True, comment="客户ID")
     
     # 基本信息
     delivery_date = Column(Date, nullable=False, comment="发货日期")
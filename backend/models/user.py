@@ -54,8 +54,8 @@ class UserRole(Base):
     __tablename__ = "user_roles"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, nullable=False, comment="用户ID")
-    role_id = Column(Integer, nullable=False, comment="角色ID")
+    user_id = Column(Integer, nullable=False, index=True, comment="用户ID")
+    role_id = Column(Integer, nullable=False, index=True, comment="角色ID")
     
     # 时间字段
     created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
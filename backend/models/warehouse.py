@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Numeric, ForeignKey, Date
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Numeric, ForeignKey, Date, Index, text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
@@ -37,7 +37,7 @@ class Location(Base):
     __tablename__ = "locations"
     
     id = Column(Integer, primary_key=True, index=True)
-    warehouse_id = Column(Integer, ForeignKey("warehouses.id"), nullable=False, comment="仓库ID")
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id"), nullable=False, index=True, comment="仓库ID")
     code = Column(String(50), index=True, nullable=False, comment="库位编码")
     name = Column(String(100), comment="库位名称")
     
@@ -64,6 +64,11 @@ class Location(Base):
 class Inventory(Base):
     """库存模型"""
     __tablename__ = "inventory"
+    __table_args__ = (
+        # 库存余额唯一键（库位、批次为空时按同一行处理）
+        Index("uq_inventory_balance", "product_id", "warehouse_id", func.coalesce(text("location_id"), 0), func.coalesce(text("batch_number"), ""), unique=True),
+        Index("ix_inventory_warehouse_product", "warehouse_id", "product_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False, comment="产品ID")
@@ -99,6 +104,11 @@ class Inventory(Base):
 class StockMovement(Base):
     """库存移动记录模型"""
     __tablename__ = "stock_movements"
+    __table_args__ = (
+        Index("ix_stock_movements_product_date", "product_id", "movement_date"),
+        Index("ix_stock_movements_warehouse_date", "warehouse_id", "movement_date"),
+        Index("ix_stock_movements_reference", "reference_type", "reference_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False, comment="产品ID")
@@ -136,6 +146,9 @@ class StockMovement(Base):
 class StockTaking(Base):
     """盘点单模型"""
     __tablename__ = "stock_takings"
+    __table_args__ = (
+        Index("ix_stock_takings_warehouse_date", "warehouse_id", "taking_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     number = Column(String(50), unique=True, index=True, nullable=False, comment="盘点单号")
@@ -166,8 +179,8 @@ class StockTakingLine(Base):
     __tablename__ = "stock_taking_lines"
     
     id = Column(Integer, primary_key=True, index=True)
-    taking_id = Column(Integer, ForeignKey("stock_takings.id"), nullable=False, comment="盘点单ID")
-    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, comment="产品ID")
+    taking_id = Column(Integer, ForeignKey("stock_takings.id"), nullable=False, index=True, comment="盘点单ID")
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, index=True, comment="产品ID")
     location_id = Column(Integer, ForeignKey("locations.id"), comment="库位ID")
     
     # 数量信息
@@ -1,5 +1,4 @@
 # 路由模块初始化文件
-print("正在初始化路由模块...")
 
 # 导入所有路由模块
 from . import auth
@@ -10,6 +9,4 @@ from . import sales
 from . import production
 from . import procurement
 from . import warehouse
-from . import finance
-
-print("路由模块初始化完成")
\ No newline at end of file
+from . import finance
\ No newline at end of file
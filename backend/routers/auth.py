@@ -1,18 +1,26 @@
+import logging
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from pydantic import BaseModel
 from database import get_db
 from models.user import User
-from utils.auth import verify_password, create_access_token, verify_token
+from utils.auth import verify_password_async, create_access_token, get_current_user
+from utils.ratelimit import RateLimiter
 from config import settings
 
-print("正在加载认证路由...")
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-security = HTTPBearer()
+
+# 登录限流：按用户名和客户端IP分别计数
+_username_limiter = RateLimiter(
+    settings.LOGIN_RATE_LIMIT_PER_USERNAME, settings.LOGIN_RATE_LIMIT_WINDOW_SECONDS
+)
+_ip_limiter = RateLimiter(
+    settings.LOGIN_RATE_LIMIT_PER_IP, settings.LOGIN_RATE_LIMIT_WINDOW_SECONDS
+)
 
 class LoginRequest(BaseModel):
     username: str
@@ -32,9 +40,23 @@ class UserInfo(BaseModel):
     is_superuser: bool
 
 @router.post("/login", response_model=LoginResponse)
-async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_db)):
+async def login(
+    login_data: LoginRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
     """用户登录"""
-    print(f"用户登录尝试: {login_data.username}")
+    logger.info("用户登录尝试: %s", login_data.username)
+    
+    client_ip = request.client.host if request.client else "unknown"
+    retry_after = _ip_limiter.hit(client_ip) or _username_limiter.hit(login_data.username)
+    if retry_after is not None:
+        logger.warning("登录过于频繁: %s (%s)", login_data.username, client_ip)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="登录尝试过于频繁，请稍后再试",
+            headers={"Retry-After": str(int(retry_after) + 1)},
+        )
     
     # 查找用户
     result = await db.execute(
@@ -43,7 +65,7 @@ async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_db)):
     user = result.scalar_one_or_none()
     
     if not user:
-        print(f"用户不存在: {login_data.username}")
+        logger.warning("用户不存在: %s", login_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误",
@@ -51,15 +73,15 @@ async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_db)):
         )
     
     if not user.is_active:
-        print(f"用户已禁用: {login_data.username}")
+        logger.warning("用户已禁用: %s", login_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户账户已禁用",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    if not verify_password(login_data.password, user.hashed_password):
-        print(f"密码错误: {login_data.username}")
+    if not await verify_password_async(login_data.password, user.hashed_password):
+        logger.warning("密码错误: %s", login_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误",
@@ -78,7 +100,8 @@ async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_db)):
     user.last_login = func.now()
     await db.commit()
     
-    print(f"用户登录成功: {login_data.username}")
+    _username_limiter.reset(login_data.username)
+    logger.info("用户登录成功: %s", login_data.username)
     
     return {
         "access_token": access_token,
@@ -94,40 +117,18 @@ async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_db)):
     }
 
 @router.get("/me", response_model=UserInfo)
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncSession = Depends(get_db)
-):
+async def get_me(current_user: User = Depends(get_current_user)):
     """获取当前用户信息"""
-    # 验证令牌
-    payload = verify_token(credentials.credentials)
-    username = payload.get("sub")
-    
-    # 查找用户
-    result = await db.execute(
-        select(User).where(User.username == username)
-    )
-    user = result.scalar_one_or_none()
-    
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="用户不存在",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
     return UserInfo(
-        id=user.id,
-        username=user.username,
-        email=user.email,
-        full_name=user.full_name,
-        is_active=user.is_active,
-        is_superuser=user.is_superuser
+        id=current_user.id,
+        username=current_user.username,
+        email=current_user.email,
+        full_name=current_user.full_name,
+        is_active=current_user.is_active,
+        is_superuser=current_user.is_superuser
     )
 
 @router.post("/logout")
 async def logout():
     """用户登出"""
-    return {"message": "登出成功"}
-
-print("认证路由加载完成")
\ No newline at end of file
+    return {"message": "登出成功"}
\ No newline at end of file
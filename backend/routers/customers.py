@@ -1,18 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional
+from datetime import datetime
 from database import get_db
+from decimal import Decimal
 from models.customer import Customer
 from models.user import User
-from utils.auth import verify_token
+from services.credit import get_exposure, rebuild_exposures
+from services.search import search_stmt
+from utils.auth import get_current_user
+from utils.unique import insert_unique
+from utils.filters import ListQuery, list_query
+from utils.responses import response_columns, rows_response
 
-print("正在加载客户管理路由...")
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-security = HTTPBearer()
 
 class CustomerCreate(BaseModel):
     code: str
@@ -42,48 +48,52 @@ class CustomerResponse(BaseModel):
     customer_type: str
     level: str
     is_active: bool
-    created_at: str
+    created_at: datetime
     
     class Config:
         from_attributes = True
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncSession = Depends(get_db)
-) -> User:
-    """获取当前用户"""
-    payload = verify_token(credentials.credentials)
-    username = payload.get("sub")
-    
-    result = await db.execute(
-        select(User).where(User.username == username)
-    )
-    user = result.scalar_one_or_none()
-    
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="用户不存在"
-        )
-    
-    return user
+class CustomerCreditResponse(BaseModel):
+    customer_id: int
+    credit_limit: Decimal
+    open_order_amount: Decimal
+    receivable_amount: Decimal
+    exposure: Decimal
+    available: Optional[Decimal]  # 未设置信用额度时为空
+
+CUSTOMER_QUERY = list_query(
+    Customer,
+    filters=("customer_type", "level", "industry", "city", "province", "is_active"),
+    sorts=("code", "name", "level", "created_at"),
+)
 
 @router.get("/", response_model=List[CustomerResponse])
 async def get_customers(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    with_total: bool = False,
+    fields: Optional[str] = None,
+    q: Optional[str] = None,
+    query: ListQuery = Depends(CUSTOMER_QUERY),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取客户列表"""
-    print(f"获取客户列表，跳过: {skip}, 限制: {limit}")
-    
-    result = await db.execute(
-        select(Customer).offset(skip).limit(limit)
+    """获取客户列表（q 按编码、名称、简称、联系人模糊搜索，结果按相关度排序）"""
+    logger.debug("获取客户列表，跳过: %s, 限制: %s", skip, limit)
+    
+    # 搜索结果按相关度排序，使用偏移分页（指定 sort 时按 sort 做键集分页）
+    ranked = bool(q and q.strip())
+    stmt = select(*response_columns(Customer, CustomerResponse, fields))
+    if ranked:
+        stmt = search_stmt(Customer, q, stmt)
+    customers = await query.paginate(
+        db, stmt, Customer.id, response,
+        cursor=cursor, skip=skip, limit=limit, with_total=with_total, ranked=ranked, mappings=True
     )
-    customers = result.scalars().all()
     
-    return [CustomerResponse.model_validate(customer) for customer in customers]
+    return rows_response(customers, response)
 
 @router.post("/", response_model=CustomerResponse)
 async def create_customer(
@@ -92,27 +102,59 @@ async def create_customer(
     db: AsyncSession = Depends(get_db)
 ):
     """创建客户"""
-    print(f"创建客户: {customer_data.name}")
+    logger.info("创建客户: %s", customer_data.name)
     
-    # 检查客户编码是否已存在
-    result = await db.execute(
-        select(Customer).where(Customer.code == customer_data.code)
-    )
-    if result.scalar_one_or_none():
+    # 创建客户，客户编码重复时由唯一索引拒绝
+    customer = await insert_unique(db, Customer, customer_data.model_dump(), [Customer.code], "客户编码已存在")
+    await db.commit()
+    
+    logger.info("客户创建成功: %s", customer.name)
+    return CustomerResponse.model_validate(customer)
+
+@router.post("/credit/rebuild")
+async def rebuild_customer_credit(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """按单据重算全部客户的信用占用"""
+    if not current_user.is_superuser:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="客户编码已存在"
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="权限不足"
         )
     
-    # 创建客户
-    customer = Customer(**customer_data.model_dump())
+    count = await rebuild_exposures(db)
+    logger.info("客户信用占用重算完成: %s", count)
+    return {"message": "客户信用占用重算完成", "customers": count}
+
+@router.get("/{customer_id}/credit", response_model=CustomerCreditResponse)
+async def get_customer_credit(
+    customer_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取客户信用额度及占用"""
+    customer = await db.get(Customer, customer_id)
     
-    db.add(customer)
-    await db.commit()
-    await db.refresh(customer)
+    if not customer:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="客户不存在"
+        )
     
-    print(f"客户创建成功: {customer.name}")
-    return CustomerResponse.model_validate(customer)
+    exposure = await get_exposure(db, customer_id)
+    open_orders = exposure.open_order_amount if exposure else Decimal(0)
+    receivables = exposure.receivable_amount if exposure else Decimal(0)
+    credit_limit = customer.credit_limit or Decimal(0)
+    total = open_orders + receivables
+    return CustomerCreditResponse(
+        customer_id=customer_id,
+        credit_limit=credit_limit,
+        open_order_amount=open_orders,
+        receivable_amount=receivables,
+        exposure=total,
+        available=credit_limit - total if credit_limit else None
+    )
 
 @router.get("/{customer_id}", response_model=CustomerResponse)
 async def get_customer(
@@ -142,7 +184,7 @@ async def update_customer(
     db: AsyncSession = Depends(get_db)
 ):
     """更新客户"""
-    print(f"更新客户: {customer_id}")
+    logger.info("更新客户: %s", customer_id)
     
     result = await db.execute(
         select(Customer).where(Customer.id == customer_id)
@@ -163,7 +205,7 @@ async def update_customer(
     await db.commit()
     await db.refresh(customer)
     
-    print(f"客户更新成功: {customer.name}")
+    logger.info("客户更新成功: %s", customer.name)
     return CustomerResponse.model_validate(customer)
 
 @router.delete("/{customer_id}")
@@ -173,7 +215,7 @@ async def delete_customer(
     db: AsyncSession = Depends(get_db)
 ):
     """删除客户"""
-    print(f"删除客户: {customer_id}")
+    logger.info("删除客户: %s", customer_id)
     
     result = await db.execute(
         select(Customer).where(Customer.id == customer_id)
@@ -189,7 +231,5 @@ async def delete_customer(
     await db.delete(customer)
     await db.commit()
     
-    print(f"客户删除成功: {customer.name}")
-    return {"message": "客户删除成功"}
-
-print("客户管理路由加载完成")
\ No newline at end of file
+    logger.info("客户删除成功: %s", customer.name)
+    return {"message": "客户删除成功"}
\ No newline at end of file
@@ -1,46 +1,67 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import logging
+from fastapi import APIRouter, Depends, File, HTTPException, Response, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
 from pydantic import BaseModel
 from typing import List, Optional
 from decimal import Decimal
-from datetime import date
+from datetime import date, datetime
 from database import get_db
-from models.finance import Invoice, Payment
+from models.finance import AccountPayable, AccountReceivable, Invoice, Payment, PaymentAllocation
 from models.user import User
-from utils.auth import verify_token
+from utils.auth import get_current_user
+from utils.expand import load_document, loaded_fields, parse_expand
+from utils.filters import ListQuery, list_query
+from utils.responses import response_columns, rows_response
+from utils.export import ExportFormat, export_response
+from utils.upload import save_upload
+from utils.unique import insert_unique
+from services.credit import post_invoice, post_payment
+from services.aging import AgingLedger, SnapshotDateError, SnapshotNotFound, get_aging, take_snapshot
+from services.bank_statement import (
+    StatementFormatError, load_open_items, match_lines, post_matches, read_statement_file
+)
+from services.settlement import AllocationError, allocate_explicit, allocate_payments, open_invoice_balance
 
-print("正在加载财务管理路由...")
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-security = HTTPBearer()
 
 class InvoiceCreate(BaseModel):
     number: str
     invoice_type: str  # 销售发票/采购发票
-    partner_id: int  # 客户或供应商ID
+    customer_id: Optional[int] = None  # 销售发票的客户
+    supplier_id: Optional[int] = None  # 采购发票的供应商
+    sales_order_id: Optional[int] = None
+    purchase_order_id: Optional[int] = None
     invoice_date: date
     due_date: Optional[date] = None
     currency: str = "CNY"
     subtotal: Decimal = 0
     tax_amount: Decimal = 0
     total_amount: Decimal = 0
-    status: str = "草稿"
+    status: str = "未付"
 
 class InvoiceResponse(BaseModel):
     id: int
     number: str
     invoice_type: str
-    partner_id: int
+    customer_id: Optional[int]
+    supplier_id: Optional[int]
+    sales_order_id: Optional[int]
+    purchase_order_id: Optional[int]
     invoice_date: date
     due_date: Optional[date]
     currency: str
     subtotal: Decimal
     tax_amount: Decimal
     total_amount: Decimal
+    paid_amount: Decimal
+    outstanding_amount: Decimal
     status: str
-    created_at: str
+    created_at: datetime
     
     class Config:
         from_attributes = True
@@ -48,67 +69,196 @@ class InvoiceResponse(BaseModel):
 class PaymentCreate(BaseModel):
     number: str
     payment_type: str  # 收款/付款
-    partner_id: int
+    customer_id: Optional[int] = None  # 收款的客户
+    supplier_id: Optional[int] = None  # 付款的供应商
+    invoice_id: Optional[int] = None
     payment_date: date
     amount: Decimal
     currency: str = "CNY"
     payment_method: str = "银行转账"
-    reference: Optional[str] = None
-    status: str = "已确认"
+    reference_number: Optional[str] = None
+    status: str = "已付"
 
 class PaymentResponse(BaseModel):
     id: int
     number: str
     payment_type: str
-    partner_id: int
+    customer_id: Optional[int]
+    supplier_id: Optional[int]
+    invoice_id: Optional[int]
     payment_date: date
     amount: Decimal
+    allocated_amount: Optional[Decimal]
     currency: str
     payment_method: str
-    reference: Optional[str]
+    reference_number: Optional[str]
     status: str
-    created_at: str
+    created_at: datetime
     
     class Config:
         from_attributes = True
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncSession = Depends(get_db)
-) -> User:
-    """获取当前用户"""
-    payload = verify_token(credentials.credentials)
-    username = payload.get("sub")
+class AllocationItem(BaseModel):
+    invoice_id: int
+    amount: Decimal
+
+class AllocationResponse(BaseModel):
+    payment_id: int
+    invoice_id: int
+    amount: Decimal
     
-    result = await db.execute(
-        select(User).where(User.username == username)
-    )
-    user = result.scalar_one_or_none()
+    class Config:
+        from_attributes = True
+
+class InvoiceLineResponse(BaseModel):
+    id: int
+    product_id: int
+    quantity: Decimal
+    unit_price: Decimal
+    discount_rate: Decimal
+    line_total: Decimal
+    notes: Optional[str]
     
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="用户不存在"
-        )
+    class Config:
+        from_attributes = True
+
+class PartnerBriefResponse(BaseModel):
+    id: int
+    code: str
+    name: str
+    short_name: Optional[str]
+    
+    class Config:
+        from_attributes = True
+
+class InvoiceDetailResponse(InvoiceResponse):
+    # 以下字段仅在 expand 中指定时返回
+    lines: Optional[List[InvoiceLineResponse]] = None
+    payments: Optional[List[PaymentResponse]] = None
+    allocations: Optional[List[AllocationResponse]] = None
+    customer: Optional[PartnerBriefResponse] = None
+    supplier: Optional[PartnerBriefResponse] = None
+
+# 发票详情可展开的关系
+INVOICE_EXPAND = {
+    "lines": selectinload(Invoice.lines),
+    "payments": selectinload(Invoice.payments),
+    "allocations": selectinload(Invoice.allocations),
+    "customer": joinedload(Invoice.customer),
+    "supplier": joinedload(Invoice.supplier),
+}
+
+class AllocationRunRequest(BaseModel):
+    payment_ids: Optional[List[int]] = None  # 为空时处理全部未核销完的付款
+    oldest_first: bool = True  # 剩余金额按发票从旧到新核销
+
+class AllocationRunResponse(BaseModel):
+    allocations: int
+    payments: int
+    invoices: int
+    amount: Decimal
+
+class BankStatementLineResponse(BaseModel):
+    line_no: int
+    value_date: date
+    amount: Decimal
+    reference: Optional[str]
+    counterparty: Optional[str]
+    description: Optional[str]
+    match_type: Optional[str]  # 已登记收付款/发票号/往来单位+金额/金额，未匹配为空
+    partner_id: Optional[int]
+    invoice_id: Optional[int]
+    payment_id: Optional[int]  # 已登记或本次新建的收付款
+
+class BankStatementResponse(BaseModel):
+    statement_id: str
+    line_count: int
+    matched: int
+    posted: int
+    lines: List[BankStatementLineResponse]
+
+class ReceivableResponse(BaseModel):
+    id: int
+    customer_id: int
+    invoice_id: int
+    original_amount: Decimal
+    outstanding_amount: Decimal
+    invoice_date: date
+    due_date: Optional[date]
+    status: Optional[str]
     
-    return user
+    class Config:
+        from_attributes = True
+
+class PayableResponse(BaseModel):
+    id: int
+    supplier_id: int
+    invoice_id: int
+    original_amount: Decimal
+    outstanding_amount: Decimal
+    invoice_date: date
+    due_date: Optional[date]
+    status: Optional[str]
+    
+    class Config:
+        from_attributes = True
+
+class AgingAmounts(BaseModel):
+    total_amount: Decimal
+    current_amount: Decimal  # 未到期
+    days_1_30: Decimal
+    days_31_60: Decimal
+    days_61_90: Decimal
+    days_over_90: Decimal
+
+class AgingRowResponse(AgingAmounts):
+    partner_id: int  # 客户或供应商ID
+
+class AgingReportResponse(BaseModel):
+    ledger: str
+    as_of: date
+    source: str  # 实时/快照
+    totals: AgingAmounts
+    rows: List[AgingRowResponse]
+
+INVOICE_QUERY = list_query(
+    Invoice,
+    filters=("invoice_type", "status", "customer_id", "supplier_id", "sales_order_id", "purchase_order_id", "invoice_date", "due_date"),
+    sorts=("number", "invoice_date", "due_date", "total_amount", "outstanding_amount"),
+)
 
 @router.get("/invoices", response_model=List[InvoiceResponse])
 async def get_invoices(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    with_total: bool = False,
+    fields: Optional[str] = None,
+    query: ListQuery = Depends(INVOICE_QUERY),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """获取发票列表"""
-    print(f"获取发票列表，跳过: {skip}, 限制: {limit}")
+    logger.debug("获取发票列表，跳过: %s, 限制: %s", skip, limit)
     
-    result = await db.execute(
-        select(Invoice).offset(skip).limit(limit)
+    invoices = await query.paginate(
+        db, select(*response_columns(Invoice, InvoiceResponse, fields)), Invoice.id, response,
+        cursor=cursor, skip=skip, limit=limit, with_total=with_total, mappings=True
     )
-    invoices = result.scalars().all()
     
-    return [InvoiceResponse.model_validate(invoice) for invoice in invoices]
+    return rows_response(invoices, response)
+
+@router.get("/invoices/export")
+async def export_invoices(
+    format: ExportFormat = "ndjson",
+    current_user: User = Depends(get_current_user)
+):
+    """流式导出发票（NDJSON/CSV）"""
+    logger.info("导出发票，格式: %s", format)
+    
+    stmt = select(*Invoice.__table__.columns).order_by(Invoice.id)
+    return export_response(stmt, format, "invoices")
 
 @router.post("/invoices", response_model=InvoiceResponse)
 async def create_invoice(
@@ -117,44 +267,82 @@ async def create_invoice(
     db: AsyncSession = Depends(get_db)
 ):
     """创建发票"""
-    print(f"创建发票: {invoice_data.number}")
+    logger.info("创建发票: %s", invoice_data.number)
     
-    # 检查发票号是否已存在
-    result = await db.execute(
-        select(Invoice).where(Invoice.number == invoice_data.number)
-    )
-    if result.scalar_one_or_none():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="发票号已存在"
-        )
-    
-    # 创建发票
-    invoice = Invoice(**invoice_data.model_dump())
-    
-    db.add(invoice)
+    # 创建发票（发票号重复时由唯一索引拒绝），并在同一事务中更新客户信用占用
+    invoice = await insert_unique(db, Invoice, dict(
+        **invoice_data.model_dump(),
+        paid_amount=0,
+        outstanding_amount=invoice_data.total_amount
+    ), [Invoice.number], "发票号已存在")
+    await post_invoice(db, invoice)
+    await open_invoice_balance(db, invoice)
     await db.commit()
-    await db.refresh(invoice)
     
-    print(f"发票创建成功: {invoice.number}")
+    logger.info("发票创建成功: %s", invoice.number)
     return InvoiceResponse.model_validate(invoice)
 
+@router.get("/invoices/{invoice_id}", response_model=InvoiceDetailResponse)
+async def get_invoice(
+    invoice_id: int,
+    expand: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取发票详情（expand 可展开 lines、payments、allocations、customer、supplier，逗号分隔）"""
+    options = parse_expand(expand, INVOICE_EXPAND)
+    invoice = await load_document(db, Invoice, invoice_id, options)
+    
+    if not invoice:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="发票不存在"
+        )
+    
+    detail = InvoiceDetailResponse.model_validate(loaded_fields(invoice))
+    for items in (detail.lines, detail.payments):
+        if items:
+            items.sort(key=lambda item: item.id)
+    return detail
+
+PAYMENT_QUERY = list_query(
+    Payment,
+    filters=("payment_type", "status", "customer_id", "supplier_id", "invoice_id", "payment_method", "payment_date"),
+    sorts=("number", "payment_date", "amount"),
+)
+
 @router.get("/payments", response_model=List[PaymentResponse])
 async def get_payments(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    with_total: bool = False,
+    fields: Optional[str] = None,
+    query: ListQuery = Depends(PAYMENT_QUERY),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """获取付款记录列表"""
-    print(f"获取付款记录列表，跳过: {skip}, 限制: {limit}")
+    logger.debug("获取付款记录列表，跳过: %s, 限制: %s", skip, limit)
     
-    result = await db.execute(
-        select(Payment).offset(skip).limit(limit)
+    payments = await query.paginate(
+        db, select(*response_columns(Payment, PaymentResponse, fields)), Payment.id, response,
+        cursor=cursor, skip=skip, limit=limit, with_total=with_total, mappings=True
     )
-    payments = result.scalars().all()
     
-    return [PaymentResponse.model_validate(payment) for payment in payments]
+    return rows_response(payments, response)
+
+@router.get("/payments/export")
+async def export_payments(
+    format: ExportFormat = "ndjson",
+    current_user: User = Depends(get_current_user)
+):
+    """流式导出付款记录（NDJSON/CSV）"""
+    logger.info("导出付款记录，格式: %s", format)
+    
+    stmt = select(*Payment.__table__.columns).order_by(Payment.id)
+    return export_response(stmt, format, "payments")
 
 @router.post("/payments", response_model=PaymentResponse)
 async def create_payment(
@@ -163,26 +351,243 @@ async def create_payment(
     db: AsyncSession = Depends(get_db)
 ):
     """创建付款记录"""
-    print(f"创建付款记录: {payment_data.number}")
+    logger.info("创建付款记录: %s", payment_data.number)
     
-    # 检查付款号是否已存在
+    # 创建付款记录（付款号重复时由唯一索引拒绝），并在同一事务中更新客户信用占用
+    payment = await insert_unique(db, Payment, payment_data.model_dump(), [Payment.number], "付款号已存在")
+    await post_payment(db, payment)
+    if payment.invoice_id is not None:
+        await allocate_payments(db, [payment.id], oldest_first=False)
+    await db.commit()
+    await db.refresh(payment)
+    
+    logger.info("付款记录创建成功: %s", payment.number)
+    return PaymentResponse.model_validate(payment)
+
+@router.post("/payments/allocate", response_model=AllocationRunResponse)
+async def run_payment_allocation(
+    run: AllocationRunRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """批量核销付款"""
+    rows = await allocate_payments(db, run.payment_ids, oldest_first=run.oldest_first)
+    await db.commit()
+    
+    logger.info("付款核销完成: %s 条核销明细", len(rows))
+    return AllocationRunResponse(
+        allocations=len(rows),
+        payments=len({r["payment_id"] for r in rows}),
+        invoices=len({r["invoice_id"] for r in rows}),
+        amount=sum((r["amount"] for r in rows), Decimal(0))
+    )
+
+@router.get("/payments/{payment_id}/allocations", response_model=List[AllocationResponse])
+async def get_payment_allocations(
+    payment_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取付款的核销明细"""
     result = await db.execute(
-        select(Payment).where(Payment.number == payment_data.number)
+        select(PaymentAllocation)
+        .where(PaymentAllocation.payment_id == payment_id)
+        .order_by(PaymentAllocation.id)
     )
-    if result.scalar_one_or_none():
+    return [AllocationResponse.model_validate(a) for a in result.scalars().all()]
+
+@router.post("/payments/{payment_id}/allocations", response_model=List[AllocationResponse])
+async def allocate_payment(
+    payment_id: int,
+    items: List[AllocationItem],
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """按指定发票和金额核销付款"""
+    try:
+        rows = await allocate_explicit(db, payment_id, [(i.invoice_id, i.amount) for i in items])
+    except AllocationError as e:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="付款号已存在"
+            detail=str(e)
         )
+    await db.commit()
     
-    # 创建付款记录
-    payment = Payment(**payment_data.model_dump())
+    logger.info("付款核销成功: %s", payment_id)
+    return [AllocationResponse(**r) for r in rows]
+
+RECEIVABLE_QUERY = list_query(
+    AccountReceivable,
+    filters=("customer_id", "invoice_id", "status", "invoice_date", "due_date"),
+    sorts=("invoice_date", "due_date", "outstanding_amount"),
+)
+
+@router.get("/receivables", response_model=List[ReceivableResponse])
+async def get_receivables(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    with_total: bool = False,
+    fields: Optional[str] = None,
+    query: ListQuery = Depends(RECEIVABLE_QUERY),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取应收账款列表"""
+    logger.debug("获取应收账款列表，跳过: %s, 限制: %s", skip, limit)
     
-    db.add(payment)
-    await db.commit()
-    await db.refresh(payment)
+    receivables = await query.paginate(
+        db, select(*response_columns(AccountReceivable, ReceivableResponse, fields)), AccountReceivable.id, response,
+        cursor=cursor, skip=skip, limit=limit, with_total=with_total, mappings=True
+    )
     
-    print(f"付款记录创建成功: {payment.number}")
-    return PaymentResponse.model_validate(payment)
+    return rows_response(receivables, response)
+
+PAYABLE_QUERY = list_query(
+    AccountPayable,
+    filters=("supplier_id", "invoice_id", "status", "invoice_date", "due_date"),
+    sorts=("invoice_date", "due_date", "outstanding_amount"),
+)
+
+@router.get("/payables", response_model=List[PayableResponse])
+async def get_payables(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    with_total: bool = False,
+    fields: Optional[str] = None,
+    query: ListQuery = Depends(PAYABLE_QUERY),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取应付账款列表"""
+    logger.debug("获取应付账款列表，跳过: %s, 限制: %s", skip, limit)
+    
+    payables = await query.paginate(
+        db, select(*response_columns(AccountPayable, PayableResponse, fields)), AccountPayable.id, response,
+        cursor=cursor, skip=skip, limit=limit, with_total=with_total, mappings=True
+    )
+    
+    return rows_response(payables, response)
+
+@router.post("/bank-statements", response_model=BankStatementResponse)
+async def import_bank_statement(
+    file: UploadFile = File(...),
+    post: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """导入银行对账单（CSV 或 MT940），匹配已登记收付款和未结发票
 
-print("财务管理路由加载完成")
\ No newline at end of file
+    post=true 时把按发票号或往来单位+金额匹配上的行批量登记为收付款并核销；
+    否则只返回匹配建议。
+    """
+    logger.info("导入银行对账单: %s", file.filename)
+    
+    path, digest = await save_upload(file, "bank_statements")
+    try:
+        lines = await run_in_threadpool(read_statement_file, path)
+    except StatementFormatError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    items = await load_open_items(db, lines)
+    # 建索引和匹配在线程池中执行以免阻塞事件循环
+    proposals = await run_in_threadpool(match_lines, lines, items)
+    
+    statement_id = digest[:12]
+    posted = []
+    if post:
+        posted = await post_matches(db, proposals, statement_id)
+        await db.commit()
+    
+    matched = sum(1 for p in proposals if p.match_type)
+    logger.info(
+        "银行对账单处理完成: %s 行, 匹配 %s 行, 登记 %s 笔",
+        len(lines), matched, len(posted)
+    )
+    return BankStatementResponse(
+        statement_id=statement_id,
+        line_count=len(lines),
+        matched=matched,
+        posted=len(posted),
+        lines=[
+            BankStatementLineResponse(
+                line_no=p.line.line_no,
+                value_date=p.line.value_date,
+                amount=p.line.amount,
+                reference=p.line.reference,
+                counterparty=p.line.counterparty,
+                description=p.line.description,
+                match_type=p.match_type,
+                partner_id=p.partner_id,
+                invoice_id=p.invoice_id,
+                payment_id=p.payment_id
+            )
+            for p in proposals
+        ]
+    )
+
+@router.get("/aging", response_model=AgingReportResponse)
+async def get_aging_report(
+    ledger: AgingLedger = "receivable",
+    as_of: Optional[date] = None,
+    partner_id: Optional[int] = None,
+    overdue_only: bool = False,
+    skip: int = 0,
+    limit: int = 100,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取应收(receivable)/应付(payable)账龄报表
+
+    as_of 为历史日期时读取当日快照，否则实时计算。
+    """
+    as_of = as_of or date.today()
+    try:
+        source, rows, totals = await get_aging(
+            db, ledger, as_of, partner_id=partner_id, overdue_only=overdue_only,
+            skip=skip, limit=limit
+        )
+    except SnapshotNotFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="该日期没有账龄快照"
+        )
+    
+    return AgingReportResponse(
+        ledger=ledger,
+        as_of=as_of,
+        source=source,
+        totals=AgingAmounts(**totals),
+        rows=[AgingRowResponse(**r) for r in rows]
+    )
+
+@router.post("/aging/snapshots")
+async def create_aging_snapshot(
+    as_of: Optional[date] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """生成（或重新生成）当日的应收/应付账龄快照（as_of 只能是今天）"""
+    if not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="权限不足"
+        )
+    
+    as_of = as_of or date.today()
+    try:
+        count = await take_snapshot(db, as_of)
+    except SnapshotDateError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="只能生成当日的账龄快照，历史快照不能按当前余额重算"
+        )
+    logger.info("账龄快照生成完成: %s, %s 行", as_of, count)
+    return {"message": "账龄快照生成完成", "as_of": as_of, "rows": count}
\ No newline at end of file
@@ -1,109 +1,325 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import exists, select
+from sqlalchemy.orm import joinedload, selectinload
 from pydantic import BaseModel
 from typing import List, Optional
 from decimal import Decimal
-from datetime import date
+from datetime import date, datetime
 from database import get_db
-from models.procurement import PurchaseOrder
+from models.procurement import PurchaseOrder, PurchaseOrderLine, PurchaseReceiptLine, Supplier
 from models.user import User
-from utils.auth import verify_token
+from utils.auth import get_current_user
+from utils.expand import loaded_fields, parse_expand
+from utils.filters import ListQuery, list_query
+from utils.responses import response_columns, rows_response
+from utils.export import ExportFormat, export_response
+from utils.unique import flush_unique, insert_unique
+from services.orders import (
+    LineChangeError, apply_totals, apply_totals_to_values, insert_lines, load_with_lines, replace_lines
+)
+from services.search import search_stmt
 
-print("正在加载采购管理路由...")
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-security = HTTPBearer()
+
+class SupplierResponse(BaseModel):
+    id: int
+    code: str
+    name: str
+    short_name: Optional[str]
+    contact_person: Optional[str]
+    phone: Optional[str]
+    email: Optional[str]
+    address: Optional[str]
+    city: Optional[str]
+    province: Optional[str]
+    supplier_type: Optional[str]
+    level: Optional[str]
+    is_active: bool
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class PurchaseOrderLineCreate(BaseModel):
+    # 替换单据时传入已有明细的ID则原地更新该明细，不传则新增
+    id: Optional[int] = None
+    product_id: int
+    quantity: Decimal
+    unit_price: Decimal
+    discount_rate: Decimal = 0
+    delivery_date: Optional[date] = None
+    notes: Optional[str] = None
+
+class PurchaseOrderLineResponse(BaseModel):
+    id: int
+    product_id: int
+    quantity: Decimal
+    received_quantity: Optional[Decimal]
+    unit_price: Decimal
+    discount_rate: Decimal
+    line_total: Decimal
+    delivery_date: Optional[date]
+    status: Optional[str]
+    notes: Optional[str]
+    
+    class Config:
+        from_attributes = True
 
 class PurchaseOrderCreate(BaseModel):
     number: str
     supplier_id: int
     order_date: date
-    expected_date: Optional[date] = None
+    delivery_date: Optional[date] = None
     currency: str = "CNY"
-    total_amount: Decimal = 0
+    tax_rate: Decimal = 13
+    total_amount: Decimal = 0  # 创建时有明细或替换时由服务端按明细计算
+    payment_terms: Optional[str] = None
     status: str = "待确认"
+    notes: Optional[str] = None
+    lines: List[PurchaseOrderLineCreate] = []
 
 class PurchaseOrderResponse(BaseModel):
     id: int
     number: str
     supplier_id: int
     order_date: date
-    expected_date: Optional[date]
+    delivery_date: Optional[date]
     currency: str
     total_amount: Decimal
     status: str
-    created_at: str
+    created_at: datetime
     
     class Config:
         from_attributes = True
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+class SupplierBriefResponse(BaseModel):
+    id: int
+    code: str
+    name: str
+    short_name: Optional[str]
+    contact_person: Optional[str]
+    phone: Optional[str]
+    
+    class Config:
+        from_attributes = True
+
+class PurchaseReceiptResponse(BaseModel):
+    id: int
+    number: str
+    receipt_date: date
+    delivery_note: Optional[str]
+    status: Optional[str]
+    
+    class Config:
+        from_attributes = True
+
+class OrderInvoiceResponse(BaseModel):
+    id: int
+    number: str
+    invoice_date: date
+    due_date: Optional[date]
+    total_amount: Decimal
+    paid_amount: Decimal
+    outstanding_amount: Decimal
+    status: str
+    
+    class Config:
+        from_attributes = True
+
+class PurchaseOrderDetailResponse(PurchaseOrderResponse):
+    subtotal: Decimal
+    tax_rate: Decimal
+    tax_amount: Decimal
+    payment_terms: Optional[str]
+    notes: Optional[str]
+    lines: List[PurchaseOrderLineResponse]
+    # 以下字段仅在 expand 中指定时返回
+    supplier: Optional[SupplierBriefResponse] = None
+    receipts: Optional[List[PurchaseReceiptResponse]] = None
+    invoices: Optional[List[OrderInvoiceResponse]] = None
+
+# 采购订单详情可展开的关系（明细总是返回）
+PURCHASE_ORDER_EXPAND = {
+    "supplier": joinedload(PurchaseOrder.supplier),
+    "receipts": selectinload(PurchaseOrder.receipts),
+    "invoices": selectinload(PurchaseOrder.invoices),
+}
+
+def _purchase_order_detail(order: PurchaseOrder) -> PurchaseOrderDetailResponse:
+    detail = PurchaseOrderDetailResponse.model_validate(loaded_fields(order))
+    for items in (detail.lines, detail.receipts, detail.invoices):
+        if items:
+            items.sort(key=lambda item: item.id)
+    return detail
+
+SUPPLIER_QUERY = list_query(
+    Supplier,
+    filters=("supplier_type", "level", "industry", "city", "province", "is_active"),
+    sorts=("code", "name", "level", "created_at"),
+)
+
+@router.get("/suppliers", response_model=List[SupplierResponse])
+async def get_suppliers(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    with_total: bool = False,
+    fields: Optional[str] = None,
+    q: Optional[str] = None,
+    query: ListQuery = Depends(SUPPLIER_QUERY),
+    current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
-) -> User:
-    """获取当前用户"""
-    payload = verify_token(credentials.credentials)
-    username = payload.get("sub")
+):
+    """获取供应商列表（q 按编码、名称、简称、联系人模糊搜索，结果按相关度排序）"""
+    logger.debug("获取供应商列表，跳过: %s, 限制: %s", skip, limit)
     
-    result = await db.execute(
-        select(User).where(User.username == username)
+    # 搜索结果按相关度排序，使用偏移分页（指定 sort 时按 sort 做键集分页）
+    ranked = bool(q and q.strip())
+    stmt = select(*response_columns(Supplier, SupplierResponse, fields))
+    if ranked:
+        stmt = search_stmt(Supplier, q, stmt)
+    suppliers = await query.paginate(
+        db, stmt, Supplier.id, response,
+        cursor=cursor, skip=skip, limit=limit, with_total=with_total, ranked=ranked, mappings=True
     )
-    user = result.scalar_one_or_none()
-    
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="用户不存在"
-        )
     
-    return user
+    return rows_response(suppliers, response)
+
+PURCHASE_ORDER_QUERY = list_query(
+    PurchaseOrder,
+    filters=("status", "supplier_id", "order_date", "delivery_date"),
+    sorts=("number", "order_date", "delivery_date", "total_amount"),
+)
 
 @router.get("/purchase-orders", response_model=List[PurchaseOrderResponse])
 async def get_purchase_orders(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    with_total: bool = False,
+    fields: Optional[str] = None,
+    query: ListQuery = Depends(PURCHASE_ORDER_QUERY),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """获取采购订单列表"""
-    print(f"获取采购订单列表，跳过: {skip}, 限制: {limit}")
+    logger.debug("获取采购订单列表，跳过: %s, 限制: %s", skip, limit)
     
-    result = await db.execute(
-        select(PurchaseOrder).offset(skip).limit(limit)
+    orders = await query.paginate(
+        db, select(*response_columns(PurchaseOrder, PurchaseOrderResponse, fields)), PurchaseOrder.id, response,
+        cursor=cursor, skip=skip, limit=limit, with_total=with_total, mappings=True
     )
-    orders = result.scalars().all()
     
-    return [PurchaseOrderResponse.model_validate(order) for order in orders]
+    return rows_response(orders, response)
+
+@router.get("/purchase-orders/export")
+async def export_purchase_orders(
+    format: ExportFormat = "ndjson",
+    current_user: User = Depends(get_current_user)
+):
+    """流式导出采购订单（NDJSON/CSV）"""
+    logger.info("导出采购订单，格式: %s", format)
+    
+    stmt = select(*PurchaseOrder.__table__.columns).order_by(PurchaseOrder.id)
+    return export_response(stmt, format, "purchase_orders")
 
-@router.post("/purchase-orders", response_model=PurchaseOrderResponse)
+@router.post("/purchase-orders", response_model=PurchaseOrderDetailResponse)
 async def create_purchase_order(
     order_data: PurchaseOrderCreate,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """创建采购订单"""
-    print(f"创建采购订单: {order_data.number}")
+    """创建采购订单（可同时提交全部明细，金额由服务端按明细计算）"""
+    logger.info("创建采购订单: %s", order_data.number)
+    
+    # 表头和明细在同一事务中写入，订单号重复时由唯一索引拒绝
+    values = order_data.model_dump(exclude={"lines"})
+    lines = [line.model_dump() for line in order_data.lines]
+    rows = apply_totals_to_values(values, lines) if lines else []
+    
+    order = await insert_unique(db, PurchaseOrder, values, [PurchaseOrder.number], "采购订单号已存在")
+    await insert_lines(db, PurchaseOrderLine, "order_id", order.id, rows)
+    await db.commit()
+    
+    order = await load_with_lines(db, PurchaseOrder, order.id)
+    logger.info("采购订单创建成功: %s, 明细 %s 行", order.number, len(rows))
+    return _purchase_order_detail(order)
+
+@router.get("/purchase-orders/{order_id}", response_model=PurchaseOrderDetailResponse)
+async def get_purchase_order(
+    order_id: int,
+    expand: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取采购订单详情（含明细，expand 可展开 supplier、receipts、invoices，逗号分隔）"""
+    options = parse_expand(expand, PURCHASE_ORDER_EXPAND)
+    order = await load_with_lines(db, PurchaseOrder, order_id, *options)
+    
+    if not order:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="采购订单不存在"
+        )
+    
+    return _purchase_order_detail(order)
+
+@router.put("/purchase-orders/{order_id}", response_model=PurchaseOrderDetailResponse)
+async def replace_purchase_order(
+    order_id: int,
+    order_data: PurchaseOrderCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """替换采购订单的表头和全部明细"""
+    logger.info("替换采购订单: %s", order_id)
     
-    # 检查订单号是否已存在
     result = await db.execute(
-        select(PurchaseOrder).where(PurchaseOrder.number == order_data.number)
+        select(PurchaseOrder).where(PurchaseOrder.id == order_id).with_for_update()
+    )
+    order = result.scalar_one_or_none()
+    
+    if not order:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="采购订单不存在"
+        )
+    
+    received = await db.scalar(
+        select(exists().where(
+            PurchaseOrderLine.order_id == order_id,
+            PurchaseOrderLine.received_quantity > 0
+        ))
     )
-    if result.scalar_one_or_none():
+    if received:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="采购订单号已存在"
+            detail="订单已有收货，不能替换明细"
         )
     
-    # 创建采购订单
-    order = PurchaseOrder(**order_data.model_dump())
+    for field, value in order_data.model_dump(exclude={"lines"}).items():
+        setattr(order, field, value)
+    # 替换时表头金额总是按明细计算（无明细时为0），订单号重复时由唯一索引拒绝
+    rows = apply_totals(order, [line.model_dump() for line in order_data.lines])
+    await flush_unique(db, "采购订单号已存在")
     
-    db.add(order)
+    try:
+        await replace_lines(
+            db, PurchaseOrderLine, "order_id", order_id, rows, [(PurchaseReceiptLine.order_line_id, "收货单")]
+        )
+    except LineChangeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     await db.commit()
-    await db.refresh(order)
     
-    print(f"采购订单创建成功: {order.number}")
-    return PurchaseOrderResponse.model_validate(order)
-
-print("采购管理路由加载完成")
\ No newline at end of file
+    order = await load_with_lines(db, PurchaseOrder, order_id)
+    logger.info("采购订单替换成功: %s, 明细 %s 行", order.number, len(rows))
+    return _purchase_order_detail(order)
\ No newline at end of file
@@ -1,20 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
 from pydantic import BaseModel
 from typing import List, Optional
 from decimal import Decimal
-from datetime import date
+from datetime import date, datetime
 from database import get_db
-from models.production import WorkOrder
+from models.production import WorkOrder, WorkOrderOperation
 from models.user import User
-from utils.auth import verify_token
+from utils.auth import get_current_user
+from utils.unique import insert_unique
+from utils.expand import load_document, loaded_fields, parse_expand
+from utils.filters import ListQuery, list_query
+from utils.responses import response_columns, rows_response
+from services.mrp import load_mrp_input, run_mrp
+from services.scheduling import (
+    CapacityError, Direction, load_busy_intervals, load_schedule_input,
+    reschedule_order, save_schedule, schedule,
+)
 
-print("正在加载生产管理路由...")
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-security = HTTPBearer()
 
 class WorkOrderCreate(BaseModel):
     number: str
@@ -35,48 +45,96 @@ class WorkOrderResponse(BaseModel):
     planned_end_date: Optional[date]
     priority: str
     status: str
-    created_at: str
+    created_at: datetime
     
     class Config:
         from_attributes = True
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncSession = Depends(get_db)
-) -> User:
-    """获取当前用户"""
-    payload = verify_token(credentials.credentials)
-    username = payload.get("sub")
+class ProductBriefResponse(BaseModel):
+    id: int
+    code: str
+    name: str
+    specification: Optional[str]
+    unit: Optional[str]
     
-    result = await db.execute(
-        select(User).where(User.username == username)
-    )
-    user = result.scalar_one_or_none()
+    class Config:
+        from_attributes = True
+
+class ProductionRecordResponse(BaseModel):
+    id: int
+    operator_id: Optional[int]
+    start_time: datetime
+    end_time: Optional[datetime]
+    duration: Optional[Decimal]
+    good_quantity: Optional[Decimal]
+    scrap_quantity: Optional[Decimal]
+    rework_quantity: Optional[Decimal]
+    notes: Optional[str]
     
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="用户不存在"
-        )
+    class Config:
+        from_attributes = True
+
+class WorkOrderOperationResponse(BaseModel):
+    id: int
+    operation_id: int
+    sequence: int
+    planned_start_time: Optional[datetime]
+    planned_end_time: Optional[datetime]
+    actual_start_time: Optional[datetime]
+    actual_end_time: Optional[datetime]
+    planned_quantity: Decimal
+    completed_quantity: Optional[Decimal]
+    scrap_quantity: Optional[Decimal]
+    status: Optional[str]
+    records: List[ProductionRecordResponse]
     
-    return user
+    class Config:
+        from_attributes = True
+
+class WorkOrderDetailResponse(WorkOrderResponse):
+    sales_order_line_id: Optional[int]
+    bom_id: Optional[int]
+    scrap_quantity: Optional[Decimal]
+    actual_start_date: Optional[date]
+    actual_end_date: Optional[date]
+    notes: Optional[str]
+    # 以下字段仅在 expand 中指定时返回
+    product: Optional[ProductBriefResponse] = None
+    operations: Optional[List[WorkOrderOperationResponse]] = None
+
+# 工单详情可展开的关系，operations 连同各工序的报工记录一起加载
+WORK_ORDER_EXPAND = {
+    "product": joinedload(WorkOrder.product),
+    "operations": selectinload(WorkOrder.operations).selectinload(WorkOrderOperation.records),
+}
+
+WORK_ORDER_QUERY = list_query(
+    WorkOrder,
+    filters=("status", "priority", "product_id", "sales_order_line_id", "planned_start_date", "planned_end_date"),
+    sorts=("number", "planned_start_date", "planned_end_date", "priority"),
+)
 
 @router.get("/work-orders", response_model=List[WorkOrderResponse])
 async def get_work_orders(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    with_total: bool = False,
+    fields: Optional[str] = None,
+    query: ListQuery = Depends(WORK_ORDER_QUERY),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """获取工单列表"""
-    print(f"获取工单列表，跳过: {skip}, 限制: {limit}")
+    logger.debug("获取工单列表，跳过: %s, 限制: %s", skip, limit)
     
-    result = await db.execute(
-        select(WorkOrder).offset(skip).limit(limit)
+    work_orders = await query.paginate(
+        db, select(*response_columns(WorkOrder, WorkOrderResponse, fields)), WorkOrder.id, response,
+        cursor=cursor, skip=skip, limit=limit, with_total=with_total, mappings=True
     )
-    work_orders = result.scalars().all()
     
-    return [WorkOrderResponse.model_validate(wo) for wo in work_orders]
+    return rows_response(work_orders, response)
 
 @router.post("/work-orders", response_model=WorkOrderResponse)
 async def create_work_order(
@@ -85,26 +143,144 @@ async def create_work_order(
     db: AsyncSession = Depends(get_db)
 ):
     """创建工单"""
-    print(f"创建工单: {work_order_data.number}")
+    logger.info("创建工单: %s", work_order_data.number)
     
-    # 检查工单号是否已存在
-    result = await db.execute(
-        select(WorkOrder).where(WorkOrder.number == work_order_data.number)
-    )
-    if result.scalar_one_or_none():
+    # 创建工单，工单号重复时由唯一索引拒绝
+    work_order = await insert_unique(db, WorkOrder, work_order_data.model_dump(), [WorkOrder.number], "工单号已存在")
+    await db.commit()
+    
+    logger.info("工单创建成功: %s", work_order.number)
+    return WorkOrderResponse.model_validate(work_order)
+
+@router.get("/work-orders/{work_order_id}", response_model=WorkOrderDetailResponse)
+async def get_work_order(
+    work_order_id: int,
+    expand: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取工单详情（expand 可展开 product、operations（含报工记录），逗号分隔）"""
+    options = parse_expand(expand, WORK_ORDER_EXPAND)
+    work_order = await load_document(db, WorkOrder, work_order_id, options)
+    
+    if not work_order:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="工单不存在"
+        )
+    
+    detail = WorkOrderDetailResponse.model_validate(loaded_fields(work_order))
+    if detail.operations:
+        detail.operations.sort(key=lambda op: (op.sequence, op.id))
+        for op in detail.operations:
+            op.records.sort(key=lambda record: (record.start_time, record.id))
+    return detail
+
+class PlannedOrderResponse(BaseModel):
+    product_id: int
+    quantity: Decimal
+    net_requirement: Decimal
+    release_date: date
+    due_date: date
+    low_level_code: int
+    is_late: bool
+    
+    class Config:
+        from_attributes = True
+
+class MrpRunResponse(BaseModel):
+    product_count: int
+    planned_work_orders: List[PlannedOrderResponse]
+    purchase_suggestions: List[PlannedOrderResponse]
+    
+    class Config:
+        from_attributes = True
+
+@router.post("/mrp/run", response_model=MrpRunResponse)
+async def run_mrp_plan(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """执行物料需求计划，返回计划工单和采购建议（不写入数据库）"""
+    logger.info("执行MRP运算")
+    
+    data = await load_mrp_input(db)
+    try:
+        # 计算量大，放到线程池中执行以免阻塞事件循环
+        result = await run_in_threadpool(run_mrp, data)
+    except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="工单号已存在"
+            detail=str(e)
         )
     
-    # 创建工单
-    work_order = WorkOrder(**work_order_data.model_dump())
+    logger.info(
+        "MRP运算完成: 产品 %s 个, 计划工单 %s 条, 采购建议 %s 条",
+        result.product_count, len(result.planned_work_orders), len(result.purchase_suggestions)
+    )
+    return MrpRunResponse.model_validate(result)
+
+class ScheduleResponse(BaseModel):
+    scheduled_operations: int
+    late_orders: List[int]
+    unscheduled_orders: List[int]
+
+@router.post("/schedule", response_model=ScheduleResponse)
+async def schedule_work_orders(
+    direction: Direction = "forward",
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """对全部已下达工单做有限产能排程并写回工序计划时间
+
+    forward 从当前时间起尽早安排；backward 从工单计划完成日倒排。
+    """
+    logger.info("执行工序排程: %s", direction)
     
-    db.add(work_order)
-    await db.commit()
-    await db.refresh(work_order)
+    try:
+        data = await load_schedule_input(db)
+    except CapacityError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    result = await run_in_threadpool(schedule, data, direction)
+    count = await save_schedule(db, data, result)
     
-    print(f"工单创建成功: {work_order.number}")
-    return WorkOrderResponse.model_validate(work_order)
+    logger.info("工序排程完成: 工序 %s 道, 延期工单 %s 个", count, len(result.late_orders))
+    return ScheduleResponse(
+        scheduled_operations=count,
+        late_orders=result.late_orders,
+        unscheduled_orders=result.unscheduled_orders
+    )
 
-print("生产管理路由加载完成")
\ No newline at end of file
+@router.post("/work-orders/{work_order_id}/reschedule", response_model=ScheduleResponse)
+async def reschedule_work_order(
+    work_order_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """单个工单重排：其他工单计划不变，把本工单工序插入最早的空档"""
+    logger.info("工单重排: %s", work_order_id)
+    
+    try:
+        data = await load_schedule_input(db, [work_order_id])
+    except CapacityError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    if work_order_id not in data.jobs:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="工单不存在或没有待排程的工序"
+        )
+    busy = await load_busy_intervals(db, data, work_order_id)
+    result = reschedule_order(data, work_order_id, busy)
+    count = await save_schedule(db, data, result)
+    
+    return ScheduleResponse(
+        scheduled_operations=count,
+        late_orders=result.late_orders,
+        unscheduled_orders=result.unscheduled_orders
+    )
\ No newline at end of file
@@ -1,19 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from pydantic import BaseModel
 from typing import List, Optional
+from datetime import datetime
 from decimal import Decimal
 from database import get_db
 from models.product import Product, ProductCategory
 from models.user import User
-from utils.auth import verify_token
+from utils.auth import get_current_user
+from utils.unique import insert_unique
+from utils.filters import ListQuery, list_query
+from utils.responses import response_columns, rows_response
+from services.bom import BomCache, get_bom_cache
+from services.search import search_stmt
 
-print("正在加载产品管理路由...")
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-security = HTTPBearer()
 
 class ProductCreate(BaseModel):
     code: str
@@ -43,48 +48,50 @@ class ProductResponse(BaseModel):
     is_sellable: bool
     is_purchasable: bool
     is_manufacturable: bool
-    created_at: str
+    created_at: datetime
     
     class Config:
         from_attributes = True
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncSession = Depends(get_db)
-) -> User:
-    """获取当前用户"""
-    payload = verify_token(credentials.credentials)
-    username = payload.get("sub")
-    
-    result = await db.execute(
-        select(User).where(User.username == username)
-    )
-    user = result.scalar_one_or_none()
-    
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="用户不存在"
-        )
-    
-    return user
+PRODUCT_QUERY = list_query(
+    Product,
+    filters=("product_type", "unit", "is_active", "is_sellable", "is_purchasable", "is_manufacturable"),
+    sorts=("code", "name", "standard_cost", "selling_price", "created_at"),
+)
 
 @router.get("/", response_model=List[ProductResponse])
 async def get_products(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    with_total: bool = False,
+    fields: Optional[str] = None,
+    category_id: Optional[int] = None,
+    q: Optional[str] = None,
+    query: ListQuery = Depends(PRODUCT_QUERY),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取产品列表"""
-    print(f"获取产品列表，跳过: {skip}, 限制: {limit}")
+    """获取产品列表（category_id 过滤包含全部子分类下的产品，q 按编码、名称、规格模糊搜索）"""
+    logger.debug("获取产品列表，跳过: %s, 限制: %s", skip, limit)
     
-    result = await db.execute(
-        select(Product).offset(skip).limit(limit)
+    stmt = select(*response_columns(Product, ProductResponse, fields))
+    if category_id is not None:
+        stmt = stmt.where(Product.category_id.in_(
+            select(ProductCategory.id).where(ProductCategory.path.contains([category_id]))
+        ))
+    
+    # 搜索结果按相关度排序，使用偏移分页（指定 sort 时按 sort 做键集分页）
+    ranked = bool(q and q.strip())
+    if ranked:
+        stmt = search_stmt(Product, q, stmt)
+    products = await query.paginate(
+        db, stmt, Product.id, response,
+        cursor=cursor, skip=skip, limit=limit, with_total=with_total, ranked=ranked, mappings=True
     )
-    products = result.scalars().all()
     
-    return [ProductResponse.model_validate(product) for product in products]
+    return rows_response(products, response)
 
 @router.post("/", response_model=ProductResponse)
 async def create_product(
@@ -93,27 +100,122 @@ async def create_product(
     db: AsyncSession = Depends(get_db)
 ):
     """创建产品"""
-    print(f"创建产品: {product_data.name}")
+    logger.info("创建产品: %s", product_data.name)
+    
+    # 创建产品，产品编码重复时由唯一索引拒绝
+    product = await insert_unique(db, Product, product_data.model_dump(), [Product.code], "产品编码已存在")
+    await db.commit()
+    
+    logger.info("产品创建成功: %s", product.name)
+    return ProductResponse.model_validate(product)
+
+class CategoryCreate(BaseModel):
+    code: str
+    name: str
+    parent_id: Optional[int] = None
+    is_active: bool = True
+    description: Optional[str] = None
+
+class CategoryUpdate(BaseModel):
+    name: Optional[str] = None
+    parent_id: Optional[int] = None
+    is_active: Optional[bool] = None
+    description: Optional[str] = None
+
+class CategoryResponse(BaseModel):
+    id: int
+    code: str
+    name: str
+    parent_id: Optional[int]
+    path: Optional[List[int]]
+    is_active: bool
+    description: Optional[str]
+    
+    class Config:
+        from_attributes = True
+
+@router.get("/categories", response_model=List[CategoryResponse])
+async def get_categories(
+    root_id: Optional[int] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取分类列表（指定 root_id 时返回该分类及其全部子分类），按树的先序排列"""
+    stmt = select(ProductCategory).order_by(ProductCategory.path)
+    if root_id is not None:
+        stmt = stmt.where(ProductCategory.path.contains([root_id]))
+    result = await db.execute(stmt)
+    return [CategoryResponse.model_validate(c) for c in result.scalars().all()]
+
+async def _check_parent(db: AsyncSession, parent_id: Optional[int]) -> None:
+    if parent_id is not None and await db.get(ProductCategory, parent_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="父分类不存在"
+        )
+
+@router.post("/categories", response_model=CategoryResponse)
+async def create_category(
+    category_data: CategoryCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """创建分类"""
+    logger.info("创建分类: %s", category_data.name)
     
-    # 检查产品编码是否已存在
     result = await db.execute(
-        select(Product).where(Product.code == product_data.code)
+        select(ProductCategory).where(ProductCategory.code == category_data.code)
     )
     if result.scalar_one_or_none():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="产品编码已存在"
+            detail="分类编码已存在"
         )
+    await _check_parent(db, category_data.parent_id)
     
-    # 创建产品
-    product = Product(**product_data.model_dump())
-    
-    db.add(product)
+    # 分类路径由模型事件在插入时生成
+    category = ProductCategory(**category_data.model_dump())
+    db.add(category)
     await db.commit()
-    await db.refresh(product)
     
-    print(f"产品创建成功: {product.name}")
-    return ProductResponse.model_validate(product)
+    logger.info("分类创建成功: %s", category.name)
+    return CategoryResponse.model_validate(category)
+
+@router.put("/categories/{category_id}", response_model=CategoryResponse)
+async def update_category(
+    category_id: int,
+    category_data: CategoryUpdate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """更新分类；修改 parent_id 时整棵子树随之移动"""
+    logger.info("更新分类: %s", category_id)
+    
+    category = await db.get(ProductCategory, category_id)
+    if not category:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="分类不存在"
+        )
+    
+    update_data = category_data.model_dump(exclude_unset=True)
+    if "parent_id" in update_data:
+        await _check_parent(db, update_data["parent_id"])
+    for field, value in update_data.items():
+        setattr(category, field, value)
+    
+    try:
+        await db.commit()
+    except ValueError as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    await db.refresh(category)
+    
+    logger.info("分类更新成功: %s", category.name)
+    return CategoryResponse.model_validate(category)
 
 @router.get("/{product_id}", response_model=ProductResponse)
 async def get_product(
@@ -135,4 +237,44 @@ async def get_product(
     
     return ProductResponse.model_validate(product)
 
-print("产品管理路由加载完成")
\ No newline at end of file
+class BomUsageResponse(BaseModel):
+    product_id: int
+    quantity: Decimal
+
+async def _bom_usage(db: AsyncSession, product_id: int, lookup) -> List[BomUsageResponse]:
+    cache = await get_bom_cache(db)
+    try:
+        usage = lookup(cache, product_id)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    return [
+        BomUsageResponse(product_id=pid, quantity=quantity)
+        for pid, quantity in sorted(usage.items())
+    ]
+
+@router.get("/{product_id}/bom/flattened", response_model=List[BomUsageResponse])
+async def get_flattened_bom(
+    product_id: int,
+    leaves_only: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取产品展开到所有层级的物料总用量（每单位产品，含损耗）"""
+    items = await _bom_usage(db, product_id, BomCache.flattened)
+    if leaves_only:
+        # 只保留没有下级BOM的物料（原料），用于成本汇总
+        graph = (await get_bom_cache(db)).graph
+        items = [item for item in items if not graph.components(item.product_id)]
+    return items
+
+@router.get("/{product_id}/where-used", response_model=List[BomUsageResponse])
+async def get_where_used(
+    product_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取直接或间接使用该物料的全部产品，及每单位产品的用量"""
+    return await _bom_usage(db, product_id, BomCache.where_used)
\ No newline at end of file
@@ -1,29 +1,71 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import exists, select
+from sqlalchemy.orm import joinedload, selectinload
 from pydantic import BaseModel
 from typing import List, Optional
 from decimal import Decimal
-from datetime import date
+from datetime import date, datetime
 from database import get_db
-from models.sales import SalesOrder, SalesOrderLine
+from models.sales import Quotation, QuotationLine, SalesOrder, SalesOrderLine
+from models.production import WorkOrder
 from models.user import User
-from utils.auth import verify_token
+from utils.auth import get_current_user
+from utils.expand import loaded_fields, parse_expand
+from utils.filters import ListQuery, list_query
+from utils.responses import response_columns, rows_response
+from utils.export import ExportFormat, export_response
+from utils.unique import flush_unique, insert_unique
+from services.credit import CreditLimitExceeded, order_amount, post_sales_order
+from services.orders import (
+    LineChangeError, apply_totals, apply_totals_to_values, insert_lines, load_with_lines, replace_lines
+)
 
-print("正在加载销售管理路由...")
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-security = HTTPBearer()
+
+class OrderLineCreate(BaseModel):
+    # 替换单据时传入已有明细的ID则原地更新该明细，不传则新增
+    id: Optional[int] = None
+    product_id: int
+    quantity: Decimal
+    unit_price: Decimal
+    discount_rate: Decimal = 0
+    delivery_date: Optional[date] = None
+    notes: Optional[str] = None
+
+class OrderLineResponse(BaseModel):
+    id: int
+    product_id: int
+    quantity: Decimal
+    unit_price: Decimal
+    discount_rate: Decimal
+    line_total: Decimal
+    delivery_date: Optional[date]
+    notes: Optional[str]
+    
+    class Config:
+        from_attributes = True
+
+class SalesOrderLineResponse(OrderLineResponse):
+    delivered_quantity: Optional[Decimal]
+    status: Optional[str]
 
 class SalesOrderCreate(BaseModel):
     number: str
     customer_id: int
+    quotation_id: Optional[int] = None
     order_date: date
     delivery_date: Optional[date] = None
     currency: str = "CNY"
-    total_amount: Decimal = 0
+    tax_rate: Decimal = 13
+    total_amount: Decimal = 0  # 创建时有明细或替换时由服务端按明细计算
+    payment_terms: Optional[str] = None
     status: str = "待确认"
+    notes: Optional[str] = None
+    lines: List[OrderLineCreate] = []
 
 class SalesOrderResponse(BaseModel):
     id: int
@@ -34,87 +76,211 @@ class SalesOrderResponse(BaseModel):
     currency: str
     total_amount: Decimal
     status: str
-    created_at: str
+    created_at: datetime
     
     class Config:
         from_attributes = True
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncSession = Depends(get_db)
-) -> User:
-    """获取当前用户"""
-    payload = verify_token(credentials.credentials)
-    username = payload.get("sub")
+class CustomerBriefResponse(BaseModel):
+    id: int
+    code: str
+    name: str
+    short_name: Optional[str]
+    contact_person: Optional[str]
+    phone: Optional[str]
     
-    result = await db.execute(
-        select(User).where(User.username == username)
-    )
-    user = result.scalar_one_or_none()
+    class Config:
+        from_attributes = True
+
+class DeliveryResponse(BaseModel):
+    id: int
+    number: str
+    delivery_date: date
+    carrier: Optional[str]
+    tracking_number: Optional[str]
+    status: Optional[str]
     
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="用户不存在"
-        )
+    class Config:
+        from_attributes = True
+
+class OrderInvoiceResponse(BaseModel):
+    id: int
+    number: str
+    invoice_date: date
+    due_date: Optional[date]
+    total_amount: Decimal
+    paid_amount: Decimal
+    outstanding_amount: Decimal
+    status: str
     
-    return user
+    class Config:
+        from_attributes = True
+
+class SalesOrderDetailResponse(SalesOrderResponse):
+    quotation_id: Optional[int]
+    subtotal: Decimal
+    tax_rate: Decimal
+    tax_amount: Decimal
+    payment_terms: Optional[str]
+    notes: Optional[str]
+    lines: List[SalesOrderLineResponse]
+    # 以下字段仅在 expand 中指定时返回
+    customer: Optional[CustomerBriefResponse] = None
+    deliveries: Optional[List[DeliveryResponse]] = None
+    invoices: Optional[List[OrderInvoiceResponse]] = None
+
+class QuotationCreate(BaseModel):
+    number: str
+    customer_id: int
+    quote_date: date
+    valid_until: Optional[date] = None
+    currency: str = "CNY"
+    tax_rate: Decimal = 13
+    status: str = "草稿"
+    notes: Optional[str] = None
+    lines: List[OrderLineCreate] = []
+
+class QuotationResponse(BaseModel):
+    id: int
+    number: str
+    customer_id: int
+    quote_date: date
+    valid_until: Optional[date]
+    currency: str
+    subtotal: Decimal
+    tax_rate: Decimal
+    tax_amount: Decimal
+    total_amount: Decimal
+    status: str
+    notes: Optional[str]
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class QuotationDetailResponse(QuotationResponse):
+    lines: List[OrderLineResponse]
+
+# 销售订单详情可展开的关系（明细总是返回）
+SALES_ORDER_EXPAND = {
+    "customer": joinedload(SalesOrder.customer),
+    "deliveries": selectinload(SalesOrder.deliveries),
+    "invoices": selectinload(SalesOrder.invoices),
+}
+
+def _sales_order_detail(order: SalesOrder) -> SalesOrderDetailResponse:
+    detail = SalesOrderDetailResponse.model_validate(loaded_fields(order))
+    for items in (detail.lines, detail.deliveries, detail.invoices):
+        if items:
+            items.sort(key=lambda item: item.id)
+    return detail
+
+def _quotation_detail(quotation: Quotation) -> QuotationDetailResponse:
+    detail = QuotationDetailResponse.model_validate(quotation)
+    detail.lines.sort(key=lambda line: line.id)
+    return detail
+
+SALES_ORDER_QUERY = list_query(
+    SalesOrder,
+    filters=("status", "customer_id", "quotation_id", "order_date", "delivery_date"),
+    sorts=("number", "order_date", "delivery_date", "total_amount"),
+)
 
 @router.get("/orders", response_model=List[SalesOrderResponse])
 async def get_sales_orders(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    with_total: bool = False,
+    fields: Optional[str] = None,
+    query: ListQuery = Depends(SALES_ORDER_QUERY),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """获取销售订单列表"""
-    print(f"获取销售订单列表，跳过: {skip}, 限制: {limit}")
+    logger.debug("获取销售订单列表，跳过: %s, 限制: %s", skip, limit)
     
-    result = await db.execute(
-        select(SalesOrder).offset(skip).limit(limit)
+    orders = await query.paginate(
+        db, select(*response_columns(SalesOrder, SalesOrderResponse, fields)), SalesOrder.id, response,
+        cursor=cursor, skip=skip, limit=limit, with_total=with_total, mappings=True
     )
-    orders = result.scalars().all()
     
-    return [SalesOrderResponse.model_validate(order) for order in orders]
+    return rows_response(orders, response)
+
+@router.get("/orders/export")
+async def export_sales_orders(
+    format: ExportFormat = "ndjson",
+    current_user: User = Depends(get_current_user)
+):
+    """流式导出销售订单（NDJSON/CSV）"""
+    logger.info("导出销售订单，格式: %s", format)
+    
+    stmt = select(*SalesOrder.__table__.columns).order_by(SalesOrder.id)
+    return export_response(stmt, format, "sales_orders")
 
-@router.post("/orders", response_model=SalesOrderResponse)
+@router.post("/orders", response_model=SalesOrderDetailResponse)
 async def create_sales_order(
     order_data: SalesOrderCreate,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """创建销售订单"""
-    print(f"创建销售订单: {order_data.number}")
+    """创建销售订单（可同时提交全部明细，金额由服务端按明细计算）"""
+    logger.info("创建销售订单: %s", order_data.number)
     
-    # 检查订单号是否已存在
-    result = await db.execute(
-        select(SalesOrder).where(SalesOrder.number == order_data.number)
-    )
-    if result.scalar_one_or_none():
+    # 表头、明细和客户信用占用在同一事务中写入，订单号重复时由唯一索引拒绝
+    values = order_data.model_dump(exclude={"lines"})
+    lines = [line.model_dump() for line in order_data.lines]
+    rows = apply_totals_to_values(values, lines) if lines else []
+    
+    order = await insert_unique(db, SalesOrder, values, [SalesOrder.number], "订单号已存在")
+    await insert_lines(db, SalesOrderLine, "order_id", order.id, rows)
+    try:
+        await post_sales_order(db, order)
+    except CreditLimitExceeded as e:
+        await db.rollback()
+        logger.info("销售订单超出信用额度: %s", order_data.number)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="订单号已存在"
+            detail=str(e)
         )
-    
-    # 创建销售订单
-    order = SalesOrder(**order_data.model_dump())
-    
-    db.add(order)
     await db.commit()
-    await db.refresh(order)
     
-    print(f"销售订单创建成功: {order.number}")
-    return SalesOrderResponse.model_validate(order)
+    order = await load_with_lines(db, SalesOrder, order.id)
+    logger.info("销售订单创建成功: %s, 明细 %s 行", order.number, len(rows))
+    return _sales_order_detail(order)
 
-@router.get("/orders/{order_id}", response_model=SalesOrderResponse)
+@router.get("/orders/{order_id}", response_model=SalesOrderDetailResponse)
 async def get_sales_order(
     order_id: int,
+    expand: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取销售订单详情（含明细，expand 可展开 customer、deliveries、invoices，逗号分隔）"""
+    options = parse_expand(expand, SALES_ORDER_EXPAND)
+    order = await load_with_lines(db, SalesOrder, order_id, *options)
+    
+    if not order:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="销售订单不存在"
+        )
+    
+    return _sales_order_detail(order)
+
+@router.put("/orders/{order_id}", response_model=SalesOrderDetailResponse)
+async def replace_sales_order(
+    order_id: int,
+    order_data: SalesOrderCreate,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取销售订单详情"""
+    """替换销售订单的表头和全部明细"""
+    logger.info("替换销售订单: %s", order_id)
+    
     result = await db.execute(
-        select(SalesOrder).where(SalesOrder.id == order_id)
+        select(SalesOrder).where(SalesOrder.id == order_id).with_for_update()
     )
     order = result.scalar_one_or_none()
     
@@ -124,6 +290,147 @@ async def get_sales_order(
             detail="销售订单不存在"
         )
     
-    return SalesOrderResponse.model_validate(order)
+    delivered = await db.scalar(
+        select(exists().where(
+            SalesOrderLine.order_id == order_id,
+            SalesOrderLine.delivered_quantity > 0
+        ))
+    )
+    if delivered:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="订单已有发货，不能替换明细"
+        )
+    
+    previous_amount, previous_status = order_amount(order), order.status
+    for field, value in order_data.model_dump(exclude={"lines"}).items():
+        setattr(order, field, value)
+    # 替换时表头金额总是按明细计算（无明细时为0），订单号重复时由唯一索引拒绝
+    rows = apply_totals(order, [line.model_dump() for line in order_data.lines])
+    await flush_unique(db, "订单号已存在")
+    
+    try:
+        await replace_lines(db, SalesOrderLine, "order_id", order_id, rows, [(WorkOrder.sales_order_line_id, "工单")])
+    except LineChangeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    try:
+        await post_sales_order(db, order, previous_amount, previous_status)
+    except CreditLimitExceeded as e:
+        await db.rollback()
+        logger.info("销售订单超出信用额度: %s", order_data.number)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    await db.commit()
+    
+    order = await load_with_lines(db, SalesOrder, order_id)
+    logger.info("销售订单替换成功: %s, 明细 %s 行", order.number, len(rows))
+    return _sales_order_detail(order)
+
+QUOTATION_QUERY = list_query(
+    Quotation,
+    filters=("status", "customer_id", "quote_date", "valid_until"),
+    sorts=("number", "quote_date", "valid_until", "total_amount"),
+)
+
+@router.get("/quotations", response_model=List[QuotationResponse])
+async def get_quotations(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    with_total: bool = False,
+    fields: Optional[str] = None,
+    query: ListQuery = Depends(QUOTATION_QUERY),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取报价单列表"""
+    logger.debug("获取报价单列表，跳过: %s, 限制: %s", skip, limit)
+    
+    quotations = await query.paginate(
+        db, select(*response_columns(Quotation, QuotationResponse, fields)), Quotation.id, response,
+        cursor=cursor, skip=skip, limit=limit, with_total=with_total, mappings=True
+    )
+    
+    return rows_response(quotations, response)
 
-print("销售管理路由加载完成")
\ No newline at end of file
+@router.post("/quotations", response_model=QuotationDetailResponse)
+async def create_quotation(
+    quotation_data: QuotationCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """创建报价单（含全部明细，金额由服务端按明细计算）"""
+    logger.info("创建报价单: %s", quotation_data.number)
+    
+    values = quotation_data.model_dump(exclude={"lines"})
+    rows = apply_totals_to_values(values, [line.model_dump() for line in quotation_data.lines])
+    
+    quotation = await insert_unique(db, Quotation, values, [Quotation.number], "报价单号已存在")
+    await insert_lines(db, QuotationLine, "quotation_id", quotation.id, rows)
+    await db.commit()
+    
+    quotation = await load_with_lines(db, Quotation, quotation.id)
+    logger.info("报价单创建成功: %s, 明细 %s 行", quotation.number, len(rows))
+    return _quotation_detail(quotation)
+
+@router.get("/quotations/{quotation_id}", response_model=QuotationDetailResponse)
+async def get_quotation(
+    quotation_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取报价单详情（含明细）"""
+    quotation = await load_with_lines(db, Quotation, quotation_id)
+    
+    if not quotation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="报价单不存在"
+        )
+    
+    return _quotation_detail(quotation)
+
+@router.put("/quotations/{quotation_id}", response_model=QuotationDetailResponse)
+async def replace_quotation(
+    quotation_id: int,
+    quotation_data: QuotationCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """替换报价单的表头和全部明细"""
+    logger.info("替换报价单: %s", quotation_id)
+    
+    result = await db.execute(
+        select(Quotation).where(Quotation.id == quotation_id).with_for_update()
+    )
+    quotation = result.scalar_one_or_none()
+    
+    if not quotation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="报价单不存在"
+        )
+    
+    for field, value in quotation_data.model_dump(exclude={"lines"}).items():
+        setattr(quotation, field, value)
+    rows = apply_totals(quotation, [line.model_dump() for line in quotation_data.lines])
+    await flush_unique(db, "报价单号已存在")
+    
+    try:
+        await replace_lines(db, QuotationLine, "quotation_id", quotation_id, rows)
+    except LineChangeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    await db.commit()
+    
+    quotation = await load_with_lines(db, Quotation, quotation_id)
+    logger.info("报价单替换成功: %s, 明细 %s 行", quotation.number, len(rows))
+    return _quotation_detail(quotation)
\ No newline at end of file
@@ -1,17 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_
+from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional
+from datetime import datetime
 from database import get_db
 from models.user import User
-from utils.auth import verify_token, get_password_hash
+from utils.auth import get_current_user, get_password_hash_async, invalidate_user_cache
+from utils.filters import ListQuery, list_query
+from utils.responses import response_columns, rows_response
+from utils.unique import UNIQUE_VIOLATION, insert_or_none
 
-print("正在加载用户管理路由...")
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-security = HTTPBearer()
 
 class UserCreate(BaseModel):
     username: str
@@ -43,48 +47,38 @@ class UserResponse(BaseModel):
     position: Optional[str]
     is_active: bool
     is_superuser: bool
-    created_at: str
+    created_at: datetime
     
     class Config:
         from_attributes = True
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncSession = Depends(get_db)
-) -> User:
-    """获取当前用户"""
-    payload = verify_token(credentials.credentials)
-    username = payload.get("sub")
-    
-    result = await db.execute(
-        select(User).where(User.username == username)
-    )
-    user = result.scalar_one_or_none()
-    
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="用户不存在"
-        )
-    
-    return user
+USER_QUERY = list_query(
+    User,
+    filters=("is_active", "is_superuser", "department"),
+    sorts=("username", "created_at", "last_login"),
+)
 
 @router.get("/", response_model=List[UserResponse])
 async def get_users(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    with_total: bool = False,
+    fields: Optional[str] = None,
+    query: ListQuery = Depends(USER_QUERY),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """获取用户列表"""
-    print(f"获取用户列表，跳过: {skip}, 限制: {limit}")
+    logger.debug("获取用户列表，跳过: %s, 限制: %s", skip, limit)
     
-    result = await db.execute(
-        select(User).offset(skip).limit(limit)
+    users = await query.paginate(
+        db, select(*response_columns(User, UserResponse, fields)), User.id, response,
+        cursor=cursor, skip=skip, limit=limit, with_total=with_total, mappings=True
     )
-    users = result.scalars().all()
     
-    return [UserResponse.model_validate(user) for user in users]
+    return rows_response(users, response)
 
 @router.post("/", response_model=UserResponse)
 async def create_user(
@@ -93,7 +87,7 @@ async def create_user(
     db: AsyncSession = Depends(get_db)
 ):
     """创建用户"""
-    print(f"创建用户: {user_data.username}")
+    logger.info("创建用户: %s", user_data.username)
     
     # 检查权限
     if not current_user.is_superuser:
@@ -102,44 +96,35 @@ async def create_user(
             detail="权限不足"
         )
     
-    # 检查用户名是否已存在
-    result = await db.execute(
-        select(User).where(User.username == user_data.username)
-    )
-    if result.scalar_one_or_none():
+    # 创建用户，用户名重复时 ON CONFLICT 返回空，邮箱重复时由唯一索引抛出异常
+    try:
+        user = await insert_or_none(db, User, dict(
+            username=user_data.username,
+            email=user_data.email,
+            hashed_password=await get_password_hash_async(user_data.password),
+            full_name=user_data.full_name,
+            phone=user_data.phone,
+            department=user_data.department,
+            position=user_data.position,
+            is_active=user_data.is_active,
+            is_superuser=user_data.is_superuser
+        ), [User.username])
+    except IntegrityError as e:
+        if getattr(e.orig, "sqlstate", None) != UNIQUE_VIOLATION:
+            raise
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="用户名已存在"
+            detail="邮箱已存在"
         )
-    
-    # 检查邮箱是否已存在
-    result = await db.execute(
-        select(User).where(User.email == user_data.email)
-    )
-    if result.scalar_one_or_none():
+    if user is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="邮箱已存在"
+            detail="用户名已存在"
         )
-    
-    # 创建用户
-    user = User(
-        username=user_data.username,
-        email=user_data.email,
-        hashed_password=get_password_hash(user_data.password),
-        full_name=user_data.full_name,
-        phone=user_data.phone,
-        department=user_data.department,
-        position=user_data.position,
-        is_active=user_data.is_active,
-        is_superuser=user_data.is_superuser
-    )
-    
-    db.add(user)
     await db.commit()
-    await db.refresh(user)
     
-    print(f"用户创建成功: {user.username}")
+    logger.info("用户创建成功: %s", user.username)
     return UserResponse.model_validate(user)
 
 @router.get("/{user_id}", response_model=UserResponse)
@@ -170,7 +155,7 @@ async def update_user(
     db: AsyncSession = Depends(get_db)
 ):
     """更新用户"""
-    print(f"更新用户: {user_id}")
+    logger.info("更新用户: %s", user_id)
     
     # 检查权限
     if not current_user.is_superuser and current_user.id != user_id:
@@ -197,8 +182,9 @@ async def update_user(
     
     await db.commit()
     await db.refresh(user)
+    invalidate_user_cache(user.username)
     
-    print(f"用户更新成功: {user.username}")
+    logger.info("用户更新成功: %s", user.username)
     return UserResponse.model_validate(user)
 
 @router.delete("/{user_id}")
@@ -208,7 +194,7 @@ async def delete_user(
     db: AsyncSession = Depends(get_db)
 ):
     """删除用户"""
-    print(f"删除用户: {user_id}")
+    logger.info("删除用户: %s", user_id)
     
     # 检查权限
     if not current_user.is_superuser:
@@ -236,8 +222,7 @@ async def delete_user(
     
     await db.delete(user)
     await db.commit()
+    invalidate_user_cache(user.username)
     
-    print(f"用户删除成功: {user.username}")
-    return {"message": "用户删除成功"}
-
-print("用户管理路由加载完成")
\ No newline at end of file
+    logger.info("用户删除成功: %s", user.username)
+    return {"message": "用户删除成功"}
\ No newline at end of file
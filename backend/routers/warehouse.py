@@ -1,33 +1,42 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import json
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from pydantic import BaseModel
+from sqlalchemy import select, insert
+from sqlalchemy.orm import joinedload, selectinload
+from pydantic import BaseModel, ValidationError
 from typing import List, Optional
 from decimal import Decimal
-from datetime import datetime
+from datetime import date, datetime
+from config import settings
 from database import get_db
-from models.warehouse import Inventory, StockMovement
+from models.product import Product
+from models.warehouse import Inventory, StockMovement, StockTaking, Warehouse
 from models.user import User
-from utils.auth import verify_token
+from utils.auth import get_current_user
+from utils.expand import load_document, loaded_fields, parse_expand
+from utils.filters import ListQuery, list_query
+from utils.responses import response_columns, rows_response
+from utils.export import ExportFormat, export_response
+from services.inventory import MOVEMENT_TYPES, post_movements, rebuild_balances
 
-print("正在加载仓库管理路由...")
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-security = HTTPBearer()
 
 class InventoryResponse(BaseModel):
     id: int
     product_id: int
     warehouse_id: int
     location_id: Optional[int]
-    quantity_on_hand: Decimal
-    quantity_reserved: Decimal
-    quantity_available: Decimal
+    quantity: Decimal
+    reserved_quantity: Decimal
+    available_quantity: Decimal
     unit_cost: Optional[Decimal]
+    total_cost: Optional[Decimal]
     batch_number: Optional[str]
-    expiry_date: Optional[datetime]
-    created_at: str
+    expiry_date: Optional[date]
+    created_at: datetime
     
     class Config:
         from_attributes = True
@@ -36,9 +45,10 @@ class StockMovementCreate(BaseModel):
     product_id: int
     warehouse_id: int
     location_id: Optional[int] = None
-    movement_type: str  # 入库/出库
+    movement_type: str  # 入库/出库/调拨/盘点（调拨和盘点的数量带符号）
     quantity: Decimal
     unit_cost: Optional[Decimal] = None
+    batch_number: Optional[str] = None
     reference_type: Optional[str] = None
     reference_id: Optional[int] = None
     notes: Optional[str] = None
@@ -51,69 +61,127 @@ class StockMovementResponse(BaseModel):
     movement_type: str
     quantity: Decimal
     unit_cost: Optional[Decimal]
+    batch_number: Optional[str]
     reference_type: Optional[str]
     reference_id: Optional[int]
     notes: Optional[str]
     movement_date: datetime
-    created_at: str
+    created_at: datetime
     
     class Config:
         from_attributes = True
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncSession = Depends(get_db)
-) -> User:
-    """获取当前用户"""
-    payload = verify_token(credentials.credentials)
-    username = payload.get("sub")
+class WarehouseBriefResponse(BaseModel):
+    id: int
+    code: str
+    name: str
     
-    result = await db.execute(
-        select(User).where(User.username == username)
-    )
-    user = result.scalar_one_or_none()
+    class Config:
+        from_attributes = True
+
+class StockTakingLineResponse(BaseModel):
+    id: int
+    product_id: int
+    location_id: Optional[int]
+    book_quantity: Optional[Decimal]
+    actual_quantity: Optional[Decimal]
+    difference_quantity: Optional[Decimal]
+    batch_number: Optional[str]
+    counter_id: Optional[int]
+    count_date: Optional[datetime]
+    notes: Optional[str]
     
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="用户不存在"
-        )
+    class Config:
+        from_attributes = True
+
+class StockTakingResponse(BaseModel):
+    id: int
+    number: str
+    warehouse_id: int
+    taking_date: date
+    taking_type: Optional[str]
+    status: Optional[str]
+    notes: Optional[str]
+    created_at: datetime
+    # 以下字段仅在 expand 中指定时返回
+    warehouse: Optional[WarehouseBriefResponse] = None
+    lines: Optional[List[StockTakingLineResponse]] = None
     
-    return user
+    class Config:
+        from_attributes = True
+
+# 盘点单详情可展开的关系
+STOCK_TAKING_EXPAND = {
+    "warehouse": joinedload(StockTaking.warehouse),
+    "lines": selectinload(StockTaking.lines),
+}
+
+INVENTORY_QUERY = list_query(
+    Inventory,
+    filters=("product_id", "warehouse_id", "location_id", "batch_number", "expiry_date"),
+    sorts=("product_id", "warehouse_id", "quantity", "available_quantity", "expiry_date"),
+)
 
 @router.get("/inventory", response_model=List[InventoryResponse])
 async def get_inventory(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    with_total: bool = False,
+    fields: Optional[str] = None,
+    query: ListQuery = Depends(INVENTORY_QUERY),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """获取库存列表"""
-    print(f"获取库存列表，跳过: {skip}, 限制: {limit}")
+    logger.debug("获取库存列表，跳过: %s, 限制: %s", skip, limit)
     
-    result = await db.execute(
-        select(Inventory).offset(skip).limit(limit)
+    inventory = await query.paginate(
+        db, select(*response_columns(Inventory, InventoryResponse, fields)), Inventory.id, response,
+        cursor=cursor, skip=skip, limit=limit, with_total=with_total, mappings=True
     )
-    inventory = result.scalars().all()
     
-    return [InventoryResponse.model_validate(inv) for inv in inventory]
+    return rows_response(inventory, response)
+
+STOCK_MOVEMENT_QUERY = list_query(
+    StockMovement,
+    filters=("product_id", "warehouse_id", "movement_type", "reference_type", "reference_id", "movement_date"),
+    sorts=("movement_date", "product_id", "quantity"),
+)
 
 @router.get("/stock-movements", response_model=List[StockMovementResponse])
 async def get_stock_movements(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    with_total: bool = False,
+    fields: Optional[str] = None,
+    query: ListQuery = Depends(STOCK_MOVEMENT_QUERY),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """获取库存移动记录"""
-    print(f"获取库存移动记录，跳过: {skip}, 限制: {limit}")
+    logger.debug("获取库存移动记录，跳过: %s, 限制: %s", skip, limit)
     
-    result = await db.execute(
-        select(StockMovement).offset(skip).limit(limit)
+    movements = await query.paginate(
+        db, select(*response_columns(StockMovement, StockMovementResponse, fields)), StockMovement.id, response,
+        cursor=cursor, skip=skip, limit=limit, with_total=with_total, mappings=True
     )
-    movements = result.scalars().all()
     
-    return [StockMovementResponse.model_validate(mov) for mov in movements]
+    return rows_response(movements, response)
+
+@router.get("/stock-movements/export")
+async def export_stock_movements(
+    format: ExportFormat = "ndjson",
+    current_user: User = Depends(get_current_user)
+):
+    """流式导出库存移动记录（NDJSON/CSV）"""
+    logger.info("导出库存移动记录，格式: %s", format)
+    
+    stmt = select(*StockMovement.__table__.columns).order_by(StockMovement.id)
+    return export_response(stmt, format, "stock_movements")
 
 @router.post("/stock-movements", response_model=StockMovementResponse)
 async def create_stock_movement(
@@ -122,19 +190,211 @@ async def create_stock_movement(
     db: AsyncSession = Depends(get_db)
 ):
     """创建库存移动记录"""
-    print(f"创建库存移动记录: {movement_data.movement_type}")
+    logger.info("创建库存移动记录: %s", movement_data.movement_type)
     
-    # 创建库存移动记录
+    if movement_data.movement_type not in MOVEMENT_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的移动类型"
+        )
+    
+    # 创建库存移动记录，并在同一事务中更新库存余额
     movement = StockMovement(
         **movement_data.model_dump(),
         movement_date=datetime.now()
     )
     
     db.add(movement)
+    await db.flush()
+    await post_movements(db, [movement])
     await db.commit()
     await db.refresh(movement)
     
-    print(f"库存移动记录创建成功: {movement.movement_type}")
+    logger.info("库存移动记录创建成功: %s", movement.movement_type)
     return StockMovementResponse.model_validate(movement)
 
-print("仓库管理路由加载完成")
\ No newline at end of file
+class BulkItemStatus(BaseModel):
+    index: int
+    status: str  # 成功/失败
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class StockMovementBulkResponse(BaseModel):
+    total: int
+    created: int
+    failed: int
+    items: List[BulkItemStatus]
+
+# 批量写入时直接由请求数据生成的列（其余列使用数据库默认值）
+_BULK_COLUMNS = list(StockMovementCreate.model_fields) + ["movement_date"]
+# 多行INSERT每条语句的行数，避免超出驱动参数个数上限
+_BULK_INSERT_CHUNK = 1000
+
+async def _read_bulk_payload(request: Request) -> list:
+    """读取批量请求体：JSON数组或NDJSON（按行流式解析）"""
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type:
+        items, pending = [], b""
+        async for chunk in request.stream():
+            pending += chunk
+            *lines, pending = pending.split(b"\n")
+            items.extend(json.loads(line) for line in lines if line.strip())
+            if len(items) > settings.STOCK_MOVEMENT_BULK_MAX_ITEMS:
+                break
+        if pending.strip():
+            items.append(json.loads(pending))
+        return items
+    
+    payload = await request.json()
+    if not isinstance(payload, list):
+        raise ValueError("请求体必须是数组")
+    return payload
+
+async def _copy_movements(db: AsyncSession, rows: List[dict]) -> None:
+    """通过asyncpg COPY写入库存移动记录（不返回主键）"""
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        StockMovement.__tablename__,
+        records=[tuple(row[column] for column in _BULK_COLUMNS) for row in rows],
+        columns=_BULK_COLUMNS,
+    )
+
+async def _insert_movements(db: AsyncSession, rows: List[dict]) -> List[int]:
+    """通过多行INSERT ... RETURNING写入库存移动记录，返回主键"""
+    ids = []
+    for start in range(0, len(rows), _BULK_INSERT_CHUNK):
+        result = await db.execute(
+            insert(StockMovement)
+            .values(rows[start:start + _BULK_INSERT_CHUNK])
+            .returning(StockMovement.id)
+        )
+        ids.extend(result.scalars().all())
+    return ids
+
+@router.post("/stock-movements/bulk", response_model=StockMovementBulkResponse)
+async def create_stock_movements_bulk(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """批量创建库存移动记录
+
+    请求体为 StockMovementCreate 数组，或 Content-Type 为
+    application/x-ndjson 的逐行记录。所有有效记录及库存余额变动
+    在同一事务中写入，数量达到 STOCK_MOVEMENT_COPY_THRESHOLD 时使用COPY快速通道，
+    响应中按序返回每条记录的处理结果。
+    """
+    try:
+        payload = await _read_bulk_payload(request)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"请求体格式错误: {e}"
+        )
+    
+    if len(payload) > settings.STOCK_MOVEMENT_BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"单次最多提交 {settings.STOCK_MOVEMENT_BULK_MAX_ITEMS} 条记录"
+        )
+    
+    logger.info("批量创建库存移动记录: %s 条", len(payload))
+    
+    items = [BulkItemStatus(index=i, status="成功") for i in range(len(payload))]
+    valid = []
+    for i, raw in enumerate(payload):
+        try:
+            valid.append((i, StockMovementCreate.model_validate(raw)))
+        except ValidationError as e:
+            items[i].status = "失败"
+            items[i].error = "; ".join(err["msg"] for err in e.errors())
+    
+    # 一次查询校验引用的产品和仓库是否存在
+    product_ids = {data.product_id for _, data in valid}
+    warehouse_ids = {data.warehouse_id for _, data in valid}
+    known_products = set((await db.execute(
+        select(Product.id).where(Product.id.in_(product_ids))
+    )).scalars().all()) if product_ids else set()
+    known_warehouses = set((await db.execute(
+        select(Warehouse.id).where(Warehouse.id.in_(warehouse_ids))
+    )).scalars().all()) if warehouse_ids else set()
+    
+    now = datetime.now()
+    rows, row_indexes = [], []
+    for i, data in valid:
+        if data.movement_type not in MOVEMENT_TYPES:
+            items[i].status, items[i].error = "失败", "无效的移动类型"
+        elif data.product_id not in known_products:
+            items[i].status, items[i].error = "失败", "产品不存在"
+        elif data.warehouse_id not in known_warehouses:
+            items[i].status, items[i].error = "失败", "仓库不存在"
+        else:
+            rows.append({**data.model_dump(), "movement_date": now})
+            row_indexes.append(i)
+    
+    if rows:
+        try:
+            if len(rows) >= settings.STOCK_MOVEMENT_COPY_THRESHOLD:
+                await _copy_movements(db, rows)
+            else:
+                for i, movement_id in zip(row_indexes, await _insert_movements(db, rows)):
+                    items[i].id = movement_id
+            await post_movements(db, rows)
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error("批量写入库存移动记录失败: %s", e)
+            for i in row_indexes:
+                items[i].status, items[i].error = "失败", "写入数据库失败"
+            row_indexes = []
+    
+    created = len(row_indexes)
+    logger.info("批量创建库存移动记录完成: 成功 %s 条, 失败 %s 条", created, len(items) - created)
+    return StockMovementBulkResponse(
+        total=len(items),
+        created=created,
+        failed=len(items) - created,
+        items=items
+    )
+
+@router.post("/inventory/rebuild")
+async def rebuild_inventory(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """根据库存移动记录重算全部库存余额（数据修复）"""
+    logger.info("重算库存余额")
+    
+    if not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="权限不足"
+        )
+    
+    count = await rebuild_balances(db)
+    
+    logger.info("库存余额重算完成: %s 行", count)
+    return {"message": "库存余额重算完成", "count": count}
+
+@router.get("/stock-takings/{taking_id}", response_model=StockTakingResponse)
+async def get_stock_taking(
+    taking_id: int,
+    expand: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取盘点单详情（expand 可展开 warehouse、lines，逗号分隔）"""
+    options = parse_expand(expand, STOCK_TAKING_EXPAND)
+    taking = await load_document(db, StockTaking, taking_id, options)
+    
+    if not taking:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="盘点单不存在"
+        )
+    
+    detail = StockTakingResponse.model_validate(loaded_fields(taking))
+    if detail.lines:
+        detail.lines.sort(key=lambda line: line.id)
+    return detail
\ No newline at end of file
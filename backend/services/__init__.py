@@ -0,0 +1 @@
+# 业务服务模块：跨路由复用的领域逻辑
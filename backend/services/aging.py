@@ -0,0 +1,156 @@
+"""应收/应付账龄
+
+账龄按报表日期与到期日（无到期日时取发票日期）之差实时计算，不再逐行
+维护 aging_days/aging_category：aging_query 用一条 GROUP BY 查询和
+SUM(...) FILTER (WHERE ...) 条件聚合，一次扫描未结账款即得到每个往来单位
+各账龄段的金额。
+
+每日快照由 take_snapshot 写入 aging_snapshots（可由定时任务执行
+python -m services.aging snapshot），历史日期的账龄直接读取快照。
+aging_query 读取的是当前未结金额，只能生成当日快照，历史快照一经写入
+不再重算。
+"""
+from datetime import date
+from typing import Literal, Optional, Tuple
+from sqlalchemy import Date, delete, desc, func, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from models.finance import AccountPayable, AccountReceivable, AgingSnapshot
+
+AgingLedger = Literal["receivable", "payable"]
+
+# (列名, 逾期天数下限, 上限)，None 表示不限
+BUCKETS = (
+    ("current_amount", None, 0),
+    ("days_1_30", 1, 30),
+    ("days_31_60", 31, 60),
+    ("days_61_90", 61, 90),
+    ("days_over_90", 91, None),
+)
+AMOUNT_COLUMNS = ("total_amount",) + tuple(name for name, _, _ in BUCKETS)
+
+# 账簿 -> (账款模型, 往来单位列, 已结清状态)
+_LEDGERS = {
+    "receivable": (AccountReceivable, AccountReceivable.customer_id, ("已收", "已核销")),
+    "payable": (AccountPayable, AccountPayable.supplier_id, ("已付", "已核销")),
+}
+
+class SnapshotNotFound(LookupError):
+    """历史日期没有账龄快照"""
+
+class SnapshotDateError(ValueError):
+    """只能生成当日的账龄快照"""
+
+def aging_query(ledger: AgingLedger, as_of: date):
+    """按往来单位汇总截至 as_of 的未结账款账龄"""
+    model, partner, closed = _LEDGERS[ledger]
+    amount = model.outstanding_amount
+    overdue_days = literal(as_of, Date) - func.coalesce(model.due_date, model.invoice_date)
+    columns = [partner.label("partner_id"), func.sum(amount).label("total_amount")]
+    for name, low, high in BUCKETS:
+        conditions = []
+        if low is not None:
+            conditions.append(overdue_days >= low)
+        if high is not None:
+            conditions.append(overdue_days <= high)
+        columns.append(func.coalesce(func.sum(amount).filter(*conditions), 0).label(name))
+    return (
+        select(*columns)
+        .where(amount > 0, model.status.not_in(closed), model.invoice_date <= as_of)
+        .group_by(partner)
+    )
+
+def _snapshot_query(ledger: AgingLedger, as_of: date):
+    return select(
+        AgingSnapshot.partner_id,
+        *(getattr(AgingSnapshot, name) for name in AMOUNT_COLUMNS)
+    ).where(AgingSnapshot.ledger == ledger, AgingSnapshot.snapshot_date == as_of)
+
+async def take_snapshot(db: AsyncSession, as_of: Optional[date] = None) -> int:
+    """写入（或重写）当日的应收、应付账龄快照并提交，返回行数
+
+    未结金额只有当前值，as_of 不是今天时抛出 SnapshotDateError，避免用当前
+    余额覆盖历史快照。
+    """
+    as_of = as_of or date.today()
+    if as_of != date.today():
+        raise SnapshotDateError(as_of)
+    count = 0
+    for ledger in _LEDGERS:
+        await db.execute(
+            delete(AgingSnapshot)
+            .where(AgingSnapshot.ledger == ledger, AgingSnapshot.snapshot_date == as_of)
+        )
+        report = aging_query(ledger, as_of).subquery()
+        result = await db.execute(
+            insert(AgingSnapshot).from_select(
+                ["snapshot_date", "ledger", "partner_id", *AMOUNT_COLUMNS],
+                select(
+                    literal(as_of, Date),
+                    literal(ledger),
+                    report.c.partner_id,
+                    *(report.c[name] for name in AMOUNT_COLUMNS)
+                ),
+            )
+        )
+        count += result.rowcount
+    await db.commit()
+    return count
+
+async def get_aging(
+    db: AsyncSession,
+    ledger: AgingLedger,
+    as_of: Optional[date] = None,
+    partner_id: Optional[int] = None,
+    overdue_only: bool = False,
+    skip: int = 0,
+    limit: int = 100,
+) -> Tuple[str, list, dict]:
+    """读取账龄报表，返回 (数据来源, 按未结总额降序的往来单位行, 合计)
+
+    当日及未来日期实时计算；历史日期读取快照，没有快照时抛出 SnapshotNotFound。
+    """
+    today = date.today()
+    as_of = as_of or today
+    limit = max(1, min(limit, settings.PAGINATION_MAX_LIMIT))
+    if as_of < today:
+        source = "快照"
+        report = _snapshot_query(ledger, as_of).subquery()
+        exists = await db.execute(
+            select(AgingSnapshot.id)
+            .where(AgingSnapshot.ledger == ledger, AgingSnapshot.snapshot_date == as_of)
+            .limit(1)
+        )
+        if exists.first() is None:
+            raise SnapshotNotFound(as_of)
+    else:
+        source = "实时"
+        report = aging_query(ledger, as_of).subquery()
+
+    conditions = []
+    if partner_id is not None:
+        conditions.append(report.c.partner_id == partner_id)
+    if overdue_only:
+        conditions.append(report.c.total_amount > report.c.current_amount)
+
+    rows = await db.execute(
+        select(report)
+        .where(*conditions)
+        .order_by(desc(report.c.total_amount), report.c.partner_id)
+        .offset(max(skip, 0))
+        .limit(limit)
+    )
+    totals = await db.execute(
+        select(*(func.coalesce(func.sum(report.c[name]), 0).label(name) for name in AMOUNT_COLUMNS))
+        .where(*conditions)
+    )
+    return source, [dict(r) for r in rows.mappings().all()], dict(totals.mappings().one())
+
+if __name__ == "__main__":
+    # 命令行生成当日快照: python -m services.aging snapshot
+    from utils.cli import run_command
+
+    async def _snapshot(session) -> str:
+        return f"账龄快照生成完成，共 {await take_snapshot(session)} 行"
+
+    run_command("services.aging", "snapshot", _snapshot)
@@ -0,0 +1,414 @@
+"""银行对账单导入与自动匹配
+
+1. parse_statement 逐行解析对账单文件（CSV 或 MT940 格式文本），不把整个
+   文件读入内存；
+2. load_open_items 用少量批量查询读取未结发票、往来单位名称，以及参考号
+   出现在对账单中的已登记收付款；
+3. match_lines 先把这些数据建成以参考号、发票号、(往来单位, 金额)、金额为键
+   的哈希索引，再对每行对账单做常数次查找，总耗时与对账单行数和未结项数
+   之和成正比，而不是两者之积；
+4. post_matches 锁定所涉发票、按当前未结金额复核后，把可自动入账的匹配
+   批量登记为收付款并核销到对应发票。
+
+金额为正表示收入（对应收款和销售发票），为负表示支出（对应付款和采购发票）。
+"""
+import csv
+import re
+from collections import defaultdict, deque
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+from sqlalchemy import any_, func, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.types import Integer, String
+from models.customer import Customer
+from models.finance import Invoice, Payment
+from models.procurement import Supplier
+from services.credit import CANCELLED, RECEIPT, SALES_INVOICE, adjust_exposure
+from services.settlement import DISBURSEMENT, allocate_payments
+
+# 匹配方式，按可信度从高到低
+MATCH_PAYMENT = "已登记收付款"
+MATCH_INVOICE_NUMBER = "发票号"
+MATCH_PARTNER_AMOUNT = "往来单位+金额"
+MATCH_AMOUNT = "金额"
+# 可自动登记收付款的匹配方式；仅金额相同的匹配需人工确认
+AUTO_POST_MATCHES = (MATCH_INVOICE_NUMBER, MATCH_PARTNER_AMOUNT)
+POST_BATCH_SIZE = 1000
+
+# CSV 表头别名（小写比较）
+_CSV_COLUMNS = {
+    "date": ("日期", "交易日期", "记账日期", "入账日期", "date", "value_date", "booking_date"),
+    "amount": ("金额", "交易金额", "发生额", "amount"),
+    "credit": ("收入", "收入金额", "贷方金额", "贷方发生额", "credit"),
+    "debit": ("支出", "支出金额", "借方金额", "借方发生额", "debit"),
+    "reference": ("参考号", "交易参考号", "流水号", "交易流水号", "reference", "ref"),
+    "counterparty": ("对方户名", "对方名称", "对方账户名称", "对方单位", "counterparty", "payer", "payee"),
+    "description": ("摘要", "用途", "附言", "备注", "description", "memo"),
+}
+_DATE_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%Y%m%d", "%Y.%m.%d")
+# :61:YYMMDD[MMDD](C|D|RC|RD)[资金代码]金额[交易类型]客户参考号[//银行参考号]
+_MT940_61 = re.compile(
+    r"^:61:(\d{6})(\d{4})?(RC|RD|C|D)[A-Z]?(\d+(?:,\d*)?)(?:[A-Z][A-Z0-9]{3})?([^/]*)(?://(.*))?$"
+)
+_TOKEN = re.compile(r"[A-Za-z0-9][A-Za-z0-9\-_/]*")
+
+class StatementFormatError(ValueError):
+    """对账单格式无法识别"""
+
+class StatementLine:
+    """对账单中的一笔交易"""
+
+    __slots__ = ("line_no", "value_date", "amount", "reference", "counterparty", "description")
+
+    def __init__(self, line_no, value_date, amount, reference=None, counterparty=None, description=None):
+        self.line_no = line_no
+        self.value_date = value_date
+        self.amount = amount
+        self.reference = reference or None
+        self.counterparty = counterparty or None
+        self.description = description or None
+
+class OpenInvoice:
+    __slots__ = ("id", "number", "kind", "partner_id", "outstanding", "remaining", "cents")
+
+    def __init__(self, id, number, kind, partner_id, outstanding):
+        self.id = id
+        self.number = number
+        self.kind = kind
+        self.partner_id = partner_id
+        self.outstanding = outstanding
+        # 本批匹配中逐步扣减的剩余金额
+        self.remaining = outstanding
+        self.cents = _cents(outstanding)
+
+class OpenItems:
+    """参与匹配的未结项"""
+
+    def __init__(self):
+        # 按到期日从旧到新排列
+        self.invoices: List[OpenInvoice] = []
+        # (参考号, 收付款类型, 金额, 付款ID)
+        self.payments: List[Tuple[str, str, Decimal, int]] = []
+        # (收付款类型, 规范化名称) -> 往来单位ID
+        self.partners: Dict[Tuple[str, str], int] = {}
+
+class MatchProposal:
+    """一行对账单的匹配结果；未匹配时 match_type 为空"""
+
+    __slots__ = ("line", "match_type", "kind", "partner_id", "invoice_id", "payment_id")
+
+    def __init__(self, line, match_type=None, kind=None, partner_id=None, invoice_id=None, payment_id=None):
+        self.line = line
+        self.match_type = match_type
+        self.kind = kind
+        self.partner_id = partner_id
+        self.invoice_id = invoice_id
+        self.payment_id = payment_id
+
+def _key(text: Optional[str]) -> Optional[str]:
+    """参考号、发票号、名称的规范化形式：去空白、转大写"""
+    if not text:
+        return None
+    return "".join(text.split()).upper() or None
+
+def _cents(amount: Decimal) -> int:
+    """金额的整数分，作哈希键比 Decimal 快得多"""
+    return int(amount.scaleb(2))
+
+def _parse_amount(text: Optional[str]) -> Optional[Decimal]:
+    text = (text or "").strip().replace(",", "").replace("¥", "").replace("￥", "")
+    if not text:
+        return None
+    try:
+        return Decimal(text)
+    except InvalidOperation:
+        raise StatementFormatError(f"无法识别的金额: {text}")
+
+def _parse_date(text: str) -> date:
+    text = text.strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    raise StatementFormatError(f"无法识别的日期: {text}")
+
+def _parse_csv(lines: Iterable[str]) -> Iterator[StatementLine]:
+    reader = csv.reader(lines)
+    header = next(reader, None) or []
+    names = [h.strip().lower() for h in header]
+    columns = {}
+    for field, aliases in _CSV_COLUMNS.items():
+        for alias in aliases:
+            if alias in names:
+                columns[field] = names.index(alias)
+                break
+    if "date" not in columns or not ({"amount", "credit", "debit"} & columns.keys()):
+        raise StatementFormatError("CSV对账单缺少日期或金额列")
+
+    def cell(row, field):
+        index = columns.get(field)
+        return row[index].strip() if index is not None and index < len(row) else None
+
+    for line_no, row in enumerate(reader, start=2):
+        if not any(c.strip() for c in row):
+            continue
+        try:
+            amount = _parse_amount(cell(row, "amount"))
+            if amount is None:
+                amount = (_parse_amount(cell(row, "credit")) or 0) - (_parse_amount(cell(row, "debit")) or 0)
+            value_date = _parse_date(cell(row, "date") or "")
+        except StatementFormatError as e:
+            raise StatementFormatError(f"第 {line_no} 行: {e}")
+        if amount:
+            yield StatementLine(
+                line_no, value_date, amount,
+                cell(row, "reference"), cell(row, "counterparty"), cell(row, "description")
+            )
+
+def _parse_mt940(lines: Iterable[str]) -> Iterator[StatementLine]:
+    current: Optional[StatementLine] = None
+    in_86 = False
+    for line_no, raw in enumerate(lines, start=1):
+        line = raw.rstrip("\r\n")
+        if line.startswith(":61:"):
+            if current:
+                yield current
+            match = _MT940_61.match(line)
+            if not match:
+                raise StatementFormatError(f"第 {line_no} 行: 无法识别的交易记录")
+            value_date = datetime.strptime(match.group(1), "%y%m%d").date()
+            amount = Decimal(match.group(4).replace(",", "."))
+            # C 贷记(收入)、D 借记(支出)，RC/RD 为冲正
+            if match.group(3) in ("D", "RC"):
+                amount = -amount
+            reference = match.group(5).strip()
+            if reference.upper() == "NONREF":
+                reference = match.group(6)
+            current = StatementLine(line_no, value_date, amount, reference)
+            in_86 = False
+        elif line.startswith(":86:") and current:
+            current.description = line[4:].strip()
+            in_86 = True
+        elif line.startswith(":") or line.startswith("-}") or line.startswith("{"):
+            in_86 = False
+        elif in_86 and current:
+            # :86: 字段的续行
+            current.description = f"{current.description} {line.strip()}".strip()
+    if current:
+        yield current
+
+def parse_statement(lines: Iterable[str]) -> Iterator[StatementLine]:
+    """逐行解析对账单，按首个非空行判断是 MT940 还是 CSV"""
+    lines = iter(lines)
+    first = ""
+    for first in lines:
+        if first.strip():
+            break
+    first = first.lstrip("\ufeff")
+    head = [first]
+    if first.lstrip().startswith((":", "{")):
+        return _parse_mt940(_chain(head, lines))
+    return _parse_csv(_chain(head, lines))
+
+def _chain(head: List[str], rest: Iterator[str]) -> Iterator[str]:
+    yield from head
+    yield from rest
+
+def read_statement_file(path: str) -> List[StatementLine]:
+    """解析已保存的对账单文件；非 UTF-8 编码时按 GB18030 重新读取"""
+    try:
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            return list(parse_statement(f))
+    except UnicodeDecodeError:
+        with open(path, encoding="gb18030", newline="") as f:
+            return list(parse_statement(f))
+
+def _kind(amount: Decimal) -> str:
+    return RECEIPT if amount > 0 else DISBURSEMENT
+
+async def load_open_items(db: AsyncSession, lines: List[StatementLine]) -> OpenItems:
+    """读取未结发票、往来单位名称和对账单中出现的参考号对应的收付款"""
+    items = OpenItems()
+    outstanding = Invoice.outstanding_amount
+    result = await db.execute(
+        select(
+            Invoice.id, Invoice.number, Invoice.invoice_type,
+            Invoice.customer_id, Invoice.supplier_id, outstanding
+        )
+        .where(Invoice.status != CANCELLED, outstanding > 0)
+        .order_by(Invoice.due_date.asc().nulls_last(), Invoice.invoice_date, Invoice.id)
+    )
+    for id, number, invoice_type, customer_id, supplier_id, amount in result.all():
+        if invoice_type == SALES_INVOICE:
+            items.invoices.append(OpenInvoice(id, _key(number), RECEIPT, customer_id, amount))
+        else:
+            items.invoices.append(OpenInvoice(id, _key(number), DISBURSEMENT, supplier_id, amount))
+
+    for kind, model in ((RECEIPT, Customer), (DISBURSEMENT, Supplier)):
+        result = await db.execute(select(model.id, model.name, model.short_name))
+        for id, name, short_name in result.all():
+            for text in (short_name, name):
+                if _key(text):
+                    items.partners[(kind, _key(text))] = id
+
+    references = sorted({line.reference for line in lines if line.reference})
+    if references:
+        result = await db.execute(
+            select(Payment.reference_number, Payment.payment_type, Payment.amount, Payment.id)
+            .where(
+                Payment.reference_number == any_(literal(references, ARRAY(String))),
+                Payment.status != CANCELLED,
+            )
+        )
+        items.payments = [(_key(ref), kind, amount, id) for ref, kind, amount, id in result.all()]
+    return items
+
+def match_lines(lines: List[StatementLine], items: OpenItems) -> List[MatchProposal]:
+    """用哈希索引为每行对账单匹配已登记收付款或未结发票
+
+    每张发票的剩余未结金额在本批匹配中逐步扣减，同一未结项不会被重复匹配。
+    """
+    payments: Dict[Tuple[str, str, int], Deque[int]] = defaultdict(deque)
+    for reference, kind, amount, payment_id in items.payments:
+        payments[(reference, kind, _cents(amount))].append(payment_id)
+
+    # 金额索引的每个桶按到期日从新到旧排列，从尾部取最旧的发票
+    by_number: Dict[Tuple[str, str], OpenInvoice] = {}
+    by_partner_amount: Dict[Tuple[str, int, int], List[OpenInvoice]] = {}
+    by_amount: Dict[Tuple[str, int], List[OpenInvoice]] = {}
+    for invoice in reversed(items.invoices):
+        invoice.remaining = invoice.outstanding
+        if invoice.number:
+            by_number.setdefault((invoice.kind, invoice.number), invoice)
+        if invoice.partner_id is not None:
+            by_partner_amount.setdefault((invoice.kind, invoice.partner_id, invoice.cents), []).append(invoice)
+        by_amount.setdefault((invoice.kind, invoice.cents), []).append(invoice)
+
+    def take(bucket: Optional[List[OpenInvoice]]) -> Optional[OpenInvoice]:
+        # 跳过已被本批其他行核销过的发票
+        while bucket and bucket[-1].remaining != bucket[-1].outstanding:
+            bucket.pop()
+        return bucket.pop() if bucket else None
+
+    proposals = []
+    for line in lines:
+        kind = _kind(line.amount)
+        amount = abs(line.amount)
+        cents = _cents(amount)
+        proposal = MatchProposal(line, kind=kind)
+        proposals.append(proposal)
+        proposal.partner_id = items.partners.get((kind, _key(line.counterparty)))
+
+        reference = _key(line.reference)
+        bucket = payments.get((reference, kind, cents)) if reference else None
+        if bucket:
+            proposal.match_type = MATCH_PAYMENT
+            proposal.payment_id = bucket.popleft()
+            continue
+
+        invoice = None
+        text = " ".join(t for t in (line.reference, line.description) if t)
+        for token in _TOKEN.findall(text):
+            candidate = by_number.get((kind, token.upper()))
+            if candidate and 0 < amount <= candidate.remaining:
+                invoice = candidate
+                proposal.match_type = MATCH_INVOICE_NUMBER
+                break
+        if invoice is None and proposal.partner_id is not None:
+            invoice = take(by_partner_amount.get((kind, proposal.partner_id, cents)))
+            if invoice:
+                proposal.match_type = MATCH_PARTNER_AMOUNT
+        if invoice is None:
+            bucket = by_amount.get((kind, cents))
+            # 仅当金额唯一对应一张未结发票时才提出建议
+            if bucket is not None and len(bucket) == 1:
+                invoice = take(bucket)
+                if invoice:
+                    proposal.match_type = MATCH_AMOUNT
+        if invoice:
+            invoice.remaining -= amount
+            proposal.invoice_id = invoice.id
+            proposal.partner_id = invoice.partner_id
+    return proposals
+
+async def _lock_open_amounts(db: AsyncSession, invoice_ids: Iterable[int]) -> Dict[int, Decimal]:
+    """按ID顺序锁定发票，返回其中未取消发票的当前未结金额"""
+    ids = sorted(invoice_ids)
+    if not ids:
+        return {}
+    result = await db.execute(
+        select(Invoice.id, func.coalesce(Invoice.outstanding_amount, 0))
+        .where(Invoice.id == any_(literal(ids, ARRAY(Integer))), Invoice.status != CANCELLED)
+        .order_by(Invoice.id)
+        .with_for_update()
+    )
+    return {id: amount for id, amount in result.all()}
+
+async def post_matches(
+    db: AsyncSession,
+    proposals: List[MatchProposal],
+    statement_id: str,
+) -> List[int]:
+    """把可自动入账的匹配登记为收付款并核销到发票（不提交事务），返回新建的付款ID
+
+    匹配使用的是 load_open_items 读取时的未结金额，登记前先按ID顺序锁定所涉
+    发票并按当前未结金额复核：期间已被其他收付款冲减、金额已不足的行不登记，
+    保留为匹配建议（payment_id 为空）。
+    付款单号由对账单摘要和行号生成，重复导入同一文件不会重复登记。
+    """
+    candidates = [p for p in proposals if p.match_type in AUTO_POST_MATCHES and p.partner_id is not None]
+    open_amounts = await _lock_open_amounts(db, {p.invoice_id for p in candidates if p.invoice_id is not None})
+    rows = []
+    for p in candidates:
+        line = p.line
+        if p.invoice_id is not None:
+            remaining = open_amounts.get(p.invoice_id, Decimal(0))
+            if abs(line.amount) > remaining:
+                continue
+            open_amounts[p.invoice_id] = remaining - abs(line.amount)
+        rows.append({
+            "number": f"BS{statement_id}-{line.line_no}",
+            "payment_type": p.kind,
+            "customer_id": p.partner_id if p.kind == RECEIPT else None,
+            "supplier_id": p.partner_id if p.kind == DISBURSEMENT else None,
+            "invoice_id": p.invoice_id,
+            "payment_date": line.value_date,
+            "amount": abs(line.amount),
+            "allocated_amount": 0,
+            "payment_method": "银行转账",
+            "reference_number": line.reference,
+            "status": "已付",
+            "notes": line.description,
+        })
+    if not rows:
+        return []
+
+    # 分批写入，避免单条语句的绑定参数过多
+    created = []
+    for start in range(0, len(rows), POST_BATCH_SIZE):
+        result = await db.execute(
+            insert(Payment)
+            .values(rows[start:start + POST_BATCH_SIZE])
+            .on_conflict_do_nothing(index_elements=[Payment.number])
+            .returning(Payment.id, Payment.number, Payment.customer_id, Payment.payment_type, Payment.amount)
+        )
+        created.extend(result.all())
+
+    by_number = {f"BS{statement_id}-{p.line.line_no}": p for p in proposals}
+    # 客户收款按客户汇总后更新信用占用，每个客户一条语句
+    receipts: Dict[int, Decimal] = defaultdict(Decimal)
+    for payment_id, number, customer_id, payment_type, amount in created:
+        by_number[number].payment_id = payment_id
+        if payment_type == RECEIPT and customer_id is not None:
+            receipts[customer_id] += amount
+    for customer_id in sorted(receipts):
+        await adjust_exposure(db, customer_id, receivables=-receipts[customer_id])
+
+    ids = [row[0] for row in created]
+    if ids:
+        await allocate_payments(db, ids, oldest_first=False)
+    return ids
+
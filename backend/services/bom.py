@@ -0,0 +1,258 @@
+"""物料清单（BOM）结构
+
+一次性加载全部有效 BOM 及其明细，构造内存中的 产品 → 物料 有向图，
+供 MRP 等需要多层展开的计算使用，避免逐层逐个组件查询数据库。
+
+BomCache 在此基础上提供展开后的多层用量（某产品总共消耗哪些物料）
+和反查索引（某物料被哪些产品使用），结果按需计算并缓存在进程内。
+通过 ORM 提交的 BOM/BOMLine 变更会使相关产品失效，下次访问时
+只重新加载这些产品的 BOM；其他进程的修改依靠 BOM_CACHE_TTL_SECONDS
+定期全量重载。
+"""
+import logging
+import time
+from collections import defaultdict, deque
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from config import settings
+from models.product import BOM, BOMLine
+
+logger = logging.getLogger(__name__)
+
+# (物料ID, 含损耗的单位用量)
+BomEdge = Tuple[int, Decimal]
+
+def effective_quantity(quantity, scrap_rate) -> Decimal:
+    """单位用量按损耗率(%)放大"""
+    return Decimal(quantity) * (1 + Decimal(scrap_rate or 0) / 100)
+
+class BomGraph:
+    """有效 BOM 构成的产品结构图"""
+
+    __slots__ = ("bom_of", "lines")
+
+    def __init__(self):
+        # 产品ID -> 当前生效的 BOM ID
+        self.bom_of: Dict[int, int] = {}
+        # BOM ID -> 明细边列表
+        self.lines: Dict[int, List[BomEdge]] = defaultdict(list)
+
+    def components(self, product_id: int, bom_id: int = None) -> List[BomEdge]:
+        """产品的直接组件；指定的 BOM 无效时使用产品当前生效的 BOM"""
+        if bom_id is None or bom_id not in self.lines:
+            bom_id = self.bom_of.get(product_id)
+        return self.lines.get(bom_id, [])
+
+    def low_level_codes(self) -> Dict[int, int]:
+        """计算低层码：每个产品在所有结构中出现的最深层级（成品为0）
+
+        BOM 存在循环引用时抛出 ValueError。
+        """
+        indegree: Dict[int, int] = defaultdict(int)
+        nodes = set(self.bom_of)
+        for product_id in self.bom_of:
+            for material_id, _ in self.components(product_id):
+                indegree[material_id] += 1
+                nodes.add(material_id)
+
+        codes = {node: 0 for node in nodes}
+        queue = deque(node for node in nodes if not indegree[node])
+        visited = 0
+        while queue:
+            product_id = queue.popleft()
+            visited += 1
+            for material_id, _ in self.components(product_id):
+                codes[material_id] = max(codes[material_id], codes[product_id] + 1)
+                indegree[material_id] -= 1
+                if not indegree[material_id]:
+                    queue.append(material_id)
+        if visited < len(nodes):
+            raise ValueError("BOM存在循环引用")
+        return codes
+
+def _bom_query(*criteria):
+    # 同一产品有多个有效 BOM 时，按此顺序最后出现的一个生效
+    return (
+        select(BOM.id, BOM.product_id)
+        .where(BOM.is_active.is_(True), *criteria)
+        .order_by(BOM.product_id, BOM.effective_date.asc().nulls_first(), BOM.id)
+    )
+
+def _line_query(*criteria):
+    return (
+        select(BOMLine.bom_id, BOMLine.material_id, BOMLine.quantity, BOMLine.scrap_rate)
+        .where(*criteria)
+        .order_by(BOMLine.bom_id, BOMLine.operation_sequence, BOMLine.id)
+    )
+
+async def load_bom_graph(db: AsyncSession) -> BomGraph:
+    """两条查询加载全部有效 BOM 及明细
+
+    同一产品有多个有效 BOM 时，取生效日期最晚（相同则ID最大）的一个。
+    """
+    graph = BomGraph()
+    for bom_id, product_id in await db.execute(_bom_query()):
+        graph.bom_of[product_id] = bom_id
+
+    lines = await db.execute(
+        _line_query(BOM.is_active.is_(True)).join(BOM, BOM.id == BOMLine.bom_id)
+    )
+    for bom_id, material_id, quantity, scrap_rate in lines:
+        graph.lines[bom_id].append((material_id, effective_quantity(quantity, scrap_rate)))
+    return graph
+
+# 物料ID/产品ID -> 单位用量
+Usage = Dict[int, Decimal]
+
+class BomCache:
+    """多层展开用量与反查（where-used）缓存
+
+    flattened(p)[m] 与 where_used(m)[p] 均表示生产一个 p 需要的 m 的总量
+    （各路径用量相乘后累加，已含损耗）。BOM 结构创建后不再修改，更新时
+    生成新实例，已取得旧实例的调用方（如线程池中的 MRP）不受影响。
+    """
+
+    def __init__(self, graph: BomGraph, flat: Dict[int, Usage] = None,
+                 where_used: Dict[int, Usage] = None):
+        self.graph = graph
+        self.loaded_at = time.monotonic()
+        # 物料ID -> [(直接上级产品ID, 单位用量)]
+        self.parents: Dict[int, List[BomEdge]] = defaultdict(list)
+        for product_id in graph.bom_of:
+            for material_id, quantity in graph.components(product_id):
+                self.parents[material_id].append((product_id, quantity))
+        self._flat: Dict[int, Usage] = flat or {}
+        self._where_used: Dict[int, Usage] = where_used or {}
+
+    def _expand(self, node: int, edges, memo: Dict[int, Usage], visiting: Set[int]) -> Usage:
+        cached = memo.get(node)
+        if cached is not None:
+            return cached
+        if node in visiting:
+            raise ValueError("BOM存在循环引用")
+        visiting.add(node)
+        usage: Usage = defaultdict(Decimal)
+        for other, quantity in edges(node):
+            usage[other] += quantity
+            for further, further_quantity in self._expand(other, edges, memo, visiting).items():
+                usage[further] += quantity * further_quantity
+        visiting.discard(node)
+        memo[node] = dict(usage)
+        return memo[node]
+
+    def flattened(self, product_id: int) -> Usage:
+        """产品展开到所有层级后每单位消耗的各物料总量"""
+        return self._expand(product_id, self.graph.components, self._flat, set())
+
+    def where_used(self, material_id: int) -> Usage:
+        """直接或间接使用该物料的全部产品，及每单位产品消耗的该物料总量"""
+        return self._expand(material_id, lambda m: self.parents.get(m, ()), self._where_used, set())
+
+    async def refreshed(self, db: AsyncSession, product_ids: Set[int]) -> "BomCache":
+        """重新加载指定产品的 BOM，返回新的缓存实例
+
+        只丢弃受影响的展开结果：这些产品及其所有上级的 flattened，
+        以及其新旧下级物料的 where_used。
+        """
+        stale_flat = set(product_ids)
+        stale_where_used = set()
+        for product_id in product_ids:
+            stale_flat.update(self.where_used(product_id))
+            stale_where_used.update(self.flattened(product_id))
+
+        graph = BomGraph()
+        graph.bom_of = {
+            product_id: bom_id for product_id, bom_id in self.graph.bom_of.items()
+            if product_id not in product_ids
+        }
+        kept_boms = set(graph.bom_of.values())
+        graph.lines.update(
+            (bom_id, edges) for bom_id, edges in self.graph.lines.items() if bom_id in kept_boms
+        )
+        for bom_id, product_id in await db.execute(_bom_query(BOM.product_id.in_(product_ids))):
+            graph.bom_of[product_id] = bom_id
+        new_bom_ids = [graph.bom_of[p] for p in product_ids if p in graph.bom_of]
+        if new_bom_ids:
+            for bom_id, material_id, quantity, scrap_rate in await db.execute(
+                _line_query(BOMLine.bom_id.in_(new_bom_ids))
+            ):
+                graph.lines[bom_id].append((material_id, effective_quantity(quantity, scrap_rate)))
+
+        for product_id in product_ids:
+            for material_id, _ in graph.components(product_id):
+                stale_where_used.add(material_id)
+                stale_where_used.update(self.flattened(material_id))
+
+        return BomCache(
+            graph,
+            flat={k: v for k, v in self._flat.items() if k not in stale_flat},
+            where_used={k: v for k, v in self._where_used.items() if k not in stale_where_used},
+        )
+
+_cache: Optional[BomCache] = None
+# 已提交变更、等待重新加载的 BOM ID 和产品ID
+_dirty_boms: Set[int] = set()
+_dirty_products: Set[int] = set()
+
+def invalidate_bom_cache(product_ids: Optional[Iterable[int]] = None) -> None:
+    """使指定产品的 BOM 缓存失效；不传参数时下次访问全量重载"""
+    global _cache
+    if product_ids is None:
+        _cache = None
+        _dirty_boms.clear()
+        _dirty_products.clear()
+    else:
+        _dirty_products.update(product_ids)
+
+async def get_bom_cache(db: AsyncSession) -> BomCache:
+    """获取 BOM 缓存，按需全量加载或增量刷新失效的产品"""
+    global _cache
+    cache = _cache
+    if cache is None or time.monotonic() - cache.loaded_at > settings.BOM_CACHE_TTL_SECONDS:
+        _dirty_boms.clear()
+        _dirty_products.clear()
+        cache = _cache = BomCache(await load_bom_graph(db))
+        logger.debug("BOM缓存已加载: %s 个产品", len(cache.graph.bom_of))
+        return cache
+
+    if _dirty_boms or _dirty_products:
+        bom_ids, product_ids = set(_dirty_boms), set(_dirty_products)
+        _dirty_boms.difference_update(bom_ids)
+        _dirty_products.difference_update(product_ids)
+        if bom_ids:
+            product_ids.update((await db.execute(
+                select(BOM.product_id).where(BOM.id.in_(bom_ids))
+            )).scalars().all())
+        loaded_at = cache.loaded_at
+        cache = await cache.refreshed(db, product_ids)
+        # 增量刷新不延长全量重载周期
+        cache.loaded_at = loaded_at
+        if _cache is not None:
+            _cache = cache
+        logger.debug("BOM缓存已刷新: %s 个产品", len(product_ids))
+    return cache
+
+@event.listens_for(Session, "after_flush")
+def _collect_bom_changes(session, flush_context):
+    """记录本事务中变更的 BOM/BOMLine，提交后再使缓存失效"""
+    changes = session.info.setdefault("bom_changes", (set(), set()))
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, BOM):
+            changes[0].add(obj.id)
+            changes[1].add(obj.product_id)
+        elif isinstance(obj, BOMLine):
+            changes[0].add(obj.bom_id)
+
+@event.listens_for(Session, "after_commit")
+def _apply_bom_changes(session):
+    changes = session.info.pop("bom_changes", None)
+    if changes:
+        _dirty_boms.update(changes[0])
+        _dirty_products.update(changes[1])
+
+@event.listens_for(Session, "after_rollback")
+def _discard_bom_changes(session):
+    session.info.pop("bom_changes", None)
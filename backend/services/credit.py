@@ -0,0 +1,200 @@
+"""客户信用占用
+
+每个客户在 customer_credit_exposures 中有一行汇总：
+- open_order_amount: 未完成销售订单金额，减去已就这些订单开出的销售发票金额；
+- receivable_amount: 销售发票金额减去收款金额。
+
+订单、发票、收款过账时在同一事务中用一条 UPSERT 累加增量（同时持有该行
+行锁，串行化同一客户的并发过账），信用检查只读这一行和客户的信用额度，
+耗时与客户历史单据数量无关。rebuild_exposures 按同样口径从单据表重算。
+信用额度为0或未设置的客户不做限制。
+"""
+from decimal import Decimal
+from typing import Optional, Tuple
+from sqlalchemy import and_, func, literal_column, select, text, union_all, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.customer import Customer, CustomerCreditExposure
+from models.finance import Invoice, Payment
+from models.sales import SalesOrder
+
+# 占用信用额度的销售订单状态
+OPEN_SALES_ORDER_STATUSES = ("待确认", "已确认", "生产中", "已发货")
+SALES_INVOICE = "销售发票"
+RECEIPT = "收款"
+CANCELLED = "已取消"
+
+class CreditLimitExceeded(Exception):
+    """过账后客户信用占用超出额度"""
+
+    def __init__(self, customer_id: int, credit_limit: Decimal, exposure: Decimal):
+        super().__init__(f"超出客户信用额度: 额度 {credit_limit}, 占用 {exposure}")
+        self.customer_id = customer_id
+        self.credit_limit = credit_limit
+        self.exposure = exposure
+
+def order_amount(order: SalesOrder) -> Decimal:
+    """销售订单占用的信用金额"""
+    if order.status in OPEN_SALES_ORDER_STATUSES:
+        return Decimal(order.total_amount or 0)
+    return Decimal(0)
+
+async def adjust_exposure(
+    db: AsyncSession,
+    customer_id: int,
+    open_orders: Decimal = Decimal(0),
+    receivables: Decimal = Decimal(0),
+) -> Tuple[Decimal, Decimal]:
+    """累加客户信用占用（不提交事务），返回更新后的 (在途订单, 应收)"""
+    table = CustomerCreditExposure.__table__
+    stmt = insert(table).values(
+        customer_id=customer_id,
+        open_order_amount=open_orders,
+        receivable_amount=receivables,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.customer_id],
+        set_={
+            "open_order_amount": table.c.open_order_amount + stmt.excluded.open_order_amount,
+            "receivable_amount": table.c.receivable_amount + stmt.excluded.receivable_amount,
+            "updated_at": func.now(),
+        },
+    ).returning(table.c.open_order_amount, table.c.receivable_amount)
+    row = (await db.execute(stmt)).one()
+    return row[0], row[1]
+
+async def reserve_credit(db: AsyncSession, customer_id: int, amount: Decimal) -> Decimal:
+    """为订单占用信用额度，超出额度时抛出 CreditLimitExceeded
+
+    调用方在捕获异常后回滚事务即可撤销本次占用。返回占用后的总金额。
+    """
+    open_orders, receivables = await adjust_exposure(db, customer_id, open_orders=amount)
+    exposure = open_orders + receivables
+    if amount > 0:
+        credit_limit = (await db.execute(
+            select(Customer.credit_limit).where(Customer.id == customer_id)
+        )).scalar_one_or_none()
+        if credit_limit and exposure > credit_limit:
+            raise CreditLimitExceeded(customer_id, credit_limit, exposure)
+    return exposure
+
+async def post_sales_order(db: AsyncSession, order: SalesOrder,
+                           previous_amount: Decimal = Decimal(0),
+                           previous_status: Optional[str] = None) -> None:
+    """销售订单新建或修改后过账信用占用
+
+    修改时传入修改前的占用金额（order_amount）和状态；订单在在途与完成/取消
+    之间切换时，已就该订单开票的金额随之转入或转出在途订单占用。
+    """
+    delta = order_amount(order) - previous_amount
+    was_open = previous_status in OPEN_SALES_ORDER_STATUSES
+    is_open = order.status in OPEN_SALES_ORDER_STATUSES
+    if previous_status is not None and was_open != is_open:
+        invoiced = (await db.execute(
+            select(func.coalesce(func.sum(Invoice.total_amount), 0)).where(
+                Invoice.sales_order_id == order.id,
+                Invoice.invoice_type == SALES_INVOICE,
+                Invoice.status != CANCELLED,
+                Invoice.customer_id.is_not(None),
+            )
+        )).scalar_one()
+        delta += invoiced if was_open else -invoiced
+    if delta:
+        await reserve_credit(db, order.customer_id, delta)
+
+async def post_invoice(db: AsyncSession, invoice: Invoice, sign: int = 1) -> None:
+    """销售发票过账：应收增加；关联的在途订单占用相应减少（sign=-1 为冲销）"""
+    if invoice.invoice_type != SALES_INVOICE or invoice.customer_id is None or invoice.status == CANCELLED:
+        return
+    amount = sign * Decimal(invoice.total_amount or 0)
+    open_orders = Decimal(0)
+    if invoice.sales_order_id is not None:
+        order_status = (await db.execute(
+            select(SalesOrder.status).where(SalesOrder.id == invoice.sales_order_id)
+        )).scalar_one_or_none()
+        if order_status in OPEN_SALES_ORDER_STATUSES:
+            open_orders = -amount
+    await adjust_exposure(db, invoice.customer_id, open_orders=open_orders, receivables=amount)
+
+async def post_payment(db: AsyncSession, payment: Payment, sign: int = 1) -> None:
+    """客户收款过账：应收减少（sign=-1 为冲销）"""
+    if payment.payment_type != RECEIPT or payment.customer_id is None or payment.status == CANCELLED:
+        return
+    await adjust_exposure(db, payment.customer_id, receivables=-sign * Decimal(payment.amount or 0))
+
+async def get_exposure(db: AsyncSession, customer_id: int) -> Optional[CustomerCreditExposure]:
+    return await db.get(CustomerCreditExposure, customer_id)
+
+async def rebuild_exposures(db: AsyncSession) -> int:
+    """按单据表重算全部客户的信用占用并提交，返回涉及的客户数
+
+    重算期间锁定汇总表，阻止并发过账。
+    """
+    open_order = SalesOrder.status.in_(OPEN_SALES_ORDER_STATUSES)
+    sales_invoice = and_(
+        Invoice.invoice_type == SALES_INVOICE,
+        Invoice.status != CANCELLED,
+        Invoice.customer_id.is_not(None),
+    )
+    zero = literal_column("0")
+    parts = union_all(
+        # 在途订单
+        select(SalesOrder.customer_id, SalesOrder.total_amount.label("orders"), zero.label("receivables"))
+        .where(open_order),
+        # 已就在途订单开票的部分
+        select(Invoice.customer_id, -Invoice.total_amount, zero)
+        .join(SalesOrder, SalesOrder.id == Invoice.sales_order_id)
+        .where(sales_invoice, open_order),
+        # 销售发票
+        select(Invoice.customer_id, zero, Invoice.total_amount)
+        .where(sales_invoice),
+        # 收款
+        select(Payment.customer_id, zero, -Payment.amount)
+        .where(
+            Payment.payment_type == RECEIPT,
+            Payment.status != CANCELLED,
+            Payment.customer_id.is_not(None),
+        ),
+    ).subquery("parts")
+    totals = (
+        select(
+            parts.c.customer_id,
+            func.coalesce(func.sum(parts.c.orders), 0),
+            func.coalesce(func.sum(parts.c.receivables), 0),
+        )
+        .where(parts.c.customer_id.is_not(None))
+        .group_by(parts.c.customer_id)
+    )
+
+    await db.execute(text("SET LOCAL statement_timeout = 0"))
+    await db.execute(text("LOCK TABLE customer_credit_exposures IN SHARE ROW EXCLUSIVE MODE"))
+
+    await db.execute(
+        update(CustomerCreditExposure)
+        .values(open_order_amount=0, receivable_amount=0, updated_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+    table = CustomerCreditExposure.__table__
+    stmt = insert(table).from_select(
+        ["customer_id", "open_order_amount", "receivable_amount"], totals
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.customer_id],
+        set_={
+            "open_order_amount": stmt.excluded.open_order_amount,
+            "receivable_amount": stmt.excluded.receivable_amount,
+            "updated_at": func.now(),
+        },
+    )
+    result = await db.execute(stmt)
+    await db.commit()
+    return result.rowcount
+
+if __name__ == "__main__":
+    # 命令行对账: python -m services.credit rebuild
+    from utils.cli import run_command
+
+    async def _rebuild(session) -> str:
+        return f"客户信用占用重算完成，共 {await rebuild_exposures(session)} 个客户"
+
+    run_command("services.credit", "rebuild", _rebuild)
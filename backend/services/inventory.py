@@ -0,0 +1,272 @@
+"""库存余额增量维护
+
+每条库存移动记录过账时，把数量和成本的增量直接累加到对应的
+Inventory 行（产品、仓库、库位、批次），读取库存时无需再汇总移动历史。
+rebuild_balances 用于根据移动记录重算全部余额（数据修复）。
+"""
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import and_, bindparam, case, func, insert, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.warehouse import Inventory, StockMovement
+
+# 移动类型: 入库数量取正、出库取负；调拨和盘点按传入的带符号数量过账
+INBOUND = "入库"
+OUTBOUND = "出库"
+SIGNED_TYPES = ("调拨", "盘点")
+MOVEMENT_TYPES = (INBOUND, OUTBOUND) + SIGNED_TYPES
+
+BalanceKey = Tuple[int, int, Optional[int], Optional[str]]
+
+class BalanceDelta:
+    """单个库存余额行的累计增量"""
+
+    __slots__ = ("quantity", "cost", "uncosted_quantity")
+
+    def __init__(self):
+        self.quantity = Decimal(0)
+        # 带单位成本的入库金额
+        self.cost = Decimal(0)
+        # 按当前平均成本计价的数量（出库及未提供成本的移动）
+        self.uncosted_quantity = Decimal(0)
+
+Balance = Tuple[Decimal, Decimal, Decimal]
+# 余额行初始的 (数量, 单位成本, 总成本)
+EMPTY_BALANCE: Balance = (Decimal(0), Decimal(0), Decimal(0))
+
+# 与 Inventory 数量、单位成本、总成本列的小数位一致
+QUANTITY_PLACES = Decimal("0.01")
+UNIT_COST_PLACES = Decimal("0.0001")
+COST_PLACES = Decimal("0.01")
+
+# 重算时每次从游标读取的移动记录条数
+REBUILD_FETCH_SIZE = 10000
+
+def apply_delta(balance: Balance, delta: BalanceDelta) -> Balance:
+    """按移动加权平均法把一批增量应用到 (数量, 单位成本, 总成本)
+
+    与 _update_balance 中的 SQL 规则相同：带成本的入库计入金额，其余数量按
+    当前平均单位成本计价；数量为0时保留原单位成本。结果按列精度舍入，
+    与数据库中保存的值一致。
+    """
+    quantity, unit_cost, total_cost = balance
+    new_quantity = quantity + delta.quantity
+    new_total_cost = total_cost + delta.cost + delta.uncosted_quantity * unit_cost
+    if new_quantity != 0:
+        unit_cost = (new_total_cost / new_quantity).quantize(UNIT_COST_PLACES, rounding=ROUND_HALF_UP)
+    return (
+        new_quantity.quantize(QUANTITY_PLACES, rounding=ROUND_HALF_UP),
+        unit_cost,
+        new_total_cost.quantize(COST_PLACES, rounding=ROUND_HALF_UP),
+    )
+
+def signed_quantity(movement_type: str, quantity: Decimal) -> Decimal:
+    """按移动类型返回带符号的数量增量"""
+    if movement_type == INBOUND:
+        return abs(quantity)
+    if movement_type == OUTBOUND:
+        return -abs(quantity)
+    if movement_type in SIGNED_TYPES:
+        return quantity
+    raise ValueError(f"无效的移动类型: {movement_type}")
+
+def collect_deltas(movements: Iterable) -> Dict[BalanceKey, BalanceDelta]:
+    """把一批移动记录按余额行汇总为增量
+
+    movements 中的元素可以是 StockMovement 实例或同名字段的字典。
+    """
+    deltas: Dict[BalanceKey, BalanceDelta] = defaultdict(BalanceDelta)
+    for movement in movements:
+        get = movement.get if isinstance(movement, dict) else (lambda name: getattr(movement, name))
+        key = (get("product_id"), get("warehouse_id"), get("location_id"), get("batch_number"))
+        quantity = signed_quantity(get("movement_type"), Decimal(get("quantity")))
+        unit_cost = get("unit_cost")
+        delta = deltas[key]
+        delta.quantity += quantity
+        if quantity > 0 and unit_cost is not None:
+            delta.cost += quantity * Decimal(unit_cost)
+        else:
+            delta.uncosted_quantity += quantity
+    return deltas
+
+def _key_filter(key: BalanceKey):
+    product_id, warehouse_id, location_id, batch_number = key
+    return and_(
+        Inventory.product_id == product_id,
+        Inventory.warehouse_id == warehouse_id,
+        Inventory.location_id.is_not_distinct_from(location_id),
+        Inventory.batch_number.is_not_distinct_from(batch_number),
+    )
+
+def _sort_key(key: BalanceKey):
+    product_id, warehouse_id, location_id, batch_number = key
+    return (product_id, warehouse_id, location_id is None, location_id or 0,
+            batch_number is None, batch_number or "")
+
+async def _update_balance(db: AsyncSession, key: BalanceKey, delta: BalanceDelta) -> bool:
+    """原地累加增量（UPDATE持有行锁），返回是否命中已有余额行"""
+    new_quantity = func.coalesce(Inventory.quantity, 0) + delta.quantity
+    new_total_cost = (
+        func.coalesce(Inventory.total_cost, 0)
+        + delta.cost
+        + delta.uncosted_quantity * func.coalesce(Inventory.unit_cost, 0)
+    )
+    result = await db.execute(
+        update(Inventory)
+        .where(_key_filter(key))
+        .values(
+            quantity=new_quantity,
+            available_quantity=new_quantity - func.coalesce(Inventory.reserved_quantity, 0),
+            total_cost=new_total_cost,
+            unit_cost=case(
+                (new_quantity != 0, new_total_cost / new_quantity),
+                else_=Inventory.unit_cost,
+            ),
+            updated_at=func.now(),
+        )
+        .returning(Inventory.id)
+        .execution_options(synchronize_session=False)
+    )
+    return result.first() is not None
+
+async def apply_deltas(db: AsyncSession, deltas: Dict[BalanceKey, BalanceDelta]) -> None:
+    """在当前事务中把增量应用到库存余额
+
+    按固定顺序逐行更新以避免并发过账时死锁；余额行不存在时先取
+    (产品, 仓库) 级事务咨询锁再插入，防止并发插入重复行；
+    唯一索引 uq_inventory_balance 作为最后一道保证。
+    """
+    for key in sorted(deltas, key=_sort_key):
+        delta = deltas[key]
+        if await _update_balance(db, key, delta):
+            continue
+
+        product_id, warehouse_id, location_id, batch_number = key
+        await db.execute(
+            text("SELECT pg_advisory_xact_lock(:product_id, :warehouse_id)"),
+            {"product_id": product_id, "warehouse_id": warehouse_id},
+        )
+        if await _update_balance(db, key, delta):
+            continue
+
+        quantity = delta.quantity
+        total_cost = delta.cost
+        await db.execute(
+            insert(Inventory).values(
+                product_id=product_id,
+                warehouse_id=warehouse_id,
+                location_id=location_id,
+                batch_number=batch_number,
+                quantity=quantity,
+                reserved_quantity=0,
+                available_quantity=quantity,
+                total_cost=total_cost,
+                unit_cost=total_cost / quantity if quantity else 0,
+            )
+        )
+
+async def post_movements(db: AsyncSession, movements: Iterable) -> None:
+    """过账一批移动记录（不提交事务）"""
+    await apply_deltas(db, collect_deltas(movements))
+
+async def rebuild_balances(db: AsyncSession) -> int:
+    """根据全部移动记录重算库存余额并提交，返回涉及的余额行数
+
+    按 (movement_date, id) 顺序重放移动记录，逐批套用与增量过账相同的
+    移动加权平均规则（apply_delta），重算出的单位成本与增量维护的结果一致。
+    同一 movement_date 的记录按一批处理，与批量接口一次过账的方式相同。
+    重算期间锁定 inventory 表，阻止并发过账。
+    """
+    # 全量重算耗时较长，取消本事务的语句超时限制
+    await db.execute(text("SET LOCAL statement_timeout = 0"))
+    await db.execute(text("LOCK TABLE inventory IN SHARE ROW EXCLUSIVE MODE"))
+
+    balances: Dict[BalanceKey, Balance] = {}
+
+    def post(batch: List[dict]) -> None:
+        for key, delta in collect_deltas(batch).items():
+            balances[key] = apply_delta(balances.get(key, EMPTY_BALANCE), delta)
+
+    result = await db.stream(
+        select(
+            StockMovement.product_id,
+            StockMovement.warehouse_id,
+            StockMovement.location_id,
+            StockMovement.batch_number,
+            StockMovement.movement_type,
+            StockMovement.quantity,
+            StockMovement.unit_cost,
+            StockMovement.movement_date,
+        )
+        .order_by(StockMovement.movement_date, StockMovement.id)
+        .execution_options(yield_per=REBUILD_FETCH_SIZE)
+    )
+    batch, batch_date = [], None
+    async for row in result.mappings():
+        if batch and row["movement_date"] != batch_date:
+            post(batch)
+            batch = []
+        batch.append(dict(row))
+        batch_date = row["movement_date"]
+    if batch:
+        post(batch)
+
+    inventory = Inventory.__table__
+    existing = {
+        (row.product_id, row.warehouse_id, row.location_id, row.batch_number): row.id
+        for row in await db.execute(
+            select(inventory.c.id, inventory.c.product_id, inventory.c.warehouse_id,
+                   inventory.c.location_id, inventory.c.batch_number)
+        )
+    }
+
+    # 先清零，再按主键覆盖已有行，最后补插缺失的行
+    await db.execute(
+        update(inventory).values(
+            quantity=0,
+            available_quantity=-func.coalesce(inventory.c.reserved_quantity, 0),
+            total_cost=0,
+            updated_at=func.now(),
+        )
+    )
+    updates, inserts = [], []
+    for key in sorted(balances, key=_sort_key):
+        quantity, unit_cost, total_cost = balances[key]
+        if key in existing:
+            updates.append({"b_id": existing[key], "b_quantity": quantity,
+                            "b_unit_cost": unit_cost, "b_total_cost": total_cost})
+        else:
+            product_id, warehouse_id, location_id, batch_number = key
+            inserts.append({
+                "product_id": product_id, "warehouse_id": warehouse_id,
+                "location_id": location_id, "batch_number": batch_number,
+                "quantity": quantity, "reserved_quantity": 0, "available_quantity": quantity,
+                "unit_cost": unit_cost, "total_cost": total_cost,
+            })
+    if updates:
+        await db.execute(
+            update(inventory)
+            .where(inventory.c.id == bindparam("b_id"))
+            .values(
+                quantity=bindparam("b_quantity"),
+                available_quantity=bindparam("b_quantity") - func.coalesce(inventory.c.reserved_quantity, 0),
+                unit_cost=bindparam("b_unit_cost"),
+                total_cost=bindparam("b_total_cost"),
+                updated_at=func.now(),
+            ),
+            updates,
+        )
+    if inserts:
+        await db.execute(insert(inventory), inserts)
+    await db.commit()
+    return len(balances)
+
+if __name__ == "__main__":
+    # 命令行修复: python -m services.inventory rebuild
+    from utils.cli import run_command
+
+    async def _rebuild(session) -> str:
+        return f"库存余额重算完成，共 {await rebuild_balances(session)} 行"
+
+    run_command("services.inventory", "rebuild", _rebuild)
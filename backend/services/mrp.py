@@ -0,0 +1,230 @@
+"""物料需求计划（MRP）
+
+一次运行分两步：
+1. load_mrp_input 用少量批量查询读取产品参数、BOM 结构、库存、
+   未完成的销售订单明细、工单和采购订单明细；
+2. run_mrp 在内存中按低层码顺序逐层计算：每个产品的毛需求和在途供给
+   按日期放入以产品序号为下标的数组桶中，扣减可用库存和安全库存后得到
+   净需求，按批量取整、按提前期倒推下达日期，生成计划工单（自制件，
+   并把组件需求展开到下一层）或采购建议（外购件）。
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_CEILING
+from typing import Dict, List, Optional
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.procurement import PurchaseOrder, PurchaseOrderLine
+from models.product import Product
+from models.production import WorkOrder
+from models.sales import SalesOrder, SalesOrderLine
+from models.warehouse import Inventory
+from services.bom import BomGraph, get_bom_cache
+
+# 仍会消耗或产出物料的单据状态
+OPEN_WORK_ORDER_STATUSES = ("计划中", "已下达", "生产中")
+CLOSED_SALES_ORDER_STATUSES = ("已完成", "已取消")
+CLOSED_PURCHASE_ORDER_STATUSES = ("已完成", "已取消")
+
+class ProductParams:
+    """参与计划的产品参数"""
+
+    __slots__ = ("product_id", "lead_time", "batch_size", "safety_stock", "manufacturable")
+
+    def __init__(self, product_id, lead_time, batch_size, safety_stock, manufacturable):
+        self.product_id = product_id
+        self.lead_time = lead_time or 0
+        self.batch_size = Decimal(batch_size or 0)
+        self.safety_stock = Decimal(safety_stock or 0)
+        self.manufacturable = bool(manufacturable)
+
+class MrpInput:
+    """一次 MRP 运行所需的全部数据"""
+
+    def __init__(self, today: date):
+        self.today = today
+        self.products: Dict[int, ProductParams] = {}
+        self.bom = BomGraph()
+        # 产品ID -> 可用库存
+        self.available: Dict[int, Decimal] = {}
+        # (产品ID, 需求日期, 数量)
+        self.demands: List[tuple] = []
+        # (产品ID, 到货日期, 数量)
+        self.receipts: List[tuple] = []
+
+class PlannedOrder:
+    """计划工单或采购建议"""
+
+    __slots__ = ("product_id", "quantity", "net_requirement", "release_date", "due_date",
+                 "low_level_code", "is_late")
+
+    def __init__(self, product_id, quantity, net_requirement, release_date, due_date,
+                 low_level_code, is_late):
+        self.product_id = product_id
+        self.quantity = quantity
+        self.net_requirement = net_requirement
+        self.release_date = release_date
+        self.due_date = due_date
+        self.low_level_code = low_level_code
+        self.is_late = is_late
+
+class MrpResult:
+    def __init__(self):
+        self.planned_work_orders: List[PlannedOrder] = []
+        self.purchase_suggestions: List[PlannedOrder] = []
+        self.product_count = 0
+
+def _lot_size(net: Decimal, batch_size: Decimal) -> Decimal:
+    """按批量向上取整"""
+    if batch_size <= 0:
+        return net
+    return (net / batch_size).to_integral_value(rounding=ROUND_CEILING) * batch_size
+
+def run_mrp(data: MrpInput) -> MrpResult:
+    """按低层码逐层净算并展开需求（纯内存计算，不访问数据库）"""
+    today = data.today
+    bom = data.bom
+    codes = bom.low_level_codes()
+
+    product_ids = set(data.products) | set(codes)
+    product_ids.update(item[0] for item in data.demands)
+    product_ids.update(item[0] for item in data.receipts)
+    order = sorted(product_ids, key=lambda pid: (codes.get(pid, 0), pid))
+    index = {pid: i for i, pid in enumerate(order)}
+
+    # 以产品序号为下标的日期桶：日期序数 -> 数量
+    gross: List[Optional[Dict[int, Decimal]]] = [None] * len(order)
+    scheduled: List[Optional[Dict[int, Decimal]]] = [None] * len(order)
+
+    def add(buckets, product_id, day: date, quantity: Decimal):
+        i = index[product_id]
+        bucket = buckets[i]
+        if bucket is None:
+            bucket = buckets[i] = defaultdict(Decimal)
+        bucket[max(day, today).toordinal()] += quantity
+
+    for product_id, day, quantity in data.demands:
+        add(gross, product_id, day, quantity)
+    for product_id, day, quantity in data.receipts:
+        add(scheduled, product_id, day, quantity)
+
+    result = MrpResult()
+    result.product_count = len(order)
+    default_params = ProductParams(None, 0, 1, 0, False)
+
+    for i, product_id in enumerate(order):
+        params = data.products.get(product_id, default_params)
+        projected = data.available.get(product_id, Decimal(0)) - params.safety_stock
+        demand = gross[i] or {}
+        if not demand and projected >= 0:
+            continue
+        components = bom.components(product_id)
+        make = bool(components) or params.manufacturable
+        supply = scheduled[i] or {}
+        # 可用库存低于安全库存时，即使没有需求也在当天补足
+        days = set(demand) | set(supply) | {today.toordinal()}
+
+        for day in sorted(days):
+            projected += supply.get(day, 0) - demand.get(day, 0)
+            if projected >= 0:
+                continue
+
+            net = -projected
+            quantity = _lot_size(net, params.batch_size)
+            projected += quantity
+            due_date = date.fromordinal(day)
+            release_date = due_date - timedelta(days=params.lead_time)
+            planned = PlannedOrder(
+                product_id=product_id,
+                quantity=quantity,
+                net_requirement=net,
+                release_date=max(release_date, today),
+                due_date=due_date,
+                low_level_code=codes.get(product_id, 0),
+                is_late=release_date < today,
+            )
+            if make:
+                result.planned_work_orders.append(planned)
+                # 组件需求在计划工单下达日产生，进入下一层计算
+                for material_id, per_unit in components:
+                    add(gross, material_id, planned.release_date, quantity * per_unit)
+            else:
+                result.purchase_suggestions.append(planned)
+
+    return result
+
+async def load_mrp_input(db: AsyncSession, today: Optional[date] = None) -> MrpInput:
+    """批量读取 MRP 所需数据（每类数据一条查询）"""
+    data = MrpInput(today or date.today())
+    today = data.today
+
+    products = await db.execute(
+        select(
+            Product.id, Product.lead_time, Product.batch_size,
+            Product.safety_stock, Product.is_manufacturable,
+        ).where(Product.is_active.is_(True))
+    )
+    for row in products:
+        data.products[row[0]] = ProductParams(*row)
+
+    data.bom = (await get_bom_cache(db)).graph
+
+    available = await db.execute(
+        select(Inventory.product_id, func.sum(Inventory.available_quantity))
+        .group_by(Inventory.product_id)
+    )
+    data.available = {product_id: quantity or Decimal(0) for product_id, quantity in available}
+
+    # 独立需求：未完成的销售订单明细
+    sales_lines = await db.execute(
+        select(
+            SalesOrderLine.product_id,
+            func.coalesce(SalesOrderLine.delivery_date, SalesOrder.delivery_date),
+            SalesOrderLine.quantity - func.coalesce(SalesOrderLine.delivered_quantity, 0),
+        )
+        .join(SalesOrder, SalesOrder.id == SalesOrderLine.order_id)
+        .where(
+            SalesOrderLine.status != "已完成",
+            SalesOrder.status.not_in(CLOSED_SALES_ORDER_STATUSES),
+            SalesOrderLine.quantity > func.coalesce(SalesOrderLine.delivered_quantity, 0),
+        )
+    )
+    for product_id, due_date, quantity in sales_lines:
+        data.demands.append((product_id, due_date or today, quantity))
+
+    # 未完成工单：成品为在途供给，组件按工单BOM展开为相关需求
+    work_orders = await db.execute(
+        select(
+            WorkOrder.product_id,
+            WorkOrder.bom_id,
+            WorkOrder.planned_start_date,
+            WorkOrder.planned_end_date,
+            WorkOrder.planned_quantity - func.coalesce(WorkOrder.produced_quantity, 0),
+        ).where(
+            WorkOrder.status.in_(OPEN_WORK_ORDER_STATUSES),
+            WorkOrder.planned_quantity > func.coalesce(WorkOrder.produced_quantity, 0),
+        )
+    )
+    for product_id, bom_id, start_date, end_date, quantity in work_orders:
+        data.receipts.append((product_id, end_date or start_date or today, quantity))
+        for material_id, per_unit in data.bom.components(product_id, bom_id):
+            data.demands.append((material_id, start_date or today, quantity * per_unit))
+
+    # 在途采购：未收货的采购订单明细
+    purchase_lines = await db.execute(
+        select(
+            PurchaseOrderLine.product_id,
+            func.coalesce(PurchaseOrderLine.delivery_date, PurchaseOrder.delivery_date),
+            PurchaseOrderLine.quantity - func.coalesce(PurchaseOrderLine.received_quantity, 0),
+        )
+        .join(PurchaseOrder, PurchaseOrder.id == PurchaseOrderLine.order_id)
+        .where(
+            PurchaseOrderLine.status != "已收货",
+            PurchaseOrder.status.not_in(CLOSED_PURCHASE_ORDER_STATUSES),
+            PurchaseOrderLine.quantity > func.coalesce(PurchaseOrderLine.received_quantity, 0),
+        )
+    )
+    for product_id, due_date, quantity in purchase_lines:
+        data.receipts.append((product_id, due_date or today, quantity))
+
+    return data
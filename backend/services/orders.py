@@ -0,0 +1,118 @@
+"""带明细的单据（销售订单、采购订单、报价单）
+
+表头和全部明细在一个事务中写入：一次遍历明细算出行总额、小计、税额和
+总金额（不采用客户端传入的金额），明细用多行 INSERT 批量写入；替换明细时
+按明细ID对比：带 id 的行原地更新，不带 id 的行新增，未出现的行删除，
+这样被工单、收货单等引用的明细保留原ID。读取时用 selectinload 一次查询加载全部明细。
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+from sqlalchemy import Integer, any_, bindparam, delete, insert, literal, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from utils.expand import load_document
+
+CENT = Decimal("0.01")
+# 单条 INSERT 的最大行数，避免绑定参数过多
+INSERT_BATCH_SIZE = 1000
+
+class LineChangeError(ValueError):
+    """替换明细时引用了不属于该单据的明细，或要删除、改动仍被引用的明细"""
+
+def _money(value: Decimal) -> Decimal:
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+def compute_totals(lines: Iterable[dict], tax_rate: Decimal) -> Tuple[List[dict], Decimal, Decimal, Decimal]:
+    """计算行总额并汇总，返回 (带 line_total 的明细, 小计, 税额, 总金额)"""
+    rows = []
+    subtotal = Decimal(0)
+    for line in lines:
+        discount = Decimal(line.get("discount_rate") or 0)
+        line_total = _money(Decimal(line["quantity"]) * Decimal(line["unit_price"]) * (1 - discount / 100))
+        rows.append({**line, "discount_rate": discount, "line_total": line_total})
+        subtotal += line_total
+    tax_amount = _money(subtotal * Decimal(tax_rate or 0) / 100)
+    return rows, subtotal, tax_amount, subtotal + tax_amount
+
+def apply_totals(header, lines: List[dict]) -> List[dict]:
+    """按明细计算表头的小计、税额和总金额，返回带行总额的待插入明细"""
+    tax_rate = header.tax_rate if header.tax_rate is not None else Decimal(13)
+    rows, header.subtotal, header.tax_amount, header.total_amount = compute_totals(lines, tax_rate)
+    return rows
+
+def apply_totals_to_values(values: dict, lines: List[dict]) -> List[dict]:
+    """同 apply_totals，作用于待插入的表头字段字典"""
+    tax_rate = values.get("tax_rate")
+    tax_rate = tax_rate if tax_rate is not None else Decimal(13)
+    rows, values["subtotal"], values["tax_amount"], values["total_amount"] = compute_totals(lines, tax_rate)
+    return rows
+
+async def insert_lines(db: AsyncSession, line_model, parent_key: str, parent_id: int, rows: List[dict]) -> None:
+    """多行 INSERT 写入明细（忽略行中的 id）"""
+    rows = [{**{k: v for k, v in row.items() if k != "id"}, parent_key: parent_id} for row in rows]
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        await db.execute(insert(line_model).values(rows[start:start + INSERT_BATCH_SIZE]))
+
+def plan_line_changes(existing: Dict[int, int], rows: List[dict]) -> Tuple[List[dict], List[dict], Set[int], Set[int]]:
+    """对比现有明细 {明细ID: 产品ID} 和新明细
+
+    返回 (原地更新的行, 新增的行, 删除的明细ID, 更换了产品的明细ID)；
+    明细ID不属于该单据或重复出现时抛出 LineChangeError。
+    """
+    updates, inserts, seen = [], [], set()
+    for row in rows:
+        line_id = row.get("id")
+        if line_id is None:
+            inserts.append(row)
+            continue
+        if line_id not in existing:
+            raise LineChangeError(f"明细 {line_id} 不属于该单据")
+        if line_id in seen:
+            raise LineChangeError(f"明细 {line_id} 重复出现")
+        seen.add(line_id)
+        updates.append(row)
+    changed = {row["id"] for row in updates if row["product_id"] != existing[row["id"]]}
+    return updates, inserts, existing.keys() - seen, changed
+
+async def replace_lines(
+    db: AsyncSession, line_model, parent_key: str, parent_id: int, rows: List[dict],
+    references: Sequence[Tuple[object, str]] = (),
+) -> None:
+    """按明细ID替换表头的明细：更新已有行、插入新行、删除未出现的行
+
+    references 为引用该明细表的 (外键列, 单据名称)，如 (WorkOrder.sales_order_line_id, "工单")；
+    仍被引用的明细不能删除或更换产品，否则抛出 LineChangeError。调用方需已锁定表头。
+    """
+    table = line_model.__table__
+    result = await db.execute(
+        select(table.c.id, table.c.product_id).where(table.c[parent_key] == parent_id)
+    )
+    updates, inserts, removed, changed = plan_line_changes(dict(result.all()), rows)
+
+    guarded = sorted(removed | changed)
+    if guarded:
+        for column, document in references:
+            line_id = await db.scalar(
+                select(column).where(column == any_(literal(guarded, ARRAY(Integer)))).limit(1)
+            )
+            if line_id is not None:
+                raise LineChangeError(f"明细 {line_id} 已被{document}引用，不能删除或更换产品")
+
+    if removed:
+        await db.execute(
+            delete(table).where(table.c.id == any_(literal(sorted(removed), ARRAY(Integer))))
+        )
+    if updates:
+        columns = [key for key in updates[0] if key != "id"]
+        await db.execute(
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .values({key: bindparam(f"b_{key}") for key in columns}),
+            [{"b_id": row["id"], **{f"b_{key}": row[key] for key in columns}} for row in updates],
+        )
+    await insert_lines(db, line_model, parent_key, parent_id, inserts)
+
+async def load_with_lines(db: AsyncSession, model, id: int, *options):
+    """读取表头并预加载明细（options 为需要一并加载的其他关系），不存在时返回 None"""
+    return await load_document(db, model, id, [selectinload(model.lines), *options])
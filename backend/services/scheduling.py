@@ -0,0 +1,351 @@
+"""有限产能工序排程
+
+每个工作中心每天从 SCHEDULE_DAY_START_HOUR 起提供 capacity_per_day 小时的
+产能，工序时长 = (准备时间 + 单件时间 × 剩余数量) / 效率。排程在各工作中心
+的"工作分钟"坐标上进行（只计可用时段，跨天自动衔接），工序之间按工单内
+sequence 先后约束，换算为实际时间传递。
+
+- schedule: 对所有已下达工单做正向（尽早开始）或反向（按交期倒排）排程，
+  每个工作中心维护待加工队列（按到达时间）和可加工队列（按优先级、交期），
+  以事件驱动方式依次分派；
+- reschedule_order: 其他工单的计划保持不变，把单个工单的工序插入各工作中心
+  最早的空档；
+- save_schedule: 用一条 executemany UPDATE 批量写回计划时间。
+"""
+import heapq
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List, Literal, Optional, Tuple
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from models.production import Operation, WorkCenter, WorkOrder, WorkOrderOperation
+
+Direction = Literal["forward", "backward"]
+
+# 参与排程的工单状态及未完工的工序状态
+SCHEDULABLE_STATUSES = ("已下达", "生产中")
+PRIORITY_RANK = {"紧急": 0, "高": 1, "普通": 2, "低": 3}
+
+DAY_MINUTES = 24 * 60
+
+class CapacityError(ValueError):
+    """工作中心每日产能超过24小时"""
+
+class Calendar:
+    """工作中心日历：实际时间（距排程原点的分钟）与工作分钟互相换算
+
+    每天的可用时段从 day_start 开始、长 capacity_hours 小时，超过当天
+    剩余时间的部分延续到次日凌晨（如8点开始的20小时产能到次日4点）。
+    """
+
+    __slots__ = ("start", "length", "rate")
+
+    def __init__(self, capacity_hours, efficiency, day_start: int):
+        length = int(float(capacity_hours or 0) * 60)
+        if length > DAY_MINUTES:
+            raise CapacityError(f"每日产能 {capacity_hours} 小时超过24小时")
+        self.start = day_start
+        self.length = max(1, length)
+        self.rate = float(efficiency or 100) / 100 or 1.0
+
+    def working(self, minute: float) -> float:
+        """实际时间 -> 工作分钟（不在可用时段内的时间归并到相邻时段边界）"""
+        # 以时段开始时刻为一天的起点，跨午夜的时段仍属于同一天
+        day, offset = divmod(minute - self.start, DAY_MINUTES)
+        return day * self.length + min(offset, self.length)
+
+    def start_time(self, working: float) -> float:
+        """工作分钟 -> 开始时刻（恰在时段末尾时取次日时段开始）"""
+        day, offset = divmod(working, self.length)
+        return day * DAY_MINUTES + self.start + offset
+
+    def end_time(self, working: float) -> float:
+        """工作分钟 -> 结束时刻（恰在时段开始时取前一日时段末尾）"""
+        day, offset = divmod(working, self.length)
+        if offset == 0:
+            day, offset = day - 1, self.length
+        return day * DAY_MINUTES + self.start + offset
+
+    def duration(self, setup_time, cycle_time, quantity) -> float:
+        """工序占用的工作分钟"""
+        minutes = float(setup_time or 0) + float(cycle_time or 0) * float(quantity or 0)
+        return minutes / self.rate
+
+class Job:
+    """一个工单待排程的工序（按 sequence 排列）"""
+
+    __slots__ = ("work_order_id", "priority", "due", "release", "operations")
+
+    def __init__(self, work_order_id, priority, due, release):
+        self.work_order_id = work_order_id
+        self.priority = priority
+        self.due = due
+        self.release = release
+        # [(工单工序ID, 工作中心键, 工作分钟)]
+        self.operations: List[Tuple[int, object, float]] = []
+
+class ScheduleInput:
+    def __init__(self, origin: datetime, now: float):
+        self.origin = origin
+        self.now = now
+        self.calendars: Dict[object, Calendar] = {}
+        self.jobs: Dict[int, Job] = {}
+
+    def to_minutes(self, value: Optional[datetime]) -> Optional[float]:
+        if value is None:
+            return None
+        return (value - self.origin).total_seconds() / 60
+
+    def to_datetime(self, minutes: float) -> datetime:
+        return (self.origin + timedelta(minutes=minutes)).replace(microsecond=0)
+
+class ScheduleResult:
+    def __init__(self):
+        # 工单工序ID -> (开始, 结束)（距原点分钟）
+        self.times: Dict[int, Tuple[float, float]] = {}
+        # 开工早于当前时间（反向）或完工晚于交期（正向）的工单
+        self.late_orders: List[int] = []
+        # 缺少交期而无法反向排程的工单
+        self.unscheduled_orders: List[int] = []
+
+def _job_key(job: Job):
+    return (job.priority, job.due if job.due is not None else math.inf, job.work_order_id)
+
+def schedule(data: ScheduleInput, direction: Direction = "forward") -> ScheduleResult:
+    """对全部工单做有限产能排程（纯内存计算）
+
+    反向排程时把时间轴取反，复用同一套分派逻辑：工序按 sequence 倒序处理，
+    "到达时间"为后道工序的开始时间（最后一道为交期），得到尽可能晚的计划。
+    """
+    sign = 1 if direction == "forward" else -1
+    result = ScheduleResult()
+
+    jobs = []
+    for job in data.jobs.values():
+        if not job.operations:
+            continue
+        if sign < 0 and job.due is None:
+            result.unscheduled_orders.append(job.work_order_id)
+            continue
+        jobs.append(job)
+
+    # 每个工作中心: 时钟（取向后的工作分钟）、待到达堆、可加工堆
+    clock: Dict[object, float] = {}
+    pending: Dict[object, list] = defaultdict(list)
+    ready: Dict[object, list] = defaultdict(list)
+    # 事件堆中每个工作中心只保留最早的一个唤醒时间，过期的事件直接丢弃
+    events: list = []
+    wake_at: Dict[object, float] = {}
+
+    def wake(center, at: float):
+        if center not in wake_at or at < wake_at[center]:
+            wake_at[center] = at
+            heapq.heappush(events, (at, str(center), center))
+
+    def arrive(job: Job, position: int, at: float):
+        """工序在实际时刻 at（取向后）到达其工作中心"""
+        _, center, _ = job.operations[position]
+        calendar = data.calendars[center]
+        ready_at = sign * calendar.working(sign * at)
+        heapq.heappush(pending[center], (ready_at, _job_key(job), position, job.work_order_id))
+        wake(center, max(clock.get(center, -math.inf), ready_at))
+
+    by_id = {job.work_order_id: job for job in jobs}
+    for job in jobs:
+        if sign > 0:
+            arrive(job, 0, max(data.now, job.release if job.release is not None else data.now))
+        else:
+            arrive(job, len(job.operations) - 1, -job.due)
+
+    while events:
+        at, _, center = heapq.heappop(events)
+        if wake_at.get(center) != at:
+            continue
+        del wake_at[center]
+        at = max(at, clock.get(center, -math.inf))
+        waiting, available = pending[center], ready[center]
+        while waiting and waiting[0][0] <= at:
+            ready_at, key, position, work_order_id = heapq.heappop(waiting)
+            heapq.heappush(available, (key, ready_at, position, work_order_id))
+        if not available:
+            if waiting:
+                wake(center, waiting[0][0])
+            continue
+
+        _, _, position, work_order_id = heapq.heappop(available)
+        job = by_id[work_order_id]
+        woo_id, _, work = job.operations[position]
+        calendar = data.calendars[center]
+        start = at
+        end = start + work
+        clock[center] = end
+
+        if sign > 0:
+            begin, finish = calendar.start_time(start), calendar.end_time(end)
+            handoff = finish
+        else:
+            begin, finish = calendar.start_time(-end), calendar.end_time(-start)
+            handoff = -begin
+        finish = max(finish, begin)
+        result.times[woo_id] = (begin, finish)
+
+        nxt = position + sign
+        if 0 <= nxt < len(job.operations):
+            arrive(job, nxt, handoff)
+        elif sign > 0 and job.due is not None and finish > job.due:
+            result.late_orders.append(work_order_id)
+        elif sign < 0 and begin < data.now:
+            result.late_orders.append(work_order_id)
+
+        if available:
+            wake(center, end)
+        elif waiting:
+            wake(center, max(end, waiting[0][0]))
+
+    return result
+
+def reschedule_order(data: ScheduleInput, work_order_id: int,
+                     busy: Dict[object, List[Tuple[float, float]]]) -> ScheduleResult:
+    """在其他工单已占用的时段之外，为单个工单正向插入工序
+
+    busy 为各工作中心已占用的实际时间区间（距原点分钟）。
+    """
+    result = ScheduleResult()
+    job = data.jobs.get(work_order_id)
+    if job is None:
+        return result
+
+    at = max(data.now, job.release if job.release is not None else data.now)
+    finish = at
+    for woo_id, center, work in job.operations:
+        calendar = data.calendars[center]
+        # 已占用区间换算为工作分钟后按开始时间排序，找第一个放得下的空档
+        intervals = sorted(
+            (calendar.working(begin), calendar.working(end)) for begin, end in busy.get(center, ())
+        )
+        start = calendar.working(at)
+        for begin, end in intervals:
+            if end <= start:
+                continue
+            if begin >= start + work:
+                break
+            start = max(start, end)
+        begin = calendar.start_time(start)
+        finish = max(calendar.end_time(start + work), begin)
+        result.times[woo_id] = (begin, finish)
+        at = finish
+
+    if job.due is not None and finish > job.due:
+        result.late_orders.append(work_order_id)
+    return result
+
+async def load_schedule_input(db: AsyncSession, work_order_ids: Optional[List[int]] = None) -> ScheduleInput:
+    """一条查询读取待排程工序及其工作中心参数
+
+    工作中心的 capacity_per_day 超过24小时时抛出 CapacityError。
+    """
+    now = datetime.now()
+    origin = datetime(now.year, now.month, now.day)
+    data = ScheduleInput(origin, (now - origin).total_seconds() / 60)
+    day_start = settings.SCHEDULE_DAY_START_HOUR * 60
+
+    stmt = (
+        select(
+            WorkOrderOperation.id,
+            WorkOrderOperation.work_order_id,
+            WorkOrderOperation.planned_quantity - func.coalesce(WorkOrderOperation.completed_quantity, 0),
+            WorkOrder.priority,
+            WorkOrder.planned_start_date,
+            WorkOrder.planned_end_date,
+            Operation.setup_time,
+            Operation.cycle_time,
+            WorkCenter.id,
+            WorkCenter.capacity_per_day,
+            WorkCenter.efficiency,
+        )
+        .join(WorkOrder, WorkOrder.id == WorkOrderOperation.work_order_id)
+        .join(Operation, Operation.id == WorkOrderOperation.operation_id)
+        .outerjoin(WorkCenter, WorkCenter.id == Operation.work_center_id)
+        .where(
+            WorkOrder.status.in_(SCHEDULABLE_STATUSES),
+            WorkOrderOperation.status != "已完成",
+        )
+        .order_by(WorkOrderOperation.work_order_id, WorkOrderOperation.sequence, WorkOrderOperation.id)
+    )
+    if work_order_ids is not None:
+        stmt = stmt.where(WorkOrderOperation.work_order_id.in_(work_order_ids))
+
+    for (woo_id, work_order_id, quantity, priority, start_date, end_date,
+         setup_time, cycle_time, center_id, capacity, efficiency) in await db.execute(stmt):
+        job = data.jobs.get(work_order_id)
+        if job is None:
+            job = data.jobs[work_order_id] = Job(
+                work_order_id,
+                PRIORITY_RANK.get(priority, PRIORITY_RANK["普通"]),
+                # 交期为计划完成日当天结束
+                data.to_minutes(datetime.combine(end_date, datetime.min.time())) + DAY_MINUTES
+                if end_date else None,
+                data.to_minutes(datetime.combine(start_date, datetime.min.time()))
+                if start_date else None,
+            )
+        # 未指定工作中心的工序视为不受产能限制（全天可用、各自独立）
+        center = center_id if center_id is not None else ("无", woo_id)
+        calendar = data.calendars.get(center)
+        if calendar is None:
+            try:
+                calendar = data.calendars[center] = (
+                    Calendar(capacity, efficiency, day_start) if center_id is not None
+                    else Calendar(24, 100, 0)
+                )
+            except CapacityError as e:
+                raise CapacityError(f"工作中心 {center_id} 的{e}")
+        remaining = max(quantity or Decimal(0), Decimal(0))
+        job.operations.append((woo_id, center, calendar.duration(setup_time, cycle_time, remaining)))
+    return data
+
+async def load_busy_intervals(db: AsyncSession, data: ScheduleInput,
+                              work_order_id: int) -> Dict[object, List[Tuple[float, float]]]:
+    """读取指定工单所用工作中心上其他工单未完工工序的计划占用时段"""
+    job = data.jobs.get(work_order_id)
+    centers = {center for _, center, _ in job.operations if not isinstance(center, tuple)} if job else set()
+    busy: Dict[object, List[Tuple[float, float]]] = defaultdict(list)
+    if not centers:
+        return busy
+    rows = await db.execute(
+        select(
+            Operation.work_center_id,
+            WorkOrderOperation.planned_start_time,
+            WorkOrderOperation.planned_end_time,
+        )
+        .join(Operation, Operation.id == WorkOrderOperation.operation_id)
+        .join(WorkOrder, WorkOrder.id == WorkOrderOperation.work_order_id)
+        .where(
+            Operation.work_center_id.in_(centers),
+            WorkOrderOperation.work_order_id != work_order_id,
+            WorkOrder.status.in_(SCHEDULABLE_STATUSES),
+            WorkOrderOperation.status != "已完成",
+            WorkOrderOperation.planned_start_time.is_not(None),
+            WorkOrderOperation.planned_end_time > data.origin + timedelta(minutes=data.now),
+        )
+    )
+    for center, begin, end in rows:
+        busy[center].append((data.to_minutes(begin), data.to_minutes(end)))
+    return busy
+
+async def save_schedule(db: AsyncSession, data: ScheduleInput, result: ScheduleResult) -> int:
+    """批量写回计划开始/结束时间并提交，返回更新的工序数"""
+    rows = [
+        {
+            "id": woo_id,
+            "planned_start_time": data.to_datetime(begin),
+            "planned_end_time": data.to_datetime(end),
+        }
+        for woo_id, (begin, end) in result.times.items()
+    ]
+    if rows:
+        await db.execute(update(WorkOrderOperation), rows)
+    await db.commit()
+    return len(rows)
@@ -0,0 +1,43 @@
+"""客户、供应商、产品模糊搜索
+
+各表的 search_text 是由编码、名称等字段拼接并转小写的生成列，建有 pg_trgm
+的 GIN 索引（gin_trgm_ops）。搜索条件为
+
+    search_text LIKE '%关键字%'  OR  search_text %> 关键字
+
+前者匹配包含关键字的记录，后者按 word_similarity 容忍错字，两者都能使用
+同一个三元组索引。结果按以下顺序排名：编码完全相同、编码前缀、名称前缀、
+包含关键字、仅相似，同一档内按 word_similarity 降序，最后按ID保证顺序稳定。
+
+少于三个字符的关键字无法提取完整三元组，此时索引只能做全索引扫描，结果
+仍然正确。中文按字符参与三元组，数据库的 LC_CTYPE 不能为 C。
+"""
+from sqlalchemy import case, func, literal, or_, select
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def search_stmt(model, q: str, stmt=None):
+    """在 stmt（默认 select(model)）上追加搜索条件和相关度排序
+
+    model 需有 code、name、search_text 列。
+    """
+    q = q.strip().lower()
+    stmt = stmt if stmt is not None else select(model)
+    keyword = literal(q)
+    escaped = _escape_like(q)
+    contains = model.search_text.like(f"%{escaped}%", escape="\\")
+    code = func.lower(model.code)
+    name = func.lower(model.name)
+    rank = case(
+        (code == keyword, 0),
+        (code.like(f"{escaped}%", escape="\\"), 1),
+        (name.like(f"{escaped}%", escape="\\"), 2),
+        (contains, 3),
+        else_=4,
+    )
+    return (
+        stmt
+        .where(or_(contains, model.search_text.op("%>")(keyword)))
+        .order_by(rank, func.word_similarity(keyword, model.search_text).desc(), model.id)
+    )
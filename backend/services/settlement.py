@@ -0,0 +1,312 @@
+"""付款核销
+
+收付款按以下顺序核销到发票：
+1. 付款上指定了 invoice_id 的，先核销到该发票；
+2. 其余未核销金额按往来单位的未结发票从旧到新（到期日、发票日期、ID）核销。
+
+核销明细在SQL中按集合计算：同一往来单位的付款和发票各自按顺序累计金额，
+得到 [起点, 终点) 区间，两个区间的重叠部分就是该笔付款核销到该张发票的
+金额，一次查询即可算出成千上万笔付款的全部核销明细。随后用批量语句写入
+核销明细，并累加发票、付款和应收/应付余额，语句数与付款笔数无关。
+所涉付款和发票事先按ID顺序加行锁，并发的核销之间不会重复核销或死锁。
+"""
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import any_, bindparam, case, func, insert, literal, select, tuple_, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.types import Integer
+from models.finance import AccountPayable, AccountReceivable, Invoice, Payment, PaymentAllocation
+from services.credit import CANCELLED, RECEIPT, SALES_INVOICE
+
+DISBURSEMENT = "付款"
+PURCHASE_INVOICE = "采购发票"
+
+class AllocationError(ValueError):
+    """核销明细不合法"""
+
+_unapplied = Payment.amount - func.coalesce(Payment.allocated_amount, 0)
+_outstanding = func.coalesce(Invoice.outstanding_amount, 0)
+# 收款对应客户和销售发票，付款对应供应商和采购发票
+_payment_partner = case((Payment.payment_type == RECEIPT, Payment.customer_id), else_=Payment.supplier_id)
+_invoice_kind = case((Invoice.invoice_type == SALES_INVOICE, RECEIPT), else_=DISBURSEMENT)
+_invoice_partner = case((Invoice.invoice_type == SALES_INVOICE, Invoice.customer_id), else_=Invoice.supplier_id)
+_open_payment = (Payment.status != CANCELLED) & (_unapplied > 0)
+_open_invoice = (Invoice.status != CANCELLED) & (_outstanding > 0)
+
+def _among(column, ids: Sequence[int]):
+    """column = ANY(:ids)，大批量ID只占一个绑定参数"""
+    return column == any_(literal(list(ids), ARRAY(Integer)))
+
+async def open_invoice_balance(db: AsyncSession, invoice: Invoice) -> None:
+    """为新发票建立应收/应付账款（不提交事务）"""
+    if invoice.status == CANCELLED:
+        return
+    values = dict(
+        invoice_id=invoice.id,
+        original_amount=invoice.total_amount or 0,
+        outstanding_amount=invoice.outstanding_amount or 0,
+        invoice_date=invoice.invoice_date,
+        due_date=invoice.due_date,
+    )
+    if invoice.invoice_type == SALES_INVOICE and invoice.customer_id is not None:
+        db.add(AccountReceivable(customer_id=invoice.customer_id, status="未收", **values))
+    elif invoice.invoice_type == PURCHASE_INVOICE and invoice.supplier_id is not None:
+        db.add(AccountPayable(supplier_id=invoice.supplier_id, status="未付", **values))
+
+async def _lock(db: AsyncSession, payment_ids: Optional[Iterable[int]]) -> List[int]:
+    """锁定待核销的付款及其可能核销到的发票，返回付款ID"""
+    stmt = select(Payment.id).where(_open_payment).order_by(Payment.id).with_for_update()
+    if payment_ids is not None:
+        stmt = stmt.where(_among(Payment.id, list(payment_ids)))
+    ids = list((await db.execute(stmt)).scalars().all())
+    if ids:
+        scope = _among(Payment.id, ids)
+        await db.execute(
+            select(Invoice.id)
+            .where(
+                _open_invoice,
+                Invoice.id.in_(select(Payment.invoice_id).where(scope))
+                | tuple_(_invoice_kind, _invoice_partner).in_(
+                    select(Payment.payment_type, _payment_partner).where(scope)
+                ),
+            )
+            .order_by(Invoice.id)
+            .with_for_update()
+        )
+    return ids
+
+def _explicit_allocations(payment_ids: Sequence[int]):
+    """付款核销到其指定的发票；同一发票的多笔付款按付款日期依次核销
+
+    发票类型和往来单位不匹配的付款先在子查询中排除，再累计金额，不会占用
+    同一发票上后续付款的核销区间。
+    """
+    p = (
+        select(
+            Payment.id.label("payment_id"),
+            Invoice.id.label("invoice_id"),
+            Invoice.invoice_type,
+            _outstanding.label("outstanding"),
+            _unapplied.label("amount"),
+            func.sum(_unapplied).over(
+                partition_by=Invoice.id,
+                order_by=(Payment.payment_date, Payment.id),
+            ).label("end"),
+        )
+        .join(Invoice, Invoice.id == Payment.invoice_id)
+        .where(
+            _among(Payment.id, payment_ids),
+            _open_payment,
+            _open_invoice,
+            _invoice_kind == Payment.payment_type,
+            func.coalesce(_payment_partner, _invoice_partner) == _invoice_partner,
+        )
+        .subquery("p")
+    )
+    start = p.c.end - p.c.amount
+    return (
+        select(
+            p.c.payment_id,
+            p.c.invoice_id,
+            p.c.invoice_type,
+            (func.least(p.c.end, p.c.outstanding) - start).label("amount"),
+        )
+        .where(start < p.c.outstanding)
+        .order_by(p.c.invoice_id, p.c.payment_id)
+    )
+
+def _oldest_first_allocations(payment_ids: Sequence[int]):
+    """付款的剩余金额按往来单位的未结发票从旧到新核销"""
+    p = (
+        select(
+            Payment.id.label("payment_id"),
+            Payment.payment_type.label("kind"),
+            _payment_partner.label("partner"),
+            _unapplied.label("amount"),
+            func.sum(_unapplied).over(
+                partition_by=(Payment.payment_type, _payment_partner),
+                order_by=(Payment.payment_date, Payment.id),
+            ).label("end"),
+        )
+        .where(_among(Payment.id, payment_ids), _open_payment, _payment_partner.is_not(None))
+        .subquery("p")
+    )
+    i = (
+        select(
+            Invoice.id.label("invoice_id"),
+            Invoice.invoice_type,
+            _invoice_kind.label("kind"),
+            _invoice_partner.label("partner"),
+            _outstanding.label("amount"),
+            func.sum(_outstanding).over(
+                partition_by=(_invoice_kind, _invoice_partner),
+                order_by=(func.coalesce(Invoice.due_date, Invoice.invoice_date), Invoice.invoice_date, Invoice.id),
+            ).label("end"),
+        )
+        .where(_open_invoice, tuple_(_invoice_kind, _invoice_partner).in_(select(p.c.kind, p.c.partner)))
+        .subquery("i")
+    )
+    p_start = p.c.end - p.c.amount
+    i_start = i.c.end - i.c.amount
+    return (
+        select(
+            p.c.payment_id,
+            i.c.invoice_id,
+            i.c.invoice_type,
+            (func.least(p.c.end, i.c.end) - func.greatest(p_start, i_start)).label("amount"),
+        )
+        .join(i, (i.c.kind == p.c.kind) & (i.c.partner == p.c.partner))
+        .where(p_start < i.c.end, i_start < p.c.end)
+        .order_by(i.c.invoice_id, p.c.payment_id)
+    )
+
+def _remaining(table, paid_label: str, partial_label: str):
+    """按本次核销金额扣减未结金额的批量 UPDATE（参数 b_id, b_amount）"""
+    amount = bindparam("b_amount")
+    outstanding = table.c.outstanding_amount - amount
+    return dict(
+        outstanding_amount=outstanding,
+        status=case((outstanding <= 0, paid_label), else_=partial_label),
+        updated_at=func.now(),
+    )
+
+async def _apply(db: AsyncSession, rows: List[Dict]) -> None:
+    """写入核销明细并累加发票、付款、应收/应付余额"""
+    if not rows:
+        return
+    await db.execute(
+        insert(PaymentAllocation),
+        [{"payment_id": r["payment_id"], "invoice_id": r["invoice_id"], "amount": r["amount"]} for r in rows],
+    )
+
+    by_invoice: Dict[int, Decimal] = defaultdict(Decimal)
+    by_payment: Dict[int, Decimal] = defaultdict(Decimal)
+    kinds: Dict[int, str] = {}
+    for r in rows:
+        by_invoice[r["invoice_id"]] += r["amount"]
+        by_payment[r["payment_id"]] += r["amount"]
+        kinds[r["invoice_id"]] = r["invoice_type"]
+
+    invoice_params = [{"b_id": k, "b_amount": v} for k, v in sorted(by_invoice.items())]
+    invoices = Invoice.__table__
+    await db.execute(
+        update(invoices)
+        .where(invoices.c.id == bindparam("b_id"))
+        .values(
+            paid_amount=func.coalesce(invoices.c.paid_amount, 0) + bindparam("b_amount"),
+            **_remaining(invoices, "已付", "部分付款"),
+        ),
+        invoice_params,
+    )
+
+    payments = Payment.__table__
+    await db.execute(
+        update(payments)
+        .where(payments.c.id == bindparam("b_id"))
+        .values(
+            allocated_amount=func.coalesce(payments.c.allocated_amount, 0) + bindparam("b_amount"),
+            updated_at=func.now(),
+        ),
+        [{"b_id": k, "b_amount": v} for k, v in sorted(by_payment.items())],
+    )
+
+    for model, invoice_type, paid_label, partial_label in (
+        (AccountReceivable, SALES_INVOICE, "已收", "部分收款"),
+        (AccountPayable, PURCHASE_INVOICE, "已付", "部分付款"),
+    ):
+        params = [p for p in invoice_params if kinds[p["b_id"]] == invoice_type]
+        if params:
+            table = model.__table__
+            await db.execute(
+                update(table)
+                .where(table.c.invoice_id == bindparam("b_id"))
+                .values(**_remaining(table, paid_label, partial_label)),
+                params,
+            )
+
+async def _fetch(db: AsyncSession, stmt) -> List[Dict]:
+    return [dict(r) for r in (await db.execute(stmt)).mappings().all()]
+
+async def allocate_payments(
+    db: AsyncSession,
+    payment_ids: Optional[Iterable[int]] = None,
+    oldest_first: bool = True,
+) -> List[Dict]:
+    """核销付款（不提交事务），返回本次的核销明细
+
+    payment_ids 为空时处理全部未核销完的付款；oldest_first 为 False 时只核销
+    付款上指定的发票。
+    """
+    ids = await _lock(db, payment_ids)
+    if not ids:
+        return []
+    rows = await _fetch(db, _explicit_allocations(ids))
+    await _apply(db, rows)
+    if oldest_first:
+        more = await _fetch(db, _oldest_first_allocations(ids))
+        await _apply(db, more)
+        rows += more
+    return rows
+
+async def allocate_explicit(
+    db: AsyncSession,
+    payment_id: int,
+    items: Sequence[Tuple[int, Decimal]],
+) -> List[Dict]:
+    """按指定的 (发票ID, 金额) 核销一笔付款（不提交事务）"""
+    payment = (await db.execute(
+        select(Payment).where(Payment.id == payment_id).with_for_update()
+    )).scalar_one_or_none()
+    if payment is None:
+        raise AllocationError("付款记录不存在")
+    if payment.status == CANCELLED:
+        raise AllocationError("付款已取消")
+
+    totals: Dict[int, Decimal] = defaultdict(Decimal)
+    for invoice_id, amount in items:
+        if amount <= 0:
+            raise AllocationError("核销金额必须大于0")
+        totals[invoice_id] += amount
+    unapplied = payment.amount - (payment.allocated_amount or 0)
+    if sum(totals.values()) > unapplied:
+        raise AllocationError(f"核销金额超出付款未核销金额 {unapplied}")
+
+    invoices = (await db.execute(
+        select(Invoice).where(Invoice.id.in_(totals)).order_by(Invoice.id).with_for_update()
+    )).scalars().all()
+    found = {invoice.id: invoice for invoice in invoices}
+    partner = payment.customer_id if payment.payment_type == RECEIPT else payment.supplier_id
+    rows = []
+    for invoice_id, amount in sorted(totals.items()):
+        invoice = found.get(invoice_id)
+        if invoice is None or invoice.status == CANCELLED:
+            raise AllocationError(f"发票 {invoice_id} 不存在或已取消")
+        is_sales = invoice.invoice_type == SALES_INVOICE
+        if (RECEIPT if is_sales else DISBURSEMENT) != payment.payment_type:
+            raise AllocationError(f"发票 {invoice.number} 与付款类型不匹配")
+        invoice_partner = invoice.customer_id if is_sales else invoice.supplier_id
+        if partner is not None and partner != invoice_partner:
+            raise AllocationError(f"发票 {invoice.number} 不属于该往来单位")
+        if amount > (invoice.outstanding_amount or 0):
+            raise AllocationError(f"核销金额超出发票 {invoice.number} 的未付金额")
+        rows.append({
+            "payment_id": payment_id,
+            "invoice_id": invoice_id,
+            "invoice_type": invoice.invoice_type,
+            "amount": amount,
+        })
+    await _apply(db, rows)
+    return rows
+
+if __name__ == "__main__":
+    # 命令行批量核销: python -m services.settlement allocate
+    from utils.cli import run_command
+
+    async def _allocate(session) -> str:
+        rows = await allocate_payments(session)
+        await session.commit()
+        return f"付款核销完成，共 {len(rows)} 条核销明细"
+
+    run_command("services.settlement", "allocate", _allocate)
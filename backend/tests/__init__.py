@@ -0,0 +1 @@
+# 单元测试：在 backend 目录下运行 python -m pytest
@@ -0,0 +1,110 @@
+"""对账单解析与自动匹配"""
+from datetime import date
+from decimal import Decimal
+import pytest
+from services.bank_statement import (
+    MATCH_AMOUNT, MATCH_INVOICE_NUMBER, MATCH_PARTNER_AMOUNT, MATCH_PAYMENT,
+    OpenInvoice, OpenItems, StatementFormatError, StatementLine, match_lines, parse_statement,
+)
+from services.credit import RECEIPT
+from services.settlement import DISBURSEMENT
+
+DAY = date(2026, 3, 2)
+
+def _line(amount, reference=None, counterparty=None, description=None, line_no=1) -> StatementLine:
+    return StatementLine(line_no, DAY, Decimal(amount), reference, counterparty, description)
+
+def _items(*invoices: OpenInvoice, payments=(), partners=None) -> OpenItems:
+    items = OpenItems()
+    items.invoices = list(invoices)
+    items.payments = list(payments)
+    items.partners = partners or {}
+    return items
+
+def _invoice(id, number, amount, partner_id=10, kind=RECEIPT) -> OpenInvoice:
+    return OpenInvoice(id, number, kind, partner_id, Decimal(amount))
+
+def _matches(proposals):
+    return [(p.match_type, p.invoice_id, p.payment_id) for p in proposals]
+
+def test_registered_payment_matches_once():
+    items = _items(payments=[("R1", RECEIPT, Decimal("100.00"), 7)])
+    lines = [_line("100.00", reference="r1"), _line("100.00", reference="R1", line_no=2)]
+    # 重复的对账单行只能匹配一次已登记的收款
+    assert _matches(match_lines(lines, items)) == [(MATCH_PAYMENT, None, 7), (None, None, None)]
+
+def test_invoice_number_in_description_and_remaining_amount():
+    items = _items(_invoice(1, "INV001", "100.00"))
+    lines = [
+        _line("60.00", description="货款 inv001"),
+        _line("60.00", description="货款 INV001 尾款", line_no=2),
+        _line("40.00", description="INV001", line_no=3),
+    ]
+    # 第二行超出发票剩余未结金额，不匹配；第三行正好付清
+    assert _matches(match_lines(lines, items)) == [
+        (MATCH_INVOICE_NUMBER, 1, None),
+        (None, None, None),
+        (MATCH_INVOICE_NUMBER, 1, None),
+    ]
+
+def test_duplicate_lines_take_oldest_invoices_of_partner():
+    # 未结发票按到期日从旧到新排列
+    items = _items(
+        _invoice(1, "A1", "500.00"),
+        _invoice(2, "A2", "500.00"),
+        partners={(RECEIPT, "客户甲"): 10},
+    )
+    lines = [_line("500.00", counterparty="客户 甲", line_no=n) for n in (1, 2, 3)]
+    assert _matches(match_lines(lines, items)) == [
+        (MATCH_PARTNER_AMOUNT, 1, None),
+        (MATCH_PARTNER_AMOUNT, 2, None),
+        (None, None, None),
+    ]
+
+def test_amount_only_match_requires_unique_invoice():
+    ambiguous = _items(_invoice(1, "A1", "300.00", partner_id=10), _invoice(2, "B1", "300.00", partner_id=20))
+    assert _matches(match_lines([_line("300.00")], ambiguous)) == [(None, None, None)]
+
+    unique = _items(_invoice(1, "A1", "300.00", partner_id=10))
+    proposals = match_lines([_line("300.00"), _line("300.00", line_no=2)], unique)
+    assert _matches(proposals) == [(MATCH_AMOUNT, 1, None), (None, None, None)]
+    assert proposals[0].partner_id == 10
+
+def test_outgoing_amount_matches_purchase_invoice_only():
+    items = _items(
+        _invoice(1, "X1", "80.00", kind=RECEIPT),
+        _invoice(2, "X1", "80.00", kind=DISBURSEMENT),
+    )
+    (proposal,) = match_lines([_line("-80.00", description="X1")], items)
+    assert (proposal.kind, proposal.match_type, proposal.invoice_id) == (DISBURSEMENT, MATCH_INVOICE_NUMBER, 2)
+
+def test_parse_csv_with_credit_and_debit_columns():
+    text = [
+        "交易日期,收入,支出,交易参考号,对方户名,摘要\n",
+        "2026/03/01,\"1,200.50\",,R1,客户甲,INV001\n",
+        "2026/03/02,,300,R2,供应商乙,\n",
+        ",,,,,\n",
+    ]
+    lines = list(parse_statement(text))
+    assert [(l.line_no, l.value_date, l.amount, l.reference) for l in lines] == [
+        (2, date(2026, 3, 1), Decimal("1200.50"), "R1"),
+        (3, date(2026, 3, 2), Decimal(-300), "R2"),
+    ]
+    assert lines[0].counterparty == "客户甲"
+
+def test_parse_mt940():
+    text = [
+        ":20:STATEMENT\n",
+        ":61:2603020302C1200,50NTRFINV001//B123\n",
+        ":86:货款 客户甲\n",
+        "续行\n",
+        ":61:2603030303D300,NTRFNONREF//B456\n",
+        "-}\n",
+    ]
+    first, second = parse_statement(text)
+    assert (first.amount, first.reference, first.description) == (Decimal("1200.50"), "INV001", "货款 客户甲 续行")
+    assert (second.value_date, second.amount, second.reference) == (date(2026, 3, 3), Decimal(-300), "B456")
+
+def test_parse_rejects_unknown_csv_header():
+    with pytest.raises(StatementFormatError):
+        list(parse_statement(["名称,数量\n", "a,1\n"]))
@@ -0,0 +1,72 @@
+"""幂等中间件对请求体、响应体和状态码的处理"""
+import asyncio
+import pytest
+from starlette.responses import Response
+from config import settings
+from utils import idempotency
+from utils.idempotency import IdempotencyMiddleware
+
+def _scope(content_type: str = "application/json", content_length: str = "") -> dict:
+    headers = [(b"idempotency-key", b"k1"), (b"authorization", b"Bearer t"), (b"content-type", content_type.encode())]
+    if content_length:
+        headers.append((b"content-length", content_length.encode()))
+    return {"type": "http", "method": "POST", "path": "/api/x", "query_string": b"", "headers": headers}
+
+def _call(app, scope, chunks=(b"{}",)):
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks)
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(IdempotencyMiddleware(app)(scope, receive, send))
+    return sent[0]["status"]
+
+@pytest.fixture
+def store(monkeypatch):
+    calls = []
+
+    async def claim(username, key, request_hash):
+        calls.append("claim")
+        return True
+
+    async def complete(username, key, status_code, content_type, body):
+        calls.append(("complete", status_code, body))
+
+    async def release(username, key):
+        calls.append("release")
+
+    monkeypatch.setattr(idempotency, "_username", lambda headers: "alice")
+    monkeypatch.setattr(idempotency, "_claim", claim)
+    monkeypatch.setattr(idempotency, "_complete", complete)
+    monkeypatch.setattr(idempotency, "_release", release)
+    return calls
+
+def _app(status_code: int, body: bytes = b"ok"):
+    async def app(scope, receive, send):
+        await receive()
+        await Response(body, status_code=status_code)(scope, receive, send)
+    return app
+
+@pytest.mark.parametrize("status_code, stored", [(201, True), (409, True), (422, True), (400, False), (403, False), (500, False)])
+def test_only_success_and_conflict_responses_are_stored(store, status_code, stored):
+    assert _call(_app(status_code), _scope()) == status_code
+    assert store[-1] == (("complete", status_code, b"ok") if stored else "release")
+
+def test_streamed_and_oversized_requests_are_rejected(store, monkeypatch):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_MAX_REQUEST_BYTES", 4)
+    assert _call(_app(201), _scope("multipart/form-data; boundary=x")) == 400
+    assert _call(_app(201), _scope(content_length="5")) == 413
+    assert _call(_app(201), _scope(), chunks=(b"{}", b"{}", b"{}")) == 413
+    assert store == []
+
+def test_oversized_response_keeps_only_status(store, monkeypatch):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_MAX_RESPONSE_BYTES", 4)
+    assert _call(_app(201, b"too large"), _scope()) == 201
+    assert store[-1] == ("complete", 201, None)
@@ -0,0 +1,35 @@
+"""库存余额的移动加权平均计价"""
+from decimal import Decimal
+from services.inventory import EMPTY_BALANCE, INBOUND, OUTBOUND, apply_delta, collect_deltas
+
+KEY = (1, 1, None, None)
+
+def _movement(movement_type, quantity, unit_cost=None) -> dict:
+    return {
+        "product_id": 1, "warehouse_id": 1, "location_id": None, "batch_number": None,
+        "movement_type": movement_type, "quantity": Decimal(quantity),
+        "unit_cost": None if unit_cost is None else Decimal(unit_cost),
+    }
+
+def _post(balance, *movements):
+    return apply_delta(balance, collect_deltas(movements)[KEY])
+
+def test_moving_average_follows_posting_order():
+    balance = _post(EMPTY_BALANCE, _movement(INBOUND, "10", "5"))
+    balance = _post(balance, _movement(OUTBOUND, "4"))
+    assert balance == (Decimal("6.00"), Decimal("5.0000"), Decimal("30.00"))
+    # 6 × 5 + 6 × 10 = 90，平均 7.5；全部入库的加权平均则是 (50 + 60) / 16 = 6.875
+    balance = _post(balance, _movement(INBOUND, "6", "10"))
+    assert balance == (Decimal("12.00"), Decimal("7.5000"), Decimal("90.00"))
+
+def test_outbound_in_same_batch_uses_average_before_batch():
+    balance = _post(EMPTY_BALANCE, _movement(INBOUND, "10", "5"))
+    balance = _post(balance, _movement(INBOUND, "10", "15"), _movement(OUTBOUND, "10"))
+    # 出库按批前平均成本 5 计价: 50 + 150 - 50
+    assert balance == (Decimal("10.00"), Decimal("15.0000"), Decimal("150.00"))
+
+def test_unit_cost_rounded_like_the_column_and_kept_at_zero_quantity():
+    balance = _post(EMPTY_BALANCE, _movement(INBOUND, "3", "10"), _movement(INBOUND, "3", "10.0001"))
+    assert balance == (Decimal("6.00"), Decimal("10.0001"), Decimal("60.00"))
+    balance = _post(balance, _movement(OUTBOUND, "6"))
+    assert balance == (Decimal("0.00"), Decimal("10.0001"), Decimal("0.00"))
@@ -0,0 +1,106 @@
+"""MRP 净算与多层展开"""
+from datetime import date, timedelta
+from decimal import Decimal
+import pytest
+from services.bom import BomGraph, effective_quantity
+from services.mrp import MrpInput, ProductParams, run_mrp
+
+TODAY = date(2026, 3, 2)
+# 成品A -> 2×B（损耗10%）+ 1×D；半成品B -> 3×C + 1×D；C、D 外购
+A, B, C, D = 1, 2, 3, 4
+
+def _input() -> MrpInput:
+    data = MrpInput(TODAY)
+    data.products = {
+        A: ProductParams(A, 3, 1, 0, True),
+        B: ProductParams(B, 2, 1, 0, True),
+        C: ProductParams(C, 5, 100, 0, False),
+        D: ProductParams(D, 1, 0, 0, False),
+    }
+    graph = BomGraph()
+    graph.bom_of = {A: 101, B: 102}
+    graph.lines[101] = [(B, effective_quantity(2, 10)), (D, Decimal(1))]
+    graph.lines[102] = [(C, Decimal(3)), (D, Decimal(1))]
+    data.bom = graph
+    data.available = {A: Decimal(2)}
+    data.demands = [(A, TODAY + timedelta(days=20), Decimal(10))]
+    return data
+
+def _by_product(orders):
+    result = {}
+    for order in orders:
+        result.setdefault(order.product_id, []).append(order)
+    return result
+
+def test_low_level_codes_use_deepest_level():
+    assert _input().bom.low_level_codes() == {A: 0, B: 1, C: 2, D: 2}
+
+def test_multi_level_netting_with_scrap_and_lot_sizes():
+    result = run_mrp(_input())
+    made = _by_product(result.planned_work_orders)
+    bought = _by_product(result.purchase_suggestions)
+    assert set(made) == {A, B}
+    assert set(bought) == {C, D}
+
+    # A：需求10，库存2，净需求8，按提前期3天倒推下达
+    (a,) = made[A]
+    assert (a.net_requirement, a.quantity) == (Decimal(8), Decimal(8))
+    assert a.due_date == TODAY + timedelta(days=20)
+    assert a.release_date == TODAY + timedelta(days=17)
+
+    # B：8 × 2 × 1.1 = 17.6，按批量1取整为18，在A下达日需要
+    (b,) = made[B]
+    assert b.net_requirement == Decimal("17.6")
+    assert b.quantity == Decimal(18)
+    assert b.due_date == TODAY + timedelta(days=17)
+    assert b.release_date == TODAY + timedelta(days=15)
+
+    # C：18 × 3 = 54，按批量100取整
+    (c,) = bought[C]
+    assert (c.net_requirement, c.quantity) == (Decimal(54), Decimal(100))
+    assert c.release_date == TODAY + timedelta(days=10)
+    assert c.low_level_code == 2
+
+    # D 同时被A和B使用，两个日期的需求分别净算
+    assert [(d.due_date, d.quantity) for d in bought[D]] == [
+        (TODAY + timedelta(days=15), Decimal(18)),
+        (TODAY + timedelta(days=17), Decimal(8)),
+    ]
+
+def test_scheduled_receipts_and_surplus_carry_forward():
+    data = _input()
+    data.receipts = [(C, TODAY + timedelta(days=12), Decimal(30))]
+    data.demands.append((A, TODAY + timedelta(days=25), Decimal(2)))
+    result = run_mrp(data)
+
+    # C 的在途30先抵扣，净需求24，批量取整后100
+    (c,) = _by_product(result.purchase_suggestions)[C]
+    assert (c.net_requirement, c.quantity) == (Decimal(24), Decimal(100))
+    # B 第一次按批量取整多出的0.4用于第二次需求：2 × 2.2 = 4.4 - 0.4 = 4
+    assert [b.net_requirement for b in _by_product(result.planned_work_orders)[B]] == [
+        Decimal("17.6"), Decimal("4.0")
+    ]
+
+def test_late_release_and_safety_stock():
+    data = MrpInput(TODAY)
+    data.products = {C: ProductParams(C, 5, 0, 20, False)}
+    data.available = {C: Decimal(5)}
+    data.demands = [(C, TODAY + timedelta(days=2), Decimal(10))]
+    result = run_mrp(data)
+
+    first, second = result.purchase_suggestions
+    # 低于安全库存的部分当天补足；提前期不足时下达日期取今天并标记延误
+    assert (first.due_date, first.quantity) == (TODAY, Decimal(15))
+    assert (first.release_date, first.is_late) == (TODAY, True)
+    assert (second.due_date, second.quantity) == (TODAY + timedelta(days=2), Decimal(10))
+    assert (second.release_date, second.is_late) == (TODAY, True)
+
+def test_bom_cycle_is_rejected():
+    graph = BomGraph()
+    graph.bom_of = {A: 101, B: 102}
+    graph.lines[101] = [(B, Decimal(1))]
+    graph.lines[102] = [(A, Decimal(1))]
+    data = MrpInput(TODAY)
+    data.bom = graph
+    with pytest.raises(ValueError, match="循环"):
+        run_mrp(data)
@@ -0,0 +1,65 @@
+"""单据明细的金额计算和按ID替换"""
+import pytest
+from decimal import Decimal
+from types import SimpleNamespace
+from services.orders import LineChangeError, apply_totals, apply_totals_to_values, compute_totals, plan_line_changes
+
+def _line(quantity, unit_price, discount_rate=None, **extra) -> dict:
+    line = {"product_id": 1, "quantity": Decimal(quantity), "unit_price": Decimal(unit_price), **extra}
+    if discount_rate is not None:
+        line["discount_rate"] = Decimal(discount_rate)
+    return line
+
+def test_line_totals_round_half_up_to_cents():
+    rows, subtotal, tax_amount, total = compute_totals(
+        [_line("3", "0.335"), _line("1", "33.33", "10"), _line("2", "19.99", notes="备注")],
+        Decimal(13),
+    )
+    # 1.005 -> 1.01，29.997 -> 30.00
+    assert [row["line_total"] for row in rows] == [Decimal("1.01"), Decimal("30.00"), Decimal("39.98")]
+    assert rows[0]["discount_rate"] == 0
+    assert rows[2]["notes"] == "备注"
+    assert subtotal == Decimal("70.99")
+    # 70.99 × 13% = 9.2287 -> 9.23
+    assert (tax_amount, total) == (Decimal("9.23"), Decimal("80.22"))
+
+def test_tax_rounding_half_up():
+    _, subtotal, tax_amount, total = compute_totals([_line("1", "0.50")], Decimal(13))
+    # 0.065 -> 0.07
+    assert (subtotal, tax_amount, total) == (Decimal("0.50"), Decimal("0.07"), Decimal("0.57"))
+
+def test_apply_totals_without_lines_zeroes_header():
+    header = SimpleNamespace(tax_rate=Decimal(13), subtotal=Decimal(100), tax_amount=Decimal(13), total_amount=Decimal(113))
+    assert apply_totals(header, []) == []
+    assert (header.subtotal, header.tax_amount, header.total_amount) == (0, 0, 0)
+
+def test_missing_tax_rate_defaults_to_13_percent():
+    header = SimpleNamespace(tax_rate=None, subtotal=None, tax_amount=None, total_amount=None)
+    apply_totals(header, [_line("1", "100")])
+    assert (header.subtotal, header.tax_amount, header.total_amount) == (
+        Decimal("100.00"), Decimal("13.00"), Decimal("113.00")
+    )
+
+def test_apply_totals_to_values_uses_given_tax_rate():
+    values = {"tax_rate": Decimal(0), "total_amount": Decimal(999)}
+    rows = apply_totals_to_values(values, [_line("2", "10")])
+    assert rows[0]["line_total"] == Decimal("20.00")
+    assert (values["subtotal"], values["tax_amount"], values["total_amount"]) == (
+        Decimal("20.00"), Decimal("0.00"), Decimal("20.00")
+    )
+
+def test_plan_line_changes_matches_lines_by_id():
+    existing = {10: 1, 11: 2, 12: 3}
+    rows = [_line("1", "5", id=10), _line("2", "5", id=11, product_id=4), _line("3", "5")]
+    updates, inserts, removed, changed = plan_line_changes(existing, rows)
+    assert [row["id"] for row in updates] == [10, 11]
+    assert inserts == [rows[2]]
+    assert (removed, changed) == ({12}, {11})
+
+@pytest.mark.parametrize("rows", [
+    [_line("1", "5", id=99)],
+    [_line("1", "5", id=10), _line("2", "5", id=10)],
+])
+def test_plan_line_changes_rejects_foreign_or_duplicate_ids(rows):
+    with pytest.raises(LineChangeError):
+        plan_line_changes({10: 1}, rows)
@@ -0,0 +1,62 @@
+"""分页游标的编码和校验"""
+import pytest
+from datetime import date
+from decimal import Decimal
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
+from models.finance import Invoice
+from utils.pagination import (
+    _decode_offset_cursor, _sort_key_parser, _with_key, decode_cursor, encode_cursor, keyset_condition
+)
+
+def _sql(condition) -> str:
+    return str(condition.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+def test_keyset_cursor_round_trip():
+    assert decode_cursor(encode_cursor(42, "prev")) == (42, "prev")
+
+@pytest.mark.parametrize("cursor", [
+    encode_cursor("42", "next"),
+    encode_cursor(True, "next"),
+    encode_cursor([1, 2], "next"),
+    encode_cursor({"offset": 100}, "next"),
+    encode_cursor(42, "up"),
+    "不是游标",
+])
+def test_malformed_keyset_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(cursor)
+    assert exc.value.status_code == 400
+
+def test_offset_cursor():
+    assert _decode_offset_cursor(encode_cursor({"offset": 200}, "next")) == 200
+    for cursor in (encode_cursor(200, "next"), encode_cursor({"offset": -1}, "prev"), encode_cursor({}, "next")):
+        with pytest.raises(HTTPException):
+            _decode_offset_cursor(cursor)
+
+def test_sort_keys_end_with_primary_key():
+    assert _with_key([(Invoice.number, True)], Invoice.id) == [(Invoice.number, True), (Invoice.id, False)]
+    # 主键之后的排序列不影响顺序
+    assert _with_key([(Invoice.id, True), (Invoice.number, False)], Invoice.id) == [(Invoice.id, True)]
+
+def test_keyset_condition_uses_row_comparison_for_same_direction_non_null_columns():
+    condition = keyset_condition([(Invoice.number, True), (Invoice.id, True)], ["INV-9", 7])
+    assert _sql(condition) == "(invoices.number, invoices.id) < ('INV-9', 7)"
+
+def test_keyset_condition_expands_mixed_directions_and_nulls():
+    sort = [(Invoice.due_date, True), (Invoice.outstanding_amount, False), (Invoice.id, False)]
+    assert _sql(keyset_condition(sort, [date(2026, 1, 31), Decimal("5.00"), 7])) == (
+        "invoices.due_date < '2026-01-31'"
+        " OR invoices.due_date = '2026-01-31' AND (invoices.outstanding_amount > 5.00 OR invoices.outstanding_amount IS NULL)"
+        " OR invoices.due_date = '2026-01-31' AND invoices.outstanding_amount = 5.00 AND invoices.id > 7"
+    )
+    # 降序时 NULL 排在最前，其后是全部非空值
+    assert _sql(keyset_condition(sort, [None, None, 7])).startswith("invoices.due_date IS NOT NULL OR ")
+
+def test_sort_cursor_values_are_converted_by_column_type():
+    sort = _with_key([(Invoice.due_date, True), (Invoice.outstanding_amount, False)], Invoice.id)
+    key, _ = decode_cursor(encode_cursor(["2026-01-31", "5.00", 7], "next"), _sort_key_parser(sort))
+    assert key == [date(2026, 1, 31), Decimal("5.00"), 7]
+    for bad in (["2026-01-31", "5.00"], ["2026-13-01", "5.00", 7], [20260131, "5.00", 7], ["2026-01-31", "x", 7]):
+        with pytest.raises(HTTPException):
+            decode_cursor(encode_cursor(bad, "next"), _sort_key_parser(sort))
@@ -0,0 +1,101 @@
+"""有限产能工序排程"""
+from datetime import datetime
+import pytest
+from services.scheduling import (
+    DAY_MINUTES, Calendar, CapacityError, Job, ScheduleInput, reschedule_order, schedule
+)
+
+# 工作中心每天 08:00 起 8 小时产能，效率100%；时间均为距原点（当天0点）的分钟
+DAY_START = 8 * 60
+
+def _minutes(day: int, hour: int, minute: int = 0) -> int:
+    return day * DAY_MINUTES + hour * 60 + minute
+
+def _input(*jobs: Job) -> ScheduleInput:
+    data = ScheduleInput(datetime(2026, 3, 2), now=0)
+    for center in ("A", "B"):
+        data.calendars[center] = Calendar(8, 100, DAY_START)
+    data.jobs = {job.work_order_id: job for job in jobs}
+    return data
+
+def _job(work_order_id, operations, priority=2, due=None, release=None) -> Job:
+    job = Job(work_order_id, priority, due, release)
+    job.operations = list(operations)
+    return job
+
+def test_calendar_spans_days():
+    calendar = Calendar(8, 100, DAY_START)
+    # 第一天 14:00 开始 4 小时的工序，次日 10:00 结束
+    start = calendar.working(_minutes(0, 14))
+    assert calendar.start_time(start) == _minutes(0, 14)
+    assert calendar.end_time(start + 240) == _minutes(1, 10)
+    # 效率50%时工时加倍
+    assert Calendar(8, 50, DAY_START).duration(30, 1.5, 20) == 120
+
+def test_calendar_window_past_midnight():
+    # 08:00 起 20 小时产能，时段到次日 04:00
+    calendar = Calendar(20, 100, DAY_START)
+    assert calendar.working(_minutes(1, 3)) == 19 * 60
+    # 次日 04:00-08:00 不可用，归并到时段末尾
+    assert calendar.working(_minutes(1, 6)) == 20 * 60
+    start = calendar.working(_minutes(0, 22))
+    assert calendar.end_time(start + 8 * 60) == _minutes(1, 10)
+    assert Calendar(24, 100, DAY_START).end_time(24 * 60) == _minutes(1, 8)
+
+def test_capacity_over_a_day_is_rejected():
+    with pytest.raises(CapacityError):
+        Calendar(25, 100, DAY_START)
+
+def test_forward_respects_sequence_and_priority():
+    data = _input(
+        _job(1, [(11, "A", 60), (12, "B", 120)]),
+        _job(2, [(21, "A", 30)], priority=0),
+    )
+    result = schedule(data)
+    # 紧急工单先占用A，工单1的第二道工序在第一道完工后才在B开始
+    assert result.times[21] == (_minutes(0, 8), _minutes(0, 8, 30))
+    assert result.times[11] == (_minutes(0, 8, 30), _minutes(0, 9, 30))
+    assert result.times[12] == (_minutes(0, 9, 30), _minutes(0, 11, 30))
+    assert result.late_orders == []
+
+def test_forward_late_when_finish_after_due():
+    data = _input(_job(1, [(11, "A", 600)], due=DAY_MINUTES))
+    result = schedule(data)
+    assert result.times[11] == (_minutes(0, 8), _minutes(1, 10))
+    assert result.late_orders == [1]
+
+def test_backward_plans_as_late_as_possible():
+    # 交期为第三天结束，工序在第三天可用时段末尾完工
+    data = _input(_job(1, [(11, "A", 60), (12, "B", 60)], due=3 * DAY_MINUTES))
+    result = schedule(data, "backward")
+    assert result.times[12] == (_minutes(2, 15), _minutes(2, 16))
+    assert result.times[11] == (_minutes(2, 14), _minutes(2, 15))
+    assert result.late_orders == []
+
+def test_backward_late_order_and_missing_due():
+    # 10小时的工序在当天结束的交期前无法排完，开工时间早于现在
+    data = _input(
+        _job(1, [(11, "A", 600)], due=DAY_MINUTES),
+        _job(2, [(21, "B", 60)]),
+    )
+    result = schedule(data, "backward")
+    begin, finish = result.times[11]
+    assert finish == _minutes(0, 16)
+    assert begin < data.now
+    assert result.late_orders == [1]
+    assert result.unscheduled_orders == [2]
+    assert 21 not in result.times
+
+def test_reschedule_fills_first_gap_that_fits():
+    busy = {"A": [(_minutes(0, 8), _minutes(0, 9)), (_minutes(0, 10), _minutes(0, 15))]}
+    # 60分钟的工序放进 09:00-10:00 的空档
+    data = _input(_job(1, [(11, "A", 60), (12, "B", 30)]))
+    result = reschedule_order(data, 1, busy)
+    assert result.times[11] == (_minutes(0, 9), _minutes(0, 10))
+    assert result.times[12] == (_minutes(0, 10), _minutes(0, 10, 30))
+
+    # 90分钟的工序放不进空档，从 15:00 开始，当天 16:00 收工后次日继续，晚于交期
+    data = _input(_job(1, [(11, "A", 90)], due=DAY_MINUTES))
+    result = reschedule_order(data, 1, busy)
+    assert result.times[11] == (_minutes(0, 15), _minutes(1, 8, 30))
+    assert result.late_orders == [1]
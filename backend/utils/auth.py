@@ -1,15 +1,37 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import HTTPException, status
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from config import settings
-
-print("正在加载认证工具...")
+from database import get_db
+from models.user import User
+from utils.cache import TTLCache
 
 # 密码加密上下文
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+security = HTTPBearer()
+
+# 已解码令牌缓存: token -> payload
+_token_cache = TTLCache(maxsize=settings.AUTH_CACHE_MAX_SIZE, ttl=settings.AUTH_CACHE_TTL_SECONDS)
+# 用户快照缓存: username -> 用户字段字典（不含密码哈希）
+_user_cache = TTLCache(maxsize=settings.AUTH_CACHE_MAX_SIZE, ttl=settings.AUTH_CACHE_TTL_SECONDS)
+_USER_SNAPSHOT_FIELDS = [c.name for c in User.__table__.columns if c.name != "hashed_password"]
+
+# bcrypt计算放到独立线程池，避免阻塞事件循环
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+)
+# 同时排队+计算的哈希任务上限，等待空位超时后返回503
+_hash_slots = asyncio.Semaphore(settings.PASSWORD_HASH_MAX_CONCURRENCY)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """验证密码"""
     return pwd_context.verify(plain_password, hashed_password)
@@ -18,6 +40,29 @@ def get_password_hash(password: str) -> str:
     """生成密码哈希"""
     return pwd_context.hash(password)
 
+async def _run_hash_task(func, *args):
+    try:
+        await asyncio.wait_for(_hash_slots.acquire(), settings.PASSWORD_HASH_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="系统繁忙，请稍后重试",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, func, *args)
+    finally:
+        _hash_slots.release()
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """在线程池中验证密码"""
+    return await _run_hash_task(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """在线程池中生成密码哈希"""
+    return await _run_hash_task(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """创建访问令牌"""
     to_encode = data.copy()
@@ -49,6 +94,56 @@ def verify_token(token: str) -> dict:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+def decode_token_cached(token: str) -> dict:
+    """验证令牌，结果按令牌缓存，缓存时间不超过令牌剩余有效期"""
+    payload = _token_cache.get(token)
+    if payload is not None:
+        if payload["exp"] > time.time():
+            return payload
+        _token_cache.pop(token)
+    payload = verify_token(token)
+    exp = payload.get("exp")
+    if exp is not None:
+        _token_cache.set(token, payload, ttl=exp - time.time())
+    return payload
+
+def invalidate_user_cache(username: Optional[str] = None) -> None:
+    """使用户快照缓存失效，username 为空时清空全部"""
+    if username is None:
+        _user_cache.clear()
+    else:
+        _user_cache.pop(username)
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """获取当前用户（各路由共用的认证依赖）
+
+    用户信息按用户名缓存，返回的是不绑定会话的 User 实例，
+    修改或删除用户时需调用 invalidate_user_cache。
+    """
+    payload = decode_token_cached(credentials.credentials)
+    username = payload.get("sub")
+
+    snapshot = _user_cache.get(username)
+    if snapshot is None:
+        result = await db.execute(
+            select(User).where(User.username == username)
+        )
+        user = result.scalar_one_or_none()
+
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="用户不存在"
+            )
+
+        snapshot = {field: getattr(user, field) for field in _USER_SNAPSHOT_FIELDS}
+        _user_cache.set(username, snapshot)
+
+    return User(**snapshot)
+
 def get_current_user_id(token: str) -> int:
     """从令牌获取当前用户ID"""
     payload = verify_token(token)
@@ -59,6 +154,4 @@ def get_current_user_id(token: str) -> int:
             detail="无效的用户信息",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    return user_id
-
-print("认证工具加载完成")
\ No newline at end of file
+    return user_id
\ No newline at end of file
@@ -0,0 +1,34 @@
+"""维护任务的命令行入口
+
+各服务模块在 __main__ 中声明命令名和任务，由 run_command 统一解析参数、
+创建会话、执行任务并在结束后关闭连接池：
+
+    if __name__ == "__main__":
+        from utils.cli import run_command
+
+        async def _rebuild(session) -> str:
+            return f"重算完成，共 {await rebuild(session)} 行"
+
+        run_command("services.inventory", "rebuild", _rebuild)
+"""
+import asyncio
+import sys
+from typing import Awaitable, Callable
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, dispose_engine
+
+Task = Callable[[AsyncSession], Awaitable[str]]
+
+async def _run(task: Task) -> str:
+    try:
+        async with AsyncSessionLocal() as session:
+            return await task(session)
+    finally:
+        await dispose_engine()
+
+def run_command(module: str, command: str, task: Task) -> None:
+    """python -m <module> <command>：参数不符时打印用法并退出，否则执行任务并打印其返回的结果"""
+    if sys.argv[1:] != [command]:
+        print(f"用法: python -m {module} {command}")
+        sys.exit(1)
+    print(asyncio.run(_run(task)))
@@ -0,0 +1,37 @@
+"""详情接口的 expand= 参数
+
+各详情接口声明可展开的关系及其加载选项：多对一关系用 joinedload 随主查询
+一起取回，一对多关系用 selectinload，每个关系只多一条 WHERE ... IN 查询。
+打开一张单据的查询条数只取决于展开了哪些关系，与明细行数无关，也不会在
+AsyncSession 中触发延迟加载。未展开的关系在响应中为 null。
+"""
+from typing import Any, Dict, List, Optional, Sequence
+from fastapi import HTTPException, status
+from sqlalchemy import inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+def parse_expand(expand: Optional[str], options: Dict[str, Any]) -> List[Any]:
+    """解析逗号分隔的 expand 参数，返回对应的加载选项，不支持的名称返回400"""
+    names = [name.strip() for name in (expand or "").split(",") if name.strip()]
+    unknown = [name for name in names if name not in options]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不支持展开: {', '.join(unknown)}，可选: {', '.join(options)}"
+        )
+    return [options[name] for name in dict.fromkeys(names)]
+
+async def load_document(db: AsyncSession, model, id: int, options: Sequence[Any] = ()):
+    """按ID读取单据并按 options 预加载关系，不存在时返回 None"""
+    result = await db.execute(
+        select(model)
+        .options(*options)
+        .where(model.id == id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalar_one_or_none()
+
+def loaded_fields(obj) -> Dict[str, Any]:
+    """实例已加载的列和关系，用于 model_validate（读取时不会触发延迟加载）"""
+    state = inspect(obj)
+    return {key: state.dict[key] for key in state.mapper.attrs.keys() if key in state.dict}
\ No newline at end of file
@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import AsyncIterator, Literal
+from fastapi.responses import StreamingResponse
+from config import settings
+from database import AsyncSessionLocal
+
+ExportFormat = Literal["ndjson", "csv"]
+
+_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+def _json_default(value):
+    """JSON编码补充：金额保留原始精度输出为字符串，日期输出ISO格式"""
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"无法序列化类型: {type(value).__name__}")
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+async def stream_rows(stmt, fmt: ExportFormat) -> AsyncIterator[bytes]:
+    """通过服务端游标分块读取查询结果并逐块编码输出
+
+    使用独立会话，不依赖请求级会话的生命周期；每次只在内存中保留
+    EXPORT_CHUNK_SIZE 行。
+    """
+    chunk_size = settings.EXPORT_CHUNK_SIZE
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(stmt.execution_options(yield_per=chunk_size))
+        columns = list(result.keys())
+
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            # 带BOM便于Excel正确识别中文
+            buffer.write("\ufeff")
+            writer.writerow(columns)
+            async for rows in result.partitions(chunk_size):
+                writer.writerows([_csv_value(v) for v in row] for row in rows)
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate(0)
+            if buffer.tell():
+                yield buffer.getvalue().encode("utf-8")
+        else:
+            async for rows in result.partitions(chunk_size):
+                lines = [
+                    json.dumps(dict(zip(columns, row)), default=_json_default, ensure_ascii=False)
+                    for row in rows
+                ]
+                yield ("\n".join(lines) + "\n").encode("utf-8")
+
+def export_response(stmt, fmt: ExportFormat, filename: str) -> StreamingResponse:
+    """构造流式导出响应"""
+    extension = "csv" if fmt == "csv" else "ndjson"
+    return StreamingResponse(
+        stream_rows(stmt, fmt),
+        media_type=_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{extension}"'},
+    )
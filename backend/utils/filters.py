@@ -0,0 +1,192 @@
+"""列表接口的筛选和排序
+
+各路由用 list_query(模型, filters=可筛选字段, sorts=可排序字段) 声明白名单，
+得到的依赖从查询参数解析出 WHERE / ORDER BY 条件：
+
+    status=已确认                    等于（同一参数出现多次时按 IN 处理）
+    status__ne=已取消                不等于
+    status__in=待确认,已确认         IN
+    invoice_date__between=2026-01-01,2026-01-31
+    invoice_date__gte=2026-01-01     另有 __gt、__lte、__lt
+    sort=-invoice_date,number        多列排序，前缀 - 表示降序
+
+参数值按列类型转换（日期、时间、数字、布尔）。时间列传入日期时按整天处理，
+如 movement_date__lte=2026-01-31 包含当天全部记录。不在白名单中的普通参数
+会被忽略（可能是路由自身的参数），白名单字段的未知运算符、不在白名单中的
+排序字段和无法转换的值返回400。
+
+排序末尾总会追加主键以保证顺序稳定，分页都使用键集分页：未指定排序时按
+主键，指定排序时按 (排序列…, id)，游标中保存末行的排序列值。只有搜索
+相关度排序（ranked）使用偏移分页。
+"""
+import operator
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from fastapi import HTTPException, Query, Request, Response, status
+from sqlalchemy import Boolean, Date, DateTime, Integer, Numeric
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.pagination import SortKey, paginate, paginate_offset
+
+# 单个 IN 条件最多的取值个数
+MAX_IN_VALUES = 500
+
+_TRUE = {"true", "1", "yes"}
+_FALSE = {"false", "0", "no"}
+
+def _bad_request(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+def _convert(column, field: str, raw: str) -> Any:
+    """按列类型转换参数值，时间列传入日期时返回 date"""
+    column_type = column.type
+    try:
+        if isinstance(column_type, Boolean):
+            value = raw.strip().lower()
+            if value in _TRUE:
+                return True
+            if value in _FALSE:
+                return False
+            raise ValueError(raw)
+        if isinstance(column_type, DateTime):
+            if len(raw.strip()) == 10:
+                return date.fromisoformat(raw.strip())
+            return datetime.fromisoformat(raw.strip())
+        if isinstance(column_type, Date):
+            return date.fromisoformat(raw.strip())
+        if isinstance(column_type, Integer):
+            return int(raw)
+        if isinstance(column_type, Numeric):
+            return Decimal(raw)
+    except (ValueError, InvalidOperation):
+        raise _bad_request(f"无效的筛选值: {field}={raw}")
+    return raw
+
+def _day_range(column, value: Any) -> Tuple[Any, Any]:
+    """时间列的日期参数展开为 [当天0点, 次日0点)，其他情况返回 (值, None)"""
+    if isinstance(column.type, DateTime) and not isinstance(value, datetime):
+        start = datetime.combine(value, datetime.min.time())
+        return start, start + timedelta(days=1)
+    return value, None
+
+def _split(raw: str) -> List[str]:
+    return [part for part in (p.strip() for p in raw.split(",")) if part]
+
+_COMPARE = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+}
+
+def _condition(column, field: str, op: str, values: List[str]):
+    if op == "in" or (op == "eq" and len(values) > 1):
+        items = [item for raw in values for item in _split(raw)]
+        if not items or len(items) > MAX_IN_VALUES:
+            raise _bad_request(f"{field} 的取值个数应为1-{MAX_IN_VALUES}个")
+        return column.in_([_convert(column, field, item) for item in items])
+
+    raw = values[-1]
+    if op == "between":
+        bounds = _split(raw)
+        if len(bounds) != 2:
+            raise _bad_request(f"{field}__between 需要两个以逗号分隔的值")
+        low, _ = _day_range(column, _convert(column, field, bounds[0]))
+        high, high_end = _day_range(column, _convert(column, field, bounds[1]))
+        if high_end is not None:
+            return (column >= low) & (column < high_end)
+        return column.between(low, high)
+
+    value, day_end = _day_range(column, _convert(column, field, raw))
+    if day_end is None:
+        return _COMPARE[op](column, value)
+    # 时间列按整天比较
+    if op == "eq":
+        return (column >= value) & (column < day_end)
+    if op == "ne":
+        return (column < value) | (column >= day_end)
+    if op == "gte":
+        return column >= value
+    if op == "gt":
+        return column >= day_end
+    if op == "lt":
+        return column < value
+    return column < day_end
+
+OPERATORS = ("in", "between", *_COMPARE)
+
+class ListQuery:
+    """解析后的筛选条件和排序"""
+    __slots__ = ("conditions", "sort")
+
+    def __init__(self, conditions: list, sort: List[SortKey]):
+        self.conditions = conditions
+        self.sort = sort
+
+    def filter(self, stmt):
+        """追加筛选条件"""
+        return stmt.where(*self.conditions) if self.conditions else stmt
+
+    async def paginate(
+        self,
+        db: AsyncSession,
+        stmt,
+        key_column,
+        response: Response,
+        cursor: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100,
+        with_total: bool = False,
+        ranked: bool = False,
+        mappings: bool = False,
+    ) -> List[Any]:
+        """筛选后分页：指定排序时按排序列和主键做键集分页，
+        否则 ranked 表示 stmt 已自带排序（如搜索相关度），按该排序做偏移分页
+        """
+        stmt = self.filter(stmt)
+        page = dict(cursor=cursor, skip=skip, limit=limit, with_total=with_total, mappings=mappings)
+        if ranked and not self.sort:
+            return await paginate_offset(db, stmt, response, **page)
+        return await paginate(db, stmt, key_column, response, sort=self.sort, **page)
+
+def list_query(model, filters: Sequence[str] = (), sorts: Sequence[str] = ()) -> Callable[..., ListQuery]:
+    """生成解析筛选和排序参数的依赖，filters/sorts 为允许的模型字段名"""
+    filter_columns: Dict[str, Any] = {name: getattr(model, name) for name in filters}
+    sort_columns: Dict[str, Any] = {name: getattr(model, name) for name in sorts}
+    sort_columns["id"] = model.id
+
+    def dependency(
+        request: Request,
+        sort: Optional[str] = Query(
+            None, description=f"排序字段（逗号分隔，前缀 - 表示降序），可选: {', '.join(sort_columns)}"
+        ),
+    ) -> ListQuery:
+        conditions = []
+        params = request.query_params
+        for key in params.keys():
+            field, _, op = key.partition("__")
+            column = filter_columns.get(field)
+            if column is None:
+                if op:
+                    raise _bad_request(f"不支持按 {field} 筛选")
+                continue
+            op = op or "eq"
+            if op not in OPERATORS:
+                raise _bad_request(f"不支持的筛选运算符: {key}")
+            conditions.append(_condition(column, field, op, params.getlist(key)))
+
+        sort_fields = {}
+        for item in _split(sort or ""):
+            field = item.lstrip("-+")
+            if field not in sort_columns:
+                raise _bad_request(f"不支持按 {field} 排序")
+            sort_fields.setdefault(field, item.startswith("-"))
+        # 只按 id 升序与默认的键集分页相同
+        if list(sort_fields.items()) == [("id", False)]:
+            sort_fields = {}
+        sort_keys = [(sort_columns[field], descending) for field, descending in sort_fields.items()]
+        return ListQuery(conditions, sort_keys)
+
+    return dependency
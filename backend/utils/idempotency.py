@@ -0,0 +1,260 @@
+"""接口幂等（Idempotency-Key）
+
+客户端在 POST 请求上携带 Idempotency-Key 请求头后，同一用户在保留期内用同一键
+重试时直接返回首次请求的响应，不会重复创建单据（车间网络不稳定时客户端可放心重试）。
+
+处理流程：
+1. 用 INSERT ... ON CONFLICT (username, key) DO UPDATE ... WHERE 已过期 RETURNING
+   一条语句占用幂等键（过期的旧键被覆盖），并发的相同请求只有一个能占用成功；
+2. 占用成功则执行请求。成功响应（小于400）以及409、422保存下来用于重放；
+   其他4xx（未授权、参数错误等，修正后重试应当重新执行）和5xx删除占用以便重试。
+   响应体超过 IDEMPOTENCY_MAX_RESPONSE_BYTES 时只保存状态码，不保存响应体；
+3. 未占用成功时读取已有记录：已完成且请求摘要相同则回放响应（响应体未保存时
+   返回409，请求不会再次执行），摘要不同返回422，尚未完成返回409。
+
+请求体需要完整读入内存计算摘要，因此上传文件（multipart）和 NDJSON 流式请求
+携带幂等键时返回400，请求体超过 IDEMPOTENCY_MAX_REQUEST_BYTES 时返回413。
+
+幂等键记录使用独立会话，不影响业务请求的事务。过期记录可定期清理：
+python -m utils.idempotency purge
+"""
+import hashlib
+import logging
+from datetime import timedelta
+from typing import Optional
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, Response
+from config import settings
+from database import AsyncSessionLocal
+from models.idempotency import IdempotencyKey
+from utils.auth import decode_token_cached
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 100
+# 不能整体读入内存的流式请求体
+STREAMED_CONTENT_TYPES = ("multipart/", "application/x-ndjson")
+# 4xx 中需要保存用于重放的状态码（冲突、校验失败），其余 4xx 不保存
+STORED_CLIENT_ERRORS = {409, 422}
+
+def _stored_status(status_code: int) -> bool:
+    return status_code < 400 or status_code in STORED_CLIENT_ERRORS
+
+def _expired_before():
+    return func.now() - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+
+def _username(headers: Headers) -> Optional[str]:
+    # 未认证的请求不做幂等处理，交由路由返回401
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return decode_token_cached(token).get("sub")
+    except Exception:
+        return None
+
+def _request_hash(scope, body: bytes) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"{scope['method']} {scope['path']}?".encode())
+    digest.update(scope.get("query_string", b""))
+    digest.update(b"\n")
+    digest.update(body)
+    return digest.hexdigest()
+
+async def _claim(username: str, key: str, request_hash: str) -> bool:
+    """占用幂等键，键不存在或已过期时返回 True"""
+    stmt = insert(IdempotencyKey).values(username=username, key=key, request_hash=request_hash)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[IdempotencyKey.username, IdempotencyKey.key],
+        set_={
+            "request_hash": stmt.excluded.request_hash,
+            "status_code": None,
+            "content_type": None,
+            "response_body": None,
+            "created_at": func.now(),
+        },
+        where=IdempotencyKey.created_at < _expired_before(),
+    ).returning(IdempotencyKey.id)
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(stmt)
+        claimed = result.first() is not None
+        await session.commit()
+    return claimed
+
+async def _load(username: str, key: str):
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(
+                IdempotencyKey.request_hash, IdempotencyKey.status_code,
+                IdempotencyKey.content_type, IdempotencyKey.response_body
+            ).where(IdempotencyKey.username == username, IdempotencyKey.key == key)
+        )
+        return result.first()
+
+async def _complete(
+    username: str, key: str, status_code: int, content_type: Optional[str], body: Optional[bytes]
+) -> None:
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.username == username, IdempotencyKey.key == key)
+            .values(status_code=status_code, content_type=content_type, response_body=body)
+        )
+        await session.commit()
+
+async def _release(username: str, key: str) -> None:
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            delete(IdempotencyKey)
+            .where(IdempotencyKey.username == username, IdempotencyKey.key == key)
+        )
+        await session.commit()
+
+async def purge_expired(db: AsyncSession) -> int:
+    """删除过期的幂等键并提交，返回删除行数"""
+    result = await db.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.created_at < _expired_before())
+    )
+    await db.commit()
+    return result.rowcount
+
+class IdempotencyMiddleware:
+    """带 Idempotency-Key 请求头的 POST 请求按 (用户, 键) 只执行一次"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        key = headers.get(IDEMPOTENCY_KEY_HEADER)
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            response = JSONResponse(
+                {"detail": f"幂等键长度应为1-{MAX_KEY_LENGTH}个字符"}, status_code=400
+            )
+            await response(scope, receive, send)
+            return
+
+        username = _username(headers)
+        if username is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_type = headers.get("content-type", "").lower()
+        if content_type.startswith(STREAMED_CONTENT_TYPES):
+            response = JSONResponse({"detail": "上传文件和流式请求不支持幂等键"}, status_code=400)
+            await response(scope, receive, send)
+            return
+        max_request_bytes = settings.IDEMPOTENCY_MAX_REQUEST_BYTES
+        too_large = JSONResponse(
+            {"detail": f"带幂等键的请求体不能超过 {max_request_bytes} 字节"}, status_code=413
+        )
+        content_length = headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > max_request_bytes:
+            await too_large(scope, receive, send)
+            return
+
+        # 读取完整请求体用于计算摘要，之后原样交给路由
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                return
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > max_request_bytes:
+                await too_large(scope, receive, send)
+                return
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+        request_hash = _request_hash(scope, body)
+
+        if not await _claim(username, key, request_hash):
+            await self._reject_or_replay(scope, receive, send, username, key, request_hash)
+            return
+
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        status_code = 500
+        response_type = None
+        response_chunks = []
+        response_size = 0
+        max_response_bytes = settings.IDEMPOTENCY_MAX_RESPONSE_BYTES
+
+        async def capture_send(message):
+            nonlocal status_code, response_type, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                response_type = Headers(raw=message["headers"]).get("content-type")
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                response_size += len(chunk)
+                # 超过上限后不再缓存响应体，只记录状态码
+                if response_size <= max_response_bytes:
+                    response_chunks.append(chunk)
+                else:
+                    response_chunks.clear()
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except BaseException:
+            await _release(username, key)
+            raise
+
+        if not _stored_status(status_code):
+            await _release(username, key)
+        elif response_size > max_response_bytes:
+            logger.warning("响应体超过 %s 字节，幂等键 %s 只记录状态码", max_response_bytes, key)
+            await _complete(username, key, status_code, None, None)
+        else:
+            await _complete(username, key, status_code, response_type, b"".join(response_chunks))
+
+    async def _reject_or_replay(self, scope, receive, send, username, key, request_hash):
+        row = await _load(username, key)
+        if row is None or row.status_code is None:
+            response = JSONResponse({"detail": "相同幂等键的请求正在处理中"}, status_code=409)
+        elif row.request_hash != request_hash:
+            response = JSONResponse({"detail": "幂等键已用于不同的请求"}, status_code=422)
+        elif row.response_body is None:
+            response = JSONResponse(
+                {"detail": f"相同幂等键的请求已完成（状态码 {row.status_code}），响应过大未保存，无法重放"},
+                status_code=409,
+            )
+        else:
+            logger.info("幂等键重放: %s %s", username, key)
+            headers = {REPLAYED_HEADER: "true"}
+            if row.content_type:
+                headers["content-type"] = row.content_type
+            response = Response(row.response_body, status_code=row.status_code, headers=headers)
+        await response(scope, receive, send)
+
+if __name__ == "__main__":
+    # 命令行清理过期幂等键: python -m utils.idempotency purge
+    from utils.cli import run_command
+
+    async def _purge(session) -> str:
+        return f"已删除过期幂等键 {await purge_expired(session)} 条"
+
+    run_command("utils.idempotency", "purge", _purge)
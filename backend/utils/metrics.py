@@ -0,0 +1,231 @@
+import bisect
+import contextvars
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# 默认延迟分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help_text, labels
+        self.values: Dict[tuple, float] = defaultdict(float)
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        self.values[label_values] += amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in self.values.items():
+            yield f"{self.name}{_labels(self.labels, label_values)} {value}"
+
+class Gauge(Counter):
+    def set(self, *label_values, value: float) -> None:
+        self.values[label_values] = value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        for label_values, value in self.values.items():
+            yield f"{self.name}{_labels(self.labels, label_values)} {value}"
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help_text, labels, tuple(buckets)
+        # 每组标签: [各桶计数..., 总和, 总数]
+        self.values: Dict[tuple, list] = {}
+
+    def observe(self, *label_values, value: float) -> None:
+        data = self.values.get(label_values)
+        if data is None:
+            data = self.values[label_values] = [0] * len(self.buckets) + [0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            data[index] += 1
+        data[-2] += value
+        data[-1] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for label_values, data in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                labels = _labels(self.labels + ("le",), label_values + (_format_bound(bound),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _labels(self.labels + ("le",), label_values + ("+Inf",))
+            yield f"{self.name}_bucket{labels} {data[-1]}"
+            yield f"{self.name}_sum{_labels(self.labels, label_values)} {data[-2]}"
+            yield f"{self.name}_count{_labels(self.labels, label_values)} {data[-1]}"
+
+def _format_bound(bound: float) -> str:
+    return str(int(bound)) if float(bound).is_integer() else str(bound)
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+# ---------------------------------------------------------------- 指标定义
+http_requests_total = Counter(
+    "http_requests_total", "HTTP请求总数", ("method", "route", "status"))
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP请求处理时间", ("method", "route"))
+http_requests_in_flight = Gauge(
+    "http_requests_in_flight", "正在处理的HTTP请求数")
+db_queries_total = Counter(
+    "db_queries_total", "SQL语句执行总数")
+db_query_duration = Histogram(
+    "db_query_duration_seconds", "单条SQL执行时间")
+db_queries_per_request = Histogram(
+    "db_queries_per_request", "每个请求执行的SQL条数", ("route",), buckets=COUNT_BUCKETS)
+db_time_per_request = Histogram(
+    "db_time_per_request_seconds", "每个请求的SQL总耗时", ("route",))
+db_pool_checkout_wait = Histogram(
+    "db_pool_checkout_wait_seconds", "从连接池获取连接的等待时间")
+db_pool_status = Gauge(
+    "db_pool_connections", "连接池状态", ("state",))
+
+_REGISTRY = [
+    http_requests_total, http_request_duration, http_requests_in_flight,
+    db_queries_total, db_query_duration, db_queries_per_request, db_time_per_request,
+    db_pool_checkout_wait, db_pool_status,
+]
+
+# ---------------------------------------------------------------- 请求级统计
+class RequestStats:
+    __slots__ = ("query_count", "query_time")
+
+    def __init__(self):
+        self.query_count = 0
+        self.query_time = 0.0
+
+_request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "request_stats", default=None
+)
+
+class MetricsMiddleware:
+    """记录每个路由的延迟、状态码、并发数及请求内SQL次数和耗时"""
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Dict[object, str] = {}
+
+    def _route_of(self, scope) -> str:
+        # 使用路由模板（如 /api/sales/orders/{order_id}）作为标签，避免基数膨胀
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            app = scope.get("app")
+            for route in getattr(app, "routes", []):
+                if getattr(route, "endpoint", None) is endpoint:
+                    path = route.path
+                    break
+            else:
+                path = "unmatched"
+            self._route_paths[endpoint] = path
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        http_requests_in_flight.inc(amount=1)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_flight.inc(amount=-1)
+            _request_stats.reset(token)
+            route = self._route_of(scope)
+            method = scope["method"]
+            http_requests_total.inc(method, route, str(status_code))
+            http_request_duration.observe(method, route, value=elapsed)
+            db_queries_per_request.observe(route, value=stats.query_count)
+            db_time_per_request.observe(route, value=stats.query_time)
+
+# ---------------------------------------------------------------- 数据库
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """记录获取连接等待时间的连接池"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_checkout_wait.observe(value=time.perf_counter() - start)
+
+def instrument_engine(engine) -> None:
+    """在引擎上注册SQL计时事件"""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        db_queries_total.inc()
+        db_query_duration.observe(value=elapsed)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.query_count += 1
+            stats.query_time += elapsed
+        if elapsed * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS:
+            logger.warning("慢查询 %.1fms: %s", elapsed * 1000, statement[:500])
+
+# ---------------------------------------------------------------- 输出
+def render_metrics(pool_status: dict) -> str:
+    """按Prometheus文本格式输出全部指标"""
+    for state in ("checked_in", "checked_out", "overflow"):
+        db_pool_status.set(state, value=pool_status[state])
+    lines = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def route_summary(limit: int = 5) -> list:
+    """按平均延迟排序的最慢路由"""
+    rows = []
+    for (method, route), data in http_request_duration.values.items():
+        if data[-1]:
+            rows.append({
+                "method": method,
+                "route": route,
+                "count": data[-1],
+                "avg_ms": round(data[-2] / data[-1] * 1000, 2),
+            })
+    rows.sort(key=lambda row: row["avg_ms"], reverse=True)
+    return rows[:limit]
+
+def requests_in_flight() -> int:
+    return int(http_requests_in_flight.values.get((), 0))
@@ -0,0 +1,263 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+from fastapi import HTTPException, Response, status
+from sqlalchemy import Boolean, Date, DateTime, Integer, Numeric, String, and_, false, func, or_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+
+# 分页信息通过响应头返回，响应体保持为列表
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+PREV_CURSOR_HEADER = "X-Prev-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+PAGINATION_HEADERS = [NEXT_CURSOR_HEADER, PREV_CURSOR_HEADER, TOTAL_COUNT_HEADER]
+
+# 排序列: (列, 是否降序)
+SortKey = Tuple[Any, bool]
+
+def encode_cursor(key: Any, direction: str) -> str:
+    """生成不透明游标"""
+    raw = json.dumps({"k": key, "d": direction}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _int_key(key: Any) -> int:
+    """键集分页的主键值"""
+    if not isinstance(key, int) or isinstance(key, bool):
+        raise ValueError(key)
+    return key
+
+def decode_cursor(cursor: str, parse_key: Callable[[Any], Any] = _int_key) -> tuple:
+    """解析游标，返回 (键值, 方向)
+
+    parse_key 校验并转换键值，格式不符（如被篡改或来自另一种分页方式）时
+    与其他解析错误一样返回400，而不是带到SQL中出错。
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        direction = data["d"]
+        if direction not in ("next", "prev"):
+            raise ValueError(direction)
+        return parse_key(data["k"]), direction
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的分页游标"
+        )
+
+def _cursor_value(value: Any) -> Any:
+    """排序列的值转换为可写入游标的JSON值"""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+def _parse_value(column, value: Any) -> Any:
+    """按列类型还原游标中的排序列值，类型不符时抛出 ValueError"""
+    if value is None:
+        return None
+    column_type = column.type
+    if isinstance(column_type, Boolean):
+        if not isinstance(value, bool):
+            raise ValueError(value)
+        return value
+    if isinstance(column_type, Integer):
+        return _int_key(value)
+    if not isinstance(value, str):
+        raise ValueError(value)
+    if isinstance(column_type, DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column_type, Date):
+        return date.fromisoformat(value)
+    if isinstance(column_type, Numeric):
+        return Decimal(value)
+    if isinstance(column_type, String):
+        return value
+    raise ValueError(value)
+
+def _sort_key_parser(sort: Sequence[SortKey]) -> Callable[[Any], List[Any]]:
+    def parse(key: Any) -> List[Any]:
+        if not isinstance(key, list) or len(key) != len(sort):
+            raise ValueError(key)
+        return [_parse_value(column, value) for (column, _), value in zip(sort, key)]
+    return parse
+
+def _nullable(column) -> bool:
+    return getattr(column.expression, "nullable", True)
+
+def _after(column, value: Any, descending: bool):
+    """按该列的排序方向严格排在 value 之后（NULL 按 PostgreSQL 默认排序视为最大值）"""
+    if value is None:
+        return column.is_not(None) if descending else false()
+    if descending:
+        return column < value
+    if _nullable(column):
+        return or_(column > value, column.is_(None))
+    return column > value
+
+def _equal(column, value: Any):
+    return column.is_(None) if value is None else column == value
+
+def keyset_condition(sort: Sequence[SortKey], values: Sequence[Any]):
+    """排在 values 之后的行：(a, b, id) 展开为 a 之后 OR (a 相同 AND b 之后) OR (a、b 相同 AND id 之后)
+
+    各列方向相同、不可为空时使用行比较 (a, b, id) > (?, ?, ?)，可以直接利用同序的复合索引。
+    """
+    columns = [column for column, _ in sort]
+    directions = {descending for _, descending in sort}
+    if len(directions) == 1 and None not in values and not any(_nullable(column) for column in columns):
+        row, bound = tuple_(*columns), tuple_(*values)
+        return row < bound if directions.pop() else row > bound
+    return or_(*(
+        and_(
+            *(_equal(column, value) for (column, _), value in zip(sort[:i], values[:i])),
+            _after(column, values[i], descending),
+        )
+        for i, (column, descending) in enumerate(sort)
+    ))
+
+def _with_key(sort: Sequence[SortKey], key_column) -> List[SortKey]:
+    """排序末尾追加主键升序，排序中已有主键时截断到主键为止（之后的列不影响顺序）"""
+    keys = []
+    for column, descending in sort:
+        keys.append((column, descending))
+        if column is key_column:
+            return keys
+    return keys + [(key_column, False)]
+
+async def paginate(
+    db: AsyncSession,
+    stmt,
+    key_column,
+    response: Response,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    with_total: bool = False,
+    mappings: bool = False,
+    sort: Sequence[SortKey] = (),
+) -> List[Any]:
+    """按键列（或 sort 指定的列加键列）分页查询
+
+    传入 cursor 时使用键集分页（WHERE key > ? ORDER BY key），
+    否则在 skip > 0 时退回到兼容的偏移分页。两种方式都按键列排序，
+    下一页/上一页游标写入 X-Next-Cursor / X-Prev-Cursor 响应头，
+    with_total 为真时额外统计总数写入 X-Total-Count。
+    mappings 为真时 stmt 查询的是列（需包含键列），返回 RowMapping 列表。
+
+    指定 sort 时按 (排序列…, 键列) 做键集分页，游标中保存末行各排序列的值，
+    WHERE 条件见 keyset_condition。stmt 未查询的排序列会临时加入查询，
+    返回前去掉（此时返回字典列表）。
+    """
+    limit = max(1, min(limit, settings.PAGINATION_MAX_LIMIT))
+
+    if with_total:
+        total = await db.scalar(
+            select(func.count()).select_from(stmt.order_by(None).subquery())
+        )
+        response.headers[TOTAL_COUNT_HEADER] = str(total)
+
+    keys = _with_key(sort, key_column) if sort else [(key_column, False)]
+    names, hidden = [], []
+    selected = set(stmt.selected_columns.keys()) if mappings else None
+    for i, (column, _) in enumerate(keys):
+        name = column.key
+        if selected is not None and name not in selected:
+            name = f"_sort_{i}"
+            stmt = stmt.add_columns(column.label(name))
+            hidden.append(name)
+        names.append(name)
+
+    direction = "next"
+    order = keys
+    stmt = stmt.order_by(None)
+    if cursor:
+        if sort:
+            values, direction = decode_cursor(cursor, _sort_key_parser(keys))
+        else:
+            key, direction = decode_cursor(cursor)
+            values = [key]
+        if direction == "prev":
+            order = [(column, not descending) for column, descending in keys]
+        stmt = stmt.where(keyset_condition(order, values))
+    elif skip > 0:
+        stmt = stmt.offset(skip)
+    stmt = stmt.order_by(*(column.desc() if descending else column.asc() for column, descending in order))
+
+    # 多取一行用于判断是否还有后续数据
+    rows = await _fetch(db, stmt.limit(limit + 1), mappings)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if direction == "prev":
+        rows.reverse()
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, bool(cursor) or skip > 0
+
+    if rows:
+        def key_of(row):
+            values = [row[name] if mappings else getattr(row, name) for name in names]
+            return [_cursor_value(value) for value in values] if sort else values[0]
+
+        if has_next:
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(key_of(rows[-1]), "next")
+        if has_prev:
+            response.headers[PREV_CURSOR_HEADER] = encode_cursor(key_of(rows[0]), "prev")
+
+    if hidden:
+        rows = [{key: value for key, value in row.items() if key not in hidden} for row in rows]
+    return rows
+
+async def _fetch(db: AsyncSession, stmt, mappings: bool) -> List[Any]:
+    result = await db.execute(stmt)
+    return list(result.mappings().all() if mappings else result.scalars().all())
+
+def _offset_key(key: Any) -> int:
+    offset = _int_key(key["offset"])
+    if offset < 0:
+        raise ValueError(offset)
+    return offset
+
+def _decode_offset_cursor(cursor: str) -> int:
+    offset, _ = decode_cursor(cursor, _offset_key)
+    return offset
+
+async def paginate_offset(
+    db: AsyncSession,
+    stmt,
+    response: Response,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    with_total: bool = False,
+    mappings: bool = False,
+) -> List[Any]:
+    """按查询自带的排序做偏移分页
+
+    用于搜索相关度等无法使用键集分页的排序。游标中保存的是偏移量，
+    与 paginate 一样通过 X-Next-Cursor / X-Prev-Cursor / X-Total-Count 返回。
+    """
+    limit = max(1, min(limit, settings.PAGINATION_MAX_LIMIT))
+
+    if with_total:
+        total = await db.scalar(
+            select(func.count()).select_from(stmt.order_by(None).subquery())
+        )
+        response.headers[TOTAL_COUNT_HEADER] = str(total)
+
+    offset = _decode_offset_cursor(cursor) if cursor else max(skip, 0)
+
+    rows = await _fetch(db, stmt.offset(offset).limit(limit + 1), mappings)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if has_more:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor({"offset": offset + limit}, "next")
+    if offset > 0:
+        response.headers[PREV_CURSOR_HEADER] = encode_cursor({"offset": max(offset - limit, 0)}, "prev")
+
+    return rows
@@ -0,0 +1,29 @@
+import time
+from typing import Hashable, Optional
+from utils.cache import TTLCache
+
+
+class RateLimiter:
+    """固定时间窗口计数限流（进程内）"""
+
+    def __init__(self, limit: int, window_seconds: float, maxsize: int = 100000):
+        self.limit = limit
+        self.window = window_seconds
+        self._windows = TTLCache(maxsize=maxsize, ttl=window_seconds)
+
+    def hit(self, key: Hashable) -> Optional[float]:
+        """记录一次访问，超出限制时返回需等待的秒数，否则返回 None"""
+        now = time.monotonic()
+        entry = self._windows.get(key)
+        if entry is None:
+            self._windows.set(key, (now + self.window, 1))
+            return None
+        window_end, count = entry
+        if count >= self.limit:
+            return max(window_end - now, 0.0)
+        self._windows.set(key, (window_end, count + 1), ttl=window_end - now)
+        return None
+
+    def reset(self, key: Hashable) -> None:
+        """清除计数（如登录成功后）"""
+        self._windows.pop(key)
@@ -0,0 +1,57 @@
+"""列表接口的快速序列化
+
+列表接口直接查询响应模型对应的列（可用 fields= 只取部分列），得到 RowMapping 后由 orjson 一次序列化为
+JSON，不再构造 ORM 对象，也不再逐行 model_validate 后由 FastAPI 按
+response_model 再校验一遍（response_model 仍用于生成接口文档）。
+
+编码规则与 Pydantic 的 JSON 输出一致：Decimal 输出为字符串（保留数据库中的
+小数位），UTC 时间以 Z 结尾，日期和时间为 ISO 8601 格式。
+"""
+from decimal import Decimal
+from typing import Any, Iterable, List, Optional
+import orjson
+from fastapi import HTTPException, Response, status
+from fastapi.responses import JSONResponse
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError(f"无法序列化的类型: {type(obj).__name__}")
+
+def dumps(content: Any) -> bytes:
+    """序列化为JSON字节串"""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_UTC_Z)
+
+class FastJSONResponse(JSONResponse):
+    """使用 orjson 序列化的JSON响应"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def response_columns(model, schema, fields: Optional[str] = None) -> List[Any]:
+    """响应模型各字段对应的模型列，用于 select(*columns)
+
+    fields 为逗号分隔的字段名（如 id,code,name）时只查询这些列，
+    id 总会包含在内（分页游标需要），不属于响应模型的字段返回400。
+    """
+    names = list(schema.model_fields)
+    if fields:
+        requested = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in requested if name not in schema.model_fields]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"不支持的字段: {', '.join(unknown)}"
+            )
+        names = ["id"] + [name for name in dict.fromkeys(requested) if name != "id"]
+    return [getattr(model, name) for name in names]
+
+def rows_response(rows: Iterable, response: Optional[Response] = None) -> FastJSONResponse:
+    """将查询得到的行直接序列化为JSON数组
+
+    response 为路由注入的 Response 时带上其响应头（分页游标、总数等）。
+    """
+    headers = None
+    if response is not None:
+        headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+    return FastJSONResponse([dict(row) for row in rows], headers=headers)
\ No newline at end of file
@@ -0,0 +1,50 @@
+from typing import Optional, Sequence
+from fastapi import HTTPException, status
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# PostgreSQL 唯一约束冲突的 SQLSTATE
+UNIQUE_VIOLATION = "23505"
+
+async def insert_or_none(db: AsyncSession, model, values: dict, index_elements: Sequence) -> Optional[object]:
+    """INSERT ... ON CONFLICT (index_elements) DO NOTHING RETURNING，与该唯一索引冲突时返回 None
+
+    唯一性由数据库索引保证，不再先查询是否存在；并发提交同一编码时只有一个成功。
+    只忽略 index_elements 对应的唯一索引，违反其他唯一约束时仍抛出 IntegrityError。
+    返回的实例已加载全部列（含服务端默认值），无需再 refresh。
+    """
+    stmt = (
+        insert(model).values(**values)
+        .on_conflict_do_nothing(index_elements=list(index_elements))
+        .returning(model)
+    )
+    result = await db.execute(stmt)
+    return result.scalar_one_or_none()
+
+async def insert_unique(db: AsyncSession, model, values: dict, index_elements: Sequence, detail: str):
+    """插入一行，与 index_elements 对应的唯一索引冲突时返回400"""
+    obj = await insert_or_none(db, model, values, index_elements)
+    if obj is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=detail
+        )
+    return obj
+
+async def flush_unique(db: AsyncSession, detail: str) -> None:
+    """flush 挂起的修改，违反唯一索引时回滚并返回400
+
+    修改编号时不先查询新编号是否存在，由唯一索引拒绝重复；并发修改成同一编号
+    时后提交的请求得到400而不是500。
+    """
+    try:
+        await db.flush()
+    except IntegrityError as e:
+        if getattr(e.orig, "sqlstate", None) != UNIQUE_VIOLATION:
+            raise
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=detail
+        )
\ No newline at end of file
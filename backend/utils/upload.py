@@ -0,0 +1,36 @@
+import hashlib
+import os
+import uuid
+from typing import Tuple
+from fastapi import HTTPException, UploadFile, status
+from config import settings
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+async def save_upload(file: UploadFile, subdir: str) -> Tuple[str, str]:
+    """分块保存上传文件到 UPLOAD_DIR/subdir，返回 (文件路径, SHA-1)
+
+    边读边写并累计大小，超过 MAX_FILE_SIZE 时删除已写入部分并返回413，
+    不会把整个文件读入内存。
+    """
+    directory = os.path.join(settings.UPLOAD_DIR, subdir)
+    os.makedirs(directory, exist_ok=True)
+    extension = os.path.splitext(file.filename or "")[1].lower()
+    path = os.path.join(directory, f"{uuid.uuid4().hex}{extension}")
+    digest = hashlib.sha1()
+    size = 0
+    try:
+        with open(path, "wb") as out:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > settings.MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail="文件大小超出限制"
+                    )
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest()
\ No newline at end of file